@@ -0,0 +1,398 @@
+"""Bộ đo hiệu năng cho WPMV (chạy không cửa sổ với nền tảng offscreen).
+
+    python bench.py                               # đo đầy đủ, in bảng kết quả
+    python bench.py --quick --json result.json    # bộ nhỏ, ghi kết quả JSON
+    python bench.py --baseline base.json          # so sánh với kết quả đã lưu
+
+Các file mẫu được tạo một lần trong thư mục tạm (hoặc --fixtures) và dùng lại ở các lần chạy sau.
+"""
+import sys
+import os
+import time
+import json
+import math
+import random
+import struct
+import platform
+import subprocess
+import statistics
+import tempfile
+import argparse
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import Qt, QTimer, QEventLoop, QPoint, QPointF, QRect, QRectF, QT_VERSION_STR
+from PyQt6.QtGui import QImage, QImageReader, QColor, QPainter, QLinearGradient, QWheelEvent
+
+import main
+
+# --- FILE MẪU ---
+FULL_SIZES = {'jpg': [2, 12, 24, 80], 'png': [2, 12, 24], 'webp': [2, 12, 24]}  # Megapixel
+QUICK_SIZES = {'jpg': [2, 12], 'png': [2, 12], 'webp': [2]}
+FULL_FOLDERS = [1000, 10000, 100000]
+QUICK_FOLDERS = [1000, 10000]
+
+def synthetic_image(megapixels, seed):
+    """Ảnh 4:3 có chuyển màu và nhiễu để tỉ lệ nén gần với ảnh chụp thật"""
+    width = int(math.sqrt(megapixels * 1e6 * 4 / 3))
+    height = int(width * 3 / 4)
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+    rng = random.Random(seed)
+    painter = QPainter(image)
+    gradient = QLinearGradient(0, 0, width, height)
+    gradient.setColorAt(0, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    gradient.setColorAt(1, QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    painter.fillRect(0, 0, width, height, gradient)
+    for _ in range(200):
+        painter.setBrush(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256), 160))
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.drawEllipse(QRectF(rng.uniform(0, width), rng.uniform(0, height),
+                                   rng.uniform(20, width / 4), rng.uniform(20, height / 4)))
+    noise = QImage(rng.randbytes(256 * 256), 256, 256, 256, QImage.Format.Format_Grayscale8)
+    painter.setOpacity(0.15)
+    painter.drawTiledPixmap(0, 0, width, height, main.QPixmap.fromImage(noise))
+    painter.end()
+    return image
+
+def write_gif(path, frames, width, height, delay_cs):
+    """Ghi GIF động (Qt không có bộ ghi GIF). Dùng mã LZW 9 bit cố định: phát mã xóa
+    trước khi từ điển đầy để không phải tăng độ dài mã"""
+    def lzw(indices):
+        codes = []
+        for i in range(0, len(indices), 250):
+            codes.append(256)
+            codes.extend(indices[i:i + 250])
+        codes.append(257)
+        bits = int(''.join(format(c, '09b') for c in reversed(codes)), 2)
+        data = bits.to_bytes((len(codes) * 9 + 7) // 8, 'little')
+        return b''.join(bytes([len(data[i:i + 255])]) + data[i:i + 255] for i in range(0, len(data), 255)) + b'\x00'
+
+    palette = b''.join(bytes([(i * 37) % 256, (i * 91) % 256, i]) for i in range(256))
+    with open(path, 'wb') as f:
+        f.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF7, 0, 0) + palette)
+        f.write(b'!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+        for frame in frames:
+            f.write(b'!\xf9\x04\x04' + struct.pack('<H', delay_cs) + b'\x00\x00')
+            f.write(b',' + struct.pack('<HHHHB', 0, 0, width, height, 0) + b'\x08' + lzw(frame))
+        f.write(b';')
+
+def write_svg(path, elements, seed):
+    rng = random.Random(seed)
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="4000" height="3000">']
+    for _ in range(elements):
+        x, y = rng.uniform(0, 4000), rng.uniform(0, 3000)
+        points = " ".join(f"L{x + rng.uniform(-200, 200):.1f},{y + rng.uniform(-200, 200):.1f}" for _ in range(4))
+        parts.append(f'<path d="M{x:.1f},{y:.1f} {points} Z" fill="#{rng.randrange(0xFFFFFF):06x}" '
+                     f'fill-opacity="0.6" stroke="#000" stroke-width="{rng.uniform(0.5, 3):.1f}"/>')
+    parts.append('</svg>')
+    with open(path, 'w', encoding='utf-8') as f: f.write("\n".join(parts))
+
+def make_fixtures(root, quick):
+    """Tạo (nếu chưa có) các file mẫu. Trả về dict tên -> đường dẫn"""
+    fixtures = {}
+    images = os.path.join(root, "images")
+    os.makedirs(images, exist_ok=True)
+    for fmt, sizes in (QUICK_SIZES if quick else FULL_SIZES).items():
+        for mp in sizes:
+            path = os.path.join(images, f"{fmt}_{mp}mp.{fmt}")
+            if not os.path.exists(path):
+                log(f"tạo {os.path.basename(path)}")
+                synthetic_image(mp, mp).save(path + ".tmp", fmt.upper(), 90)
+                os.replace(path + ".tmp", path)
+            fixtures[f"{fmt}_{mp}mp"] = path
+
+    frame_count = 60 if quick else 300
+    gif = os.path.join(images, f"anim_{frame_count}f.gif")
+    if not os.path.exists(gif):
+        log(f"tạo {os.path.basename(gif)}")
+        w, h = 160, 120
+        frames = [[(x + y + n * 4) % 256 for y in range(h) for x in range(w)] for n in range(frame_count)]
+        write_gif(gif + ".tmp", frames, w, h, 4)
+        os.replace(gif + ".tmp", gif)
+    fixtures[f"gif_{frame_count}f"] = gif
+
+    element_count = 5000 if quick else 20000
+    svg = os.path.join(images, f"svg_{element_count}.svg")
+    if not os.path.exists(svg):
+        log(f"tạo {os.path.basename(svg)}")
+        write_svg(svg, element_count, 1)
+    fixtures[f"svg_{element_count}"] = svg
+
+    # Thư mục duyệt tuần tự: nhiều ảnh 2MP khác nhau
+    nav = os.path.join(root, "nav")
+    nav_count = 20 if quick else 60
+    os.makedirs(nav, exist_ok=True)
+    for i in range(nav_count):
+        path = os.path.join(nav, f"img_{i:03d}.jpg")
+        if not os.path.exists(path): synthetic_image(2, 100 + i).save(path, "JPG", 90)
+    fixtures["nav"] = [os.path.join(nav, f"img_{i:03d}.jpg") for i in range(nav_count)]
+
+    # Thư mục nhiều mục (file rỗng: chỉ đo chi phí quét và sắp xếp)
+    for count in (QUICK_FOLDERS if quick else FULL_FOLDERS):
+        folder = os.path.join(root, "folders", str(count))
+        marker = os.path.join(folder, ".done")
+        if not os.path.exists(marker):
+            log(f"tạo thư mục {count} mục")
+            os.makedirs(folder, exist_ok=True)
+            for i in range(count):
+                open(os.path.join(folder, f"photo {i}.jpg"), 'wb').close()
+            open(marker, 'w').close()
+        fixtures[f"folder_{count}"] = os.path.join(folder, "photo 0.jpg")
+    return fixtures
+
+# --- ĐO ---
+def log(text):
+    print(f"[bench] {text}", file=sys.stderr, flush=True)
+
+def wait_until(predicate, timeout=60.0):
+    """Chạy vòng lặp sự kiện cho tới khi predicate() đúng"""
+    deadline = time.perf_counter() + timeout
+    tick = QTimer()
+    tick.start(5)  # Đánh thức vòng lặp để kiểm tra thời hạn
+    while not predicate():
+        if time.perf_counter() > deadline: raise TimeoutError("quá thời gian chờ")
+        QApplication.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+    tick.stop()
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def displayed(window):
+    return window.image_item is not None and window.loading_key is None
+
+def reset_caches(window):
+    window.image_cache.clear()
+    window.tile_loader.cache.clear()
+    window.image_loader.pool.waitForDone()
+    window.tile_loader.pool.waitForDone()
+
+def bench_load(window, fixtures, repeat, results):
+    """Thời gian load_content tới khi ảnh hiển thị xong (bộ đệm trống)"""
+    names = [n for n in fixtures if n != "nav" and not n.startswith("folder_")]
+    for name in names:
+        first_paint, ready = [], []
+        for _ in range(repeat):
+            window.load_content(fixtures["nav"][0])  # Rời khỏi file đang đo
+            wait_until(lambda: displayed(window))
+            reset_caches(window)
+            started = time.perf_counter()
+            window.load_content(fixtures[name])
+            window.prefetch_timer.stop()  # Chỉ đo riêng file này, không giải mã trước file lân cận
+            wait_until(lambda: window.image_item is not None)
+            window.image_view.viewport().repaint()
+            first_paint.append((time.perf_counter() - started) * 1000)
+            wait_until(lambda: displayed(window))
+            window.image_view.viewport().repaint()
+            ready.append((time.perf_counter() - started) * 1000)
+        results[f"load_content.{name}.first_paint"] = metric(statistics.median(first_paint), "ms")
+        results[f"load_content.{name}.ready"] = metric(statistics.median(ready), "ms")
+        log(f"load_content {name}: {statistics.median(ready):.1f} ms")
+
+def bench_navigation(window, fixtures, results):
+    """Duyệt liên tục bằng open_next_file: giữ phím (không chờ) và duyệt có nhịp (giải mã trước kịp chạy)"""
+    files = fixtures["nav"]
+    for mode, pause in (("burst", 0.0), ("paced", 0.25)):
+        window.load_content(files[0])
+        reset_caches(window)
+        wait_until(lambda: displayed(window))
+        latencies = []
+        started_all = time.perf_counter()
+        for _ in files[1:]:
+            if pause:
+                end = time.perf_counter() + pause
+                wait_until(lambda: time.perf_counter() >= end)
+            started = time.perf_counter()
+            window.open_next_file()
+            wait_until(lambda: displayed(window))
+            window.image_view.viewport().repaint()
+            latencies.append((time.perf_counter() - started) * 1000)
+        elapsed = time.perf_counter() - started_all - pause * len(latencies)
+        results[f"open_next_file.{mode}.p50"] = metric(percentile(latencies, 50), "ms")
+        results[f"open_next_file.{mode}.p95"] = metric(percentile(latencies, 95), "ms")
+        results[f"open_next_file.{mode}.throughput"] = metric(len(latencies) / elapsed, "files/s")
+        log(f"open_next_file {mode}: p50 {percentile(latencies, 50):.1f} ms")
+
+def bench_playlist(window, fixtures, repeat, results):
+    """Chi phí update_playlist khi mở một thư mục mới theo số mục trong thư mục"""
+    other = fixtures["nav"][0]
+    for name in sorted((n for n in fixtures if n.startswith("folder_")), key=lambda n: int(n.split("_")[1])):
+        times = []
+        for _ in range(repeat):
+            window.update_playlist(other)
+            started = time.perf_counter()
+            window.update_playlist(fixtures[name])
+            times.append((time.perf_counter() - started) * 1000)
+        results[f"update_playlist.{name}"] = metric(statistics.median(times), "ms")
+        log(f"update_playlist {name}: {statistics.median(times):.1f} ms")
+
+def bench_zoom(window, fixtures, results):
+    """Thời gian mỗi khung hình khi thu phóng bằng bánh xe (gộp theo khung hình, vẽ nhanh)
+    và thời gian vẽ lại chất lượng cao khi dừng"""
+    for name in [n for n in ("jpg_24mp", "jpg_80mp", "jpg_12mp") if n in fixtures][:2]:
+        window.load_content(fixtures[name])
+        wait_until(lambda: displayed(window))
+        view = window.image_view
+        center = QPointF(view.viewport().rect().center())
+        frames = []
+        for i in range(60):
+            delta = 120 if i < 30 else -120
+            event = QWheelEvent(center, QPointF(view.viewport().mapToGlobal(center.toPoint())), QPoint(0, 0),
+                                QPoint(0, delta), Qt.MouseButton.NoButton, Qt.KeyboardModifier.NoModifier,
+                                Qt.ScrollPhase.NoScrollPhase, False)
+            QApplication.sendEvent(view.viewport(), event)
+            started = time.perf_counter()
+            view._zoom_timer.stop()
+            view._apply_zoom()
+            view.viewport().repaint()
+            frames.append((time.perf_counter() - started) * 1000)
+        view._settle_timer.stop()
+        started = time.perf_counter()
+        view.end_interaction()
+        view.viewport().repaint()
+        settle = (time.perf_counter() - started) * 1000
+        results[f"wheel_zoom.{name}.frame_p50"] = metric(percentile(frames, 50), "ms")
+        results[f"wheel_zoom.{name}.frame_p95"] = metric(percentile(frames, 95), "ms")
+        results[f"wheel_zoom.{name}.frame_max"] = metric(max(frames), "ms")
+        results[f"wheel_zoom.{name}.settle"] = metric(settle, "ms")
+        log(f"wheel_zoom {name}: p95 {percentile(frames, 95):.1f} ms")
+
+def bench_tiles(fixtures, results):
+    """Đọc mọi ô của từng mức như khi thu phóng dần vào ảnh lớn: mỗi mức chỉ được đọc file tối đa một lần"""
+    for name in [n for n in ("jpg_12mp", "png_12mp") if n in fixtures]:
+        size = QImageReader(fixtures[name]).size()
+        source = main.RasterTileSource(fixtures[name], size)
+        worst = 0
+        started = time.perf_counter()
+        for level in range(source.max_level, -1, -1):
+            span = main.TILE_SIZE * 2 ** level
+            tiles = [(tx, ty) for ty in range(math.ceil(size.height() / span)) for tx in range(math.ceil(size.width() / span))]
+            wanted = {(source.key, level, tx, ty) for tx, ty in tiles}
+            before = source.decodes
+            for tx, ty in tiles:
+                tile = source.read(level, QRect(tx * span, ty * span, span, span).intersected(QRect(QPoint(0, 0), size)), wanted)
+                assert not tile.isNull(), f"{name}: ô ({level}, {tx}, {ty}) lỗi"
+            worst = max(worst, source.decodes - before)
+        elapsed = (time.perf_counter() - started) * 1000
+        assert worst <= 1, f"{name}: giải mã {worst} lần cho một mức"
+        results[f"tiles.{name}.decodes"] = metric(source.decodes, "lần")
+        results[f"tiles.{name}.time"] = metric(elapsed, "ms")
+        log(f"tiles {name}: {source.decodes} lần giải mã cho {source.max_level + 1} mức, {elapsed:.0f} ms")
+
+def bench_print(fixtures, results):
+    """Bộ nhớ đỉnh khi render_to_printer, đo trong tiến trình riêng để không lẫn với các phép đo khác"""
+    for name in [n for n in ("jpg_12mp", "png_24mp", "jpg_80mp") if n in fixtures]:
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--print-child", fixtures[name]],
+                             capture_output=True, text=True)
+        try:
+            child = json.loads(out.stdout.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            log(f"render_to_printer {name}: lỗi\n{out.stderr}")
+            continue
+        if child.get("peak_mb") is None: continue
+        results[f"render_to_printer.{name}.peak_mb"] = metric(child["peak_mb"], "MB")
+        results[f"render_to_printer.{name}.extra_mb"] = metric(child["extra_mb"], "MB")
+        results[f"render_to_printer.{name}.time"] = metric(child["ms"], "ms")
+        log(f"render_to_printer {name}: đỉnh {child['peak_mb']:.0f} MB (+{child['extra_mb']:.0f} MB)")
+
+def rss_mb():
+    """(RSS hiện tại, RSS đỉnh) tính bằng MB; None nếu hệ điều hành không hỗ trợ"""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    current = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError: pass
+    return current, peak
+
+def print_child(path):
+    app = QApplication(sys.argv[:1])
+    window = main.UniversalViewer()
+    window.show()
+    window.load_content(path)
+    wait_until(lambda: displayed(window))
+    main.load_print_support()
+    printer = main.QPrinter(main.QPrinter.PrinterMode.HighResolution)
+    printer.setOutputFormat(main.QPrinter.OutputFormat.PdfFormat)
+    with tempfile.TemporaryDirectory() as tmp:
+        printer.setOutputFileName(os.path.join(tmp, "out.pdf"))
+        before, _ = rss_mb()
+        started = time.perf_counter()
+        window.render_to_printer(printer)
+        elapsed = (time.perf_counter() - started) * 1000
+        _, peak = rss_mb()
+    print(json.dumps({"peak_mb": peak, "extra_mb": None if peak is None or before is None else peak - before,
+                      "ms": elapsed}))
+
+# --- KẾT QUẢ ---
+def metric(value, unit):
+    return {"value": round(value, 3), "unit": unit}
+
+def compare(results, baseline, threshold):
+    """In bảng so sánh. Trả về danh sách các chỉ số chậm đi quá ngưỡng"""
+    regressions = []
+    print(f"{'chỉ số':<48} {'gốc':>12} {'hiện tại':>12} {'thay đổi':>9}")
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None or not base["value"]:
+            print(f"{name:<48} {'-':>12} {now['value']:>12.2f} {'':>9}")
+            continue
+        change = (now["value"] - base["value"]) / base["value"]
+        worse = -change if now["unit"].endswith("/s") else change  # files/s: càng cao càng tốt
+        flag = " !" if worse > threshold else ""
+        if flag: regressions.append(name)
+        print(f"{name:<48} {base['value']:>12.2f} {now['value']:>12.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="Đo hiệu năng WPMV")
+    parser.add_argument("--quick", action="store_true", help="bộ file mẫu nhỏ, chạy nhanh")
+    parser.add_argument("--repeat", type=int, default=3, help="số lần lặp cho mỗi phép đo (lấy trung vị)")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "wpmv_bench_fixtures"),
+                        help="thư mục chứa file mẫu (tạo một lần, dùng lại)")
+    parser.add_argument("--json", help="ghi kết quả ra file JSON")
+    parser.add_argument("--baseline", help="file JSON kết quả trước đó để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.10, help="ngưỡng coi là chậm đi (mặc định 10%%)")
+    parser.add_argument("--print-child", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    if options.print_child:
+        print_child(options.print_child)
+        return 0
+
+    app = QApplication(sys.argv[:1])
+    fixtures = make_fixtures(options.fixtures, options.quick)
+    window = main.UniversalViewer()
+    window.resize(1100, 800)
+    window.show()
+    results = {}
+    bench_load(window, fixtures, options.repeat, results)
+    bench_navigation(window, fixtures, results)
+    bench_playlist(window, fixtures, options.repeat, results)
+    bench_zoom(window, fixtures, results)
+    bench_tiles(fixtures, results)
+    bench_print(fixtures, results)
+
+    report = {
+        "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "quick": options.quick, "python": platform.python_version(),
+                 "qt": QT_VERSION_STR, "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as f: json.dump(report, f, indent=2, ensure_ascii=False)
+    baseline = {}
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as f: baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, options.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} chỉ số chậm hơn mốc so sánh quá {options.threshold:.0%}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_bench())
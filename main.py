@@ -1,6 +1,24 @@
 import sys
 import os
 import time
+import re
+import math
+import bisect
+import threading
+import hashlib
+import json
+import struct
+import mmap
+import zipfile
+import tarfile
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import compress
+from operator import not_
+
+STARTUP_STARTED = time.perf_counter()  # Mốc đo thời gian tới điểm ảnh đầu tiên
 
 # --- HÀM HỖ TRỢ ĐƯỜNG DẪN KHI ĐÓNG GÓI EXE ---
 def resource_path(relative_path):
@@ -16,33 +34,2647 @@ try:
     from PyQt6.QtWidgets import (QApplication, QMainWindow, QFileDialog, QWidget, QVBoxLayout,
                                  QHBoxLayout, QPushButton, QLabel, QSlider, QStyle, QGraphicsView,
                                  QGraphicsScene, QGraphicsPixmapItem, QStackedWidget, QComboBox,
-                                 QFrame, QDialog)
-    from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
-    from PyQt6.QtMultimediaWidgets import QGraphicsVideoItem
+                                 QFrame, QDialog, QGraphicsObject, QGraphicsItem,
+                                 QStyleOptionGraphicsItem, QListView, QListWidget, QListWidgetItem,
+                                 QDialogButtonBox, QProgressDialog, QDoubleSpinBox, QFormLayout)
     from PyQt6.QtCore import (Qt, QUrl, QTimer, QRectF, QEvent, QStandardPaths,
-                                pyqtSignal, QPoint, QSize, QSizeF)
+                                pyqtSignal, QPoint, QPointF, QSize, QSizeF, QObject, QThreadPool, QRect,
+                                QCoreApplication, QEventLoop, QBuffer, QByteArray,
+                                QFileSystemWatcher, QAbstractListModel, QModelIndex)
     from PyQt6.QtGui import (QPixmap, QPalette, QColor, QWheelEvent, QKeyEvent,
-                             QPainter, QMovie, QKeySequence, QImage, QAction, QIcon)
-    from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
-    # Thêm hỗ trợ SVG
-    from PyQt6.QtSvgWidgets import QGraphicsSvgItem
+                             QPainter, QKeySequence, QImage, QAction, QIcon,
+                             QImageReader, QImageIOHandler, QTransform, QGuiApplication)
 except ImportError:
     # Không dùng print trong --noconsole, nhưng giữ lại phòng trường hợp chạy debug
     sys.exit(1)
 
+# --- ĐO THỜI GIAN / TRUY VẾT ---
+# WPMV_TIMING=1: in từng bước ra stderr. WPMV_TRACE=<file> hoặc --trace [file.json]: ghi Chrome trace-event JSON
+# (mở bằng chrome://tracing hoặc Perfetto). F3 trong ứng dụng: lớp phủ thống kê p50/p95 theo từng giai đoạn.
+TRACE_MAX_EVENTS = 500000
+TRACE_STATS_WINDOW = 200  # Số lần đo gần nhất dùng để tính p50/p95 của mỗi giai đoạn
+
+def file_args(path):
+    """Thông tin file đính kèm vào span: tên, dung lượng, định dạng"""
+    args = {"file": os.path.basename(path), "format": os.path.splitext(path)[1].lower().lstrip('.')}
+    try: args["bytes"] = os.path.getsize(path)
+    except OSError: pass
+    return args
+
+class Tracer:
+    """Ghi các khoảng thời gian (span) trên đường nóng, an toàn khi gọi từ nhiều luồng"""
+    def __init__(self):
+        self.echo = bool(os.environ.get("WPMV_TIMING"))
+        self.output = os.environ.get("WPMV_TRACE") or None
+        self.collect = False  # Giữ thống kê cho lớp phủ dù không ghi file
+        self.events = []
+        self.stats = {}
+        self.exceptions = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.echo or self.collect or self.output is not None
+
+    def record(self, name, started, path=None, **args):
+        """Ghi một span từ mốc started (time.perf_counter) tới hiện tại"""
+        if not self.enabled: return
+        now = time.perf_counter()
+        if path: args = {**file_args(path), **args}
+        with self.lock:
+            samples = self.stats.get(name)
+            if samples is None: samples = self.stats[name] = deque(maxlen=TRACE_STATS_WINDOW)
+            samples.append((now - started) * 1000)
+            if self.output is not None and len(self.events) < TRACE_MAX_EVENTS:
+                self.events.append({"name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                                    "ts": (started - STARTUP_STARTED) * 1e6, "dur": (now - started) * 1e6,
+                                    "args": args})
+        if self.echo and sys.stderr is not None:
+            detail = " ".join(f"{k}={v}" for k, v in args.items() if k not in ("file", "format", "bytes"))
+            print(f"[timing] {name} ({args.get('file', '')}): {(now - started) * 1000:.1f} ms {detail}".rstrip(),
+                  file=sys.stderr, flush=True)
+
+    @contextmanager
+    def span(self, name, path=None, **args):
+        started = time.perf_counter()
+        try: yield
+        finally: self.record(name, started, path, **args)
+
+    def exception(self, where, exc):
+        """Ghi lại lỗi bị bỏ qua (trước đây bị nuốt bởi except: pass)"""
+        with self.lock: self.exceptions += 1
+        if not self.enabled: return
+        with self.lock:
+            if self.output is not None and len(self.events) < TRACE_MAX_EVENTS:
+                self.events.append({"name": "exception", "ph": "i", "s": "t", "pid": os.getpid(),
+                                    "tid": threading.get_ident(), "ts": (time.perf_counter() - STARTUP_STARTED) * 1e6,
+                                    "args": {"where": where, "type": type(exc).__name__, "message": str(exc)}})
+        if self.echo and sys.stderr is not None:
+            print(f"[exception] {where}: {type(exc).__name__}: {exc}", file=sys.stderr, flush=True)
+
+    def summary(self):
+        """[(giai đoạn, số lần, p50, p95)] theo các lần đo gần nhất"""
+        with self.lock: stats = {name: sorted(samples) for name, samples in self.stats.items()}
+        return [(name, len(s), s[len(s) // 2], s[min(len(s) - 1, int(len(s) * 0.95))]) for name, s in sorted(stats.items())]
+
+    def save(self):
+        if self.output is None: return
+        with self.lock: events = list(self.events)
+        try:
+            with open(self.output, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        except OSError as e:
+            if sys.stderr is not None: print(f"Không ghi được trace: {e}", file=sys.stderr)
+
+tracer = Tracer()
+
+# --- NẠP THƯ VIỆN THEO NHU CẦU ---
+# Đa phương tiện, in ấn và SVG chỉ được nạp khi lần đầu mở loại file tương ứng,
+# để mở một ảnh JPEG không phải trả chi phí khởi tạo các thư viện này
+QMediaPlayer = QAudioOutput = QVideoSink = QVideoFrame = QMediaMetaData = QAudioDecoder = QAudioFormat = QGraphicsVideoItem = None
+QPrinter = QPrintDialog = None
+QSvgRenderer = None
+
+def load_multimedia():
+    global QMediaPlayer, QAudioOutput, QVideoSink, QVideoFrame, QMediaMetaData, QAudioDecoder, QAudioFormat, QGraphicsVideoItem
+    if QGraphicsVideoItem is not None: return
+    started = time.perf_counter()
+    from PyQt6.QtMultimedia import (QMediaPlayer, QAudioOutput, QVideoSink, QVideoFrame, QMediaMetaData,
+                                    QAudioDecoder, QAudioFormat)
+    from PyQt6.QtMultimediaWidgets import QGraphicsVideoItem
+    tracer.record("import", started, module="QtMultimedia")
+
+def load_print_support():
+    global QPrinter, QPrintDialog
+    if QPrintDialog is not None: return
+    started = time.perf_counter()
+    from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
+    tracer.record("import", started, module="QtPrintSupport")
+
+def load_svg_support():
+    global QSvgRenderer
+    if QSvgRenderer is not None: return
+    started = time.perf_counter()
+    from PyQt6.QtSvg import QSvgRenderer
+    tracer.record("import", started, module="QtSvg")
+
+# --- ĐỊNH DẠNG FILE (dùng chung cho giao diện và chế độ hàng loạt) ---
+IMAGE_EXTS = {'.png', '.apng', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff', '.svg'}
+VIDEO_EXTS = {'.mp4', '.avi', '.mkv', '.webm', '.mov'}
+AUDIO_EXTS = {'.mp3', '.wav', '.flac', '.m4a'}
+MEDIA_EXTS = VIDEO_EXTS | AUDIO_EXTS
+SUPPORTED_EXTS = IMAGE_EXTS | MEDIA_EXTS | {'.zip', '.cbz', '.tar', '.cbt'}  # Kèm file nén ảnh (xem ARCHIVE_EXTS)
+
+def file_kind(path):
+    """'image', 'video', 'audio' hoặc None nếu định dạng không hỗ trợ"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTS: return 'image'
+    if ext in VIDEO_EXTS: return 'video'
+    if ext in AUDIO_EXTS: return 'audio'
+    return None
+
+# --- ẢNH TRONG FILE NÉN (ZIP / CBZ / TAR) ---
+# Mỗi ảnh trong file nén có đường dẫn ảo "<file nén>::<tên trong file nén>" và được đọc thẳng từ
+# file nén đã ánh xạ bộ nhớ, không giải nén ra đĩa. TAR nén (gz/bz2/xz) không đọc ngẫu nhiên được nên không hỗ trợ.
+ARCHIVE_EXTS = {'.zip', '.cbz', '.tar', '.cbt'}
+ARCHIVE_IMAGE_EXTS = IMAGE_EXTS - {'.svg'}
+ARCHIVE_SEP = "::"
+ARCHIVE_OPEN_LIMIT = 4     # Số file nén giữ mở cùng lúc
+ARCHIVE_PREFETCH_AHEAD = 6  # Đọc truyện: giải mã trước nhiều trang hơn file thường
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, ValueError)  # File nén hỏng (ValueError: mmap file rỗng)
+ARCHIVE_DATA_BUDGET = 64 * 1024 * 1024  # Dữ liệu (đã giải nén) của các trang vừa đọc, dùng lại cho các lần đọc sau
+
+def is_archive(path):
+    return os.path.splitext(path)[1].lower() in ARCHIVE_EXTS and ARCHIVE_SEP not in path
+
+def split_archive_path(path):
+    """(file nén, tên trong file nén) nếu path trỏ vào bên trong file nén, ngược lại None"""
+    archive, sep, member = path.partition(ARCHIVE_SEP)
+    if not sep or os.path.splitext(archive)[1].lower() not in ARCHIVE_EXTS: return None
+    return archive, member.replace(os.sep, '/')
+
+def archive_member_path(archive, member):
+    return f"{archive}{ARCHIVE_SEP}{member}"
+
+def normalize_path(path):
+    inner = split_archive_path(path)
+    return archive_member_path(os.path.normpath(inner[0]), inner[1]) if inner else os.path.normpath(path)
+
+def container_of(path):
+    """Thư mục chứa file, hoặc file nén chứa ảnh"""
+    inner = split_archive_path(path)
+    return inner[0] if inner else os.path.dirname(path)
+
+class ArchiveHandle:
+    """Một file nén ánh xạ bộ nhớ. Danh sách thành viên lấy từ mục lục (central directory của ZIP,
+    các header của TAR) mà không đọc dữ liệu; dữ liệu không nén được cắt thẳng từ vùng nhớ ánh xạ."""
+    def __init__(self, path, mtime):
+        self.mtime = mtime
+        self.lock = threading.Lock()
+        self.users = 0         # Số lần đang đọc (ArchiveCache.using); chỉ đóng khi về 0
+        self.retired = False   # Đã bị loại khỏi ArchiveCache
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if os.path.splitext(path)[1].lower() in ('.zip', '.cbz'):
+                self.zip = zipfile.ZipFile(self.file)  # Mục nén đọc qua file (mmap không seekable trước Python 3.13)
+                self.entries = {i.filename: i for i in self.zip.infolist() if not i.is_dir()}
+            else:
+                self.zip = None
+                with tarfile.open(fileobj=self.map, mode='r:') as tar:
+                    self.entries = {m.name: (m.offset_data, m.size) for m in tar.getmembers() if m.isfile()}
+        except Exception:
+            self.file.close()
+            raise
+
+    def read(self, member):
+        entry = self.entries.get(member)
+        if entry is None: return None
+        if self.zip is None:
+            offset, size = entry
+            return self.map[offset:offset + size]
+        if entry.compress_type == zipfile.ZIP_STORED and not entry.flag_bits & 0x1:
+            # Header cục bộ: 30 byte cố định + tên + trường mở rộng, ngay sau đó là dữ liệu
+            header = entry.header_offset
+            start = header + 30 + int.from_bytes(self.map[header + 26:header + 28], 'little') \
+                + int.from_bytes(self.map[header + 28:header + 30], 'little')
+            return self.map[start:start + entry.file_size]
+        with self.lock:
+            return self.zip.read(entry)
+
+    def close(self):
+        if self.file.closed: return
+        if self.zip is not None: self.zip.close()
+        self.map.close()
+        self.file.close()
+
+class ArchiveCache:
+    """Các file nén đang mở, dùng chung cho giao diện và các luồng giải mã"""
+    def __init__(self, limit=ARCHIVE_OPEN_LIMIT, data_budget=ARCHIVE_DATA_BUDGET):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.handles = OrderedDict()  # đường dẫn -> ArchiveHandle
+        # Một trang được đọc nhiều lần (kiểm tra ảnh động, kích thước, giải mã, từng ô/dải khi in):
+        # chỉ giải nén một lần, giữ theo LRU giới hạn bởi tổng số byte
+        self.data = OrderedDict()     # (đường dẫn ảo, mtime file nén) -> bytes
+        self.data_budget = data_budget
+        self.data_used = 0
+
+    def handle(self, archive):
+        """Handle hiện hành của file nén; chỉ dùng entries/mtime. Đọc dữ liệu phải qua using()"""
+        with self.using(archive) as handle:
+            return handle
+
+    @contextmanager
+    def using(self, archive):
+        """Giữ handle mở trong suốt khối with, kể cả khi nó bị loại khỏi cache bởi luồng khác"""
+        mtime = os.stat(archive).st_mtime_ns
+        with self.lock:
+            handle = self.handles.get(archive)
+            if handle is not None and handle.mtime == mtime:
+                self.handles.move_to_end(archive)
+            else:
+                if handle is not None: self._retire(self.handles.pop(archive))  # File nén đã thay đổi
+                started = time.perf_counter()
+                handle = self.handles[archive] = ArchiveHandle(archive, mtime)
+                tracer.record("archive-open", started, archive, entries=len(handle.entries))
+                while len(self.handles) > self.limit:
+                    self._retire(self.handles.popitem(last=False)[1])
+            handle.users += 1
+        try:
+            yield handle
+        finally:
+            with self.lock:
+                handle.users -= 1
+                if handle.retired and handle.users == 0: handle.close()
+
+    def _retire(self, handle):
+        handle.retired = True
+        if handle.users == 0: handle.close()
+
+    def members(self, archive):
+        """Tên các ảnh trong file nén (rỗng nếu không đọc được)"""
+        try: entries = self.handle(archive).entries
+        except Exception as e:
+            tracer.exception("archive_members", e)
+            return []
+        return [name for name in entries if os.path.splitext(name)[1].lower() in ARCHIVE_IMAGE_EXTS]
+
+    def read(self, path):
+        archive, member = split_archive_path(path)
+        try:
+            with self.using(archive) as handle:
+                key = (path, handle.mtime)
+                with self.lock:
+                    data = self.data.get(key)
+                    if data is not None:
+                        self.data.move_to_end(key)
+                        return data
+                data = handle.read(member)
+        except Exception as e:
+            tracer.exception("archive_read", e)
+            return None
+        if data is not None and len(data) <= self.data_budget:
+            with self.lock:
+                if key not in self.data:
+                    self.data[key] = data
+                    self.data_used += len(data)
+                    while self.data_used > self.data_budget:
+                        self.data_used -= len(self.data.popitem(last=False)[1])
+        return data
+
+    def mtime(self, path):
+        archive, member = split_archive_path(path)
+        handle = self.handle(archive)
+        if member not in handle.entries: raise FileNotFoundError(path)
+        return handle.mtime
+
+    def size(self, path):
+        """Dung lượng (chưa nén) của một ảnh trong file nén"""
+        archive, member = split_archive_path(path)
+        entry = self.handle(archive).entries.get(member)
+        if entry is None: raise FileNotFoundError(path)
+        return entry.file_size if isinstance(entry, zipfile.ZipInfo) else entry[1]
+
+archives = ArchiveCache()
+
+def image_reader(path):
+    """QImageReader cho file ảnh thường, hoặc cho ảnh trong file nén (giải mã từ bộ nhớ, không tạo file tạm)"""
+    if split_archive_path(path) is None: return QImageReader(path)
+    buffer = QBuffer()
+    buffer.setData(QByteArray(archives.read(path) or b''))
+    buffer.open(QBuffer.OpenModeFlag.ReadOnly)
+    reader = QImageReader(buffer, os.path.splitext(path)[1].lstrip('.').lower().encode())
+    reader.buffer = buffer  # Giữ QBuffer sống cùng reader
+    return reader
+
+def archive_cover(archive):
+    """Đường dẫn ảo của trang đầu tiên (theo thứ tự tự nhiên) trong file nén, None nếu không có ảnh"""
+    members = archives.members(archive)
+    return archive_member_path(archive, min(members, key=lambda m: natural_key(archive_member_path(archive, m)))) if members else None
+
+def path_exists(path):
+    if split_archive_path(path) is None: return os.path.exists(path)
+    try:
+        archives.mtime(path)
+        return True
+    except OSError:
+        return False
+    except ARCHIVE_ERRORS as e:
+        tracer.exception("archive_open", e)
+        return False
+
+# --- BỘ NHỚ ĐỆM ẢNH ĐÃ GIẢI MÃ ---
+IMAGE_CACHE_BUDGET = 512 * 1024 * 1024  # Giới hạn dung lượng (byte) cho ảnh đã giải mã
+PREFETCH_AHEAD = 3   # Số file giải mã trước ở phía sau file hiện tại
+PREFETCH_BEHIND = 1  # Số file giải mã trước ở phía trước file hiện tại
+RASTER_EXTS = {'.png', '.jpg', '.jpeg', '.bmp', '.webp', '.tif', '.tiff'}
+
+def file_key(path):
+    """Khóa nhận diện một phiên bản của file: (đường dẫn chuẩn hóa, mtime, kích thước).
+    Ảnh trong file nén dùng mtime của file nén, kích thước 0 (file nén ghi lại thì mtime đã đổi)"""
+    try:
+        if split_archive_path(path) is not None: return (path, archives.mtime(path), 0)
+        st = os.stat(path)
+        return (os.path.normpath(path), st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+    except ARCHIVE_ERRORS as e:
+        tracer.exception("file_key", e)
+        return None
+
+def is_huge_image(size):
+    """Ảnh quá lớn để giải mã một lần, cần hiển thị theo từng ô"""
+    return size.width() * size.height() >= TILED_MIN_PIXELS
+
+def display_ready(image):
+    """Chuyển QImage sang định dạng vẽ nhanh"""
+    fmt = QImage.Format.Format_ARGB32_Premultiplied if image.hasAlphaChannel() else QImage.Format.Format_RGB32
+    return image if image.format() == fmt else image.convertToFormat(fmt)
+
+def decode_key(path, target=None):
+    """Khóa bộ đệm cho một lần giải mã: phiên bản file + kích thước đích (0, 0 = đầy đủ) ở hai phần tử cuối"""
+    key = file_key(path)
+    if key is None: return None
+    return key + ((target.width(), target.height()) if target else (0, 0))
+
+def decode_image(path, target=None):
+    """Giải mã ảnh thành QImage ở định dạng vẽ nhanh (an toàn khi gọi từ luồng phụ).
+    Nếu có target, ảnh được giải mã thu nhỏ vừa khung target (JPEG dùng giải mã rút gọn DCT)."""
+    started = time.perf_counter()
+    reader = image_reader(path)
+    size = reader.size()
+    # Ảnh siêu lớn chỉ giải mã được khi định dạng hỗ trợ giải mã thu nhỏ trực tiếp (JPEG)
+    if is_huge_image(size) and not (target and reader.supportsOption(QImageIOHandler.ImageOption.ScaledSize)):
+        return QImage()
+    mode, out = "full", size
+    if target and size.isValid() and (size.width() > target.width() or size.height() > target.height()):
+        out = size.scaled(target, Qt.AspectRatioMode.KeepAspectRatio)
+        reader.setScaledSize(out)
+        mode = "fit"
+    image = reader.read()
+    if not image.isNull(): image = display_ready(image)
+    tracer.record("decode", started, path, mode=mode, size=f"{out.width()}x{out.height()}", ok=not image.isNull())
+    return image
+
+def read_exif_tiff(path, max_bytes=128 * 1024):
+    """Trả về khối TIFF của đoạn EXIF (APP1) trong JPEG, chỉ đọc phần đầu file"""
+    try:
+        if split_archive_path(path) is not None: head = (archives.read(path) or b'')[:max_bytes]
+        else:
+            with open(path, 'rb') as f:
+                head = f.read(max_bytes)
+    except OSError:
+        return None
+    if head[:2] != b'\xff\xd8': return None
+    pos = 2
+    while pos + 4 <= len(head) and head[pos] == 0xFF:
+        marker = head[pos + 1]
+        length = int.from_bytes(head[pos + 2:pos + 4], 'big')
+        if marker == 0xE1 and head[pos + 4:pos + 10] == b'Exif\x00\x00':
+            return head[pos + 10:pos + 2 + length]
+        if marker in (0xDA, 0xD9): break  # Bắt đầu dữ liệu ảnh: không còn EXIF
+        pos += 2 + length
+    return None
+
+def exif_ifd(tiff, offset):
+    """Đọc một IFD của EXIF: trả về ({tag: giá trị số hoặc offset}, offset IFD kế tiếp)"""
+    order = 'little' if tiff[:2] == b'II' else 'big'
+    if offset <= 0 or offset + 2 > len(tiff): return {}, 0
+    count = int.from_bytes(tiff[offset:offset + 2], order)
+    entries = {}
+    for i in range(count):
+        e = offset + 2 + i * 12
+        if e + 12 > len(tiff): break
+        tag = int.from_bytes(tiff[e:e + 2], order)
+        typ = int.from_bytes(tiff[e + 2:e + 4], order)
+        if typ == 3:  # SHORT
+            entries[tag] = int.from_bytes(tiff[e + 8:e + 10], order)
+        else:         # LONG hoặc offset tới dữ liệu
+            entries[tag] = int.from_bytes(tiff[e + 8:e + 12], order)
+    nxt = offset + 2 + count * 12
+    next_offset = int.from_bytes(tiff[nxt:nxt + 4], order) if nxt + 4 <= len(tiff) else 0
+    return entries, next_offset
+
+def read_exif_thumbnail(path):
+    """Ảnh thumbnail JPEG nhúng trong IFD1 của EXIF (nếu có)"""
+    tiff = read_exif_tiff(path)
+    if not tiff or len(tiff) < 8: return QImage()
+    order = 'little' if tiff[:2] == b'II' else 'big'
+    _, ifd1 = exif_ifd(tiff, int.from_bytes(tiff[4:8], order))
+    entries, _ = exif_ifd(tiff, ifd1)
+    start, length = entries.get(0x0201, 0), entries.get(0x0202, 0)
+    if not start or not length or start + length > len(tiff): return QImage()
+    return QImage.fromData(tiff[start:start + length], "JPG")
+
+def read_exif_info(path):
+    """Hướng xoay (Orientation, 1-8) và ngày chụp ('YYYY:MM:DD HH:MM:SS' hoặc None) trong EXIF"""
+    tiff = read_exif_tiff(path)
+    if not tiff or len(tiff) < 8: return 1, None
+    order = 'little' if tiff[:2] == b'II' else 'big'
+    ifd0, _ = exif_ifd(tiff, int.from_bytes(tiff[4:8], order))
+    sub, _ = exif_ifd(tiff, ifd0.get(0x8769, 0))
+    taken = None
+    # DateTimeOriginal, DateTimeDigitized trong Exif IFD; DateTime của IFD0 là phương án cuối
+    for offset in (sub.get(0x9003), sub.get(0x9004), ifd0.get(0x0132)):
+        text = tiff[offset:offset + 19].decode('ascii', 'replace') if offset else ""
+        if re.fullmatch(r'\d{4}:\d\d:\d\d \d\d:\d\d:\d\d', text) and not text.startswith('0000'):
+            taken = text
+            break
+    orientation = ifd0.get(0x0112, 1)
+    return orientation if 1 <= orientation <= 8 else 1, taken
+
+def decode_preview(path, target, scaled=True):
+    """Ảnh xem trước thật nhanh: thumbnail EXIF, hoặc (scaled) giải mã JPEG rút gọn 1/8.
+    Giải mã 1/8 vẫn tốn gần bằng giải mã vừa khung (phần lớn là giải mã entropy) nên chỉ đáng chạy song song với nó"""
+    started = time.perf_counter()
+    image = read_exif_thumbnail(path)
+    if image.isNull():
+        if not scaled: return image
+        reader = image_reader(path)
+        size = reader.size()
+        # Chỉ đáng làm khi định dạng hỗ trợ giải mã thu nhỏ và ảnh lớn hơn nhiều so với khung
+        if not reader.supportsOption(QImageIOHandler.ImageOption.ScaledSize) or not size.isValid(): return QImage()
+        if size.width() < target.width() * 2 and size.height() < target.height() * 2: return QImage()
+        reader.setScaledSize(QSize(max(1, size.width() // 8), max(1, size.height() // 8)))
+        image = reader.read()
+        if image.isNull(): return image
+    tracer.record("decode-preview", started, path, size=f"{image.width()}x{image.height()}")
+    return display_ready(image)
+
+class ImageCache:
+    """Bộ nhớ đệm QImage theo LRU, giới hạn bởi tổng số byte"""
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.used = 0
+        self._items = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        image = self._items.get(key)
+        if image is not None: self._items.move_to_end(key)
+        return image
+
+    def put(self, key, image):
+        if key is None or image.isNull(): return
+        size = image.sizeInBytes()
+        if size > self.budget: return
+        if key in self._items: self.used -= self._items.pop(key).sizeInBytes()
+        self._items[key] = image
+        self.used += size
+        while self.used > self.budget:
+            _, old = self._items.popitem(last=False)
+            self.used -= old.sizeInBytes()
+
+    def clear(self):
+        self._items.clear()
+        self.used = 0
+
+PRIORITY_CURRENT = 10   # File người dùng đang mở
+PRIORITY_UPGRADE = 5    # Ảnh gốc khi phóng to
+PRIORITY_PREFETCH = 0   # File lân cận
+
+class ImageLoader(QObject):
+    """Giải mã ảnh bằng thread pool: file đang mở (có ảnh xem trước, hủy được khi chuyển file),
+    ảnh gốc khi phóng to, và giải mã trước các file lân cận trong playlist"""
+    previewed = pyqtSignal(object, QImage)
+    decoded = pyqtSignal(object, QImage)
+    svg_loaded = pyqtSignal(object, object)
+
+    def __init__(self, cache, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() - 1))
+        self.pending = set()
+        self.wanted = set()
+        self.required = set()  # Các yêu cầu trực tiếp, không bị hủy khi đổi danh sách giải mã trước
+        self.current = None    # Yêu cầu của file đang mở; yêu cầu cũ bị bỏ qua nếu chưa chạy
+        # pending và các tập yêu cầu dùng chung với luồng giải mã: việc bỏ qua một yêu cầu không còn cần
+        # và việc yêu cầu lại chính nó phải loại trừ nhau, nếu không yêu cầu mới có thể bị nuốt mất
+        self.lock = threading.Lock()
+        self.decoded.connect(self._store)
+
+    def load(self, path, target=None):
+        key = decode_key(path, target)
+        with self.lock: self.current = key
+        if key is None: return None
+        if target and self.parallel_preview() and key not in self.cache:
+            # Ảnh xem trước chạy song song với giải mã vừa khung, không đứng trước nó trong cùng một luồng
+            self.pool.start(lambda: self._preview(key, True), PRIORITY_CURRENT + 1)
+        self._start(key, PRIORITY_CURRENT)
+        return key
+
+    def parallel_preview(self):
+        return self.pool.maxThreadCount() > 1
+
+    def load_svg(self, path):
+        # Phân tích SVG (có thể rất nặng) ở luồng nền
+        key = file_key(path)
+        if key is None: return None
+        load_svg_support()
+        key = key + ('svg',)
+        with self.lock: self.current = key
+        self.pool.start(lambda: self._parse_svg(key), PRIORITY_CURRENT)
+        return key
+
+    def _parse_svg(self, key):
+        source = None
+        if key == self.current:
+            started = time.perf_counter()
+            source = SvgTileSource(key[0])
+            tracer.record("parse-svg", started, key[0])
+        self.svg_loaded.emit(key, source)
+
+    def prefetch(self, paths, target=None):
+        keys = [k for k in (decode_key(p, target) for p in paths) if k is not None]
+        with self.lock: self.wanted = set(keys)
+        for key in keys: self._start(key, PRIORITY_PREFETCH)
+
+    def request(self, path, target=None):
+        key = decode_key(path, target)
+        if key is None: return None
+        with self.lock: self.required.add(key)
+        self._start(key, PRIORITY_UPGRADE)
+        return key
+
+    def _start(self, key, priority):
+        with self.lock:
+            if key in self.cache or key in self.pending: return
+            self.pending.add(key)
+        self.pool.start(lambda: self._decode(key), priority)
+
+    def _is_wanted(self, key):
+        return key == self.current or key in self.wanted or key in self.required
+
+    def _decode(self, key):
+        # Bỏ qua nếu người dùng đã chuyển đi chỗ khác trước khi tới lượt giải mã; việc bỏ qua không phải lỗi
+        # nên không báo qua decoded
+        with self.lock:
+            if not self._is_wanted(key):
+                self.pending.discard(key)
+                return
+        target = QSize(key[-2], key[-1]) if key[-2] else None
+        if key == self.current and target and not self.parallel_preview():
+            self._preview(key, False)  # Chỉ một luồng: chỉ dùng thumbnail EXIF (gần như không tốn gì)
+        self.decoded.emit(key, decode_image(key[0], target))
+
+    def _preview(self, key, scaled):
+        if key != self.current: return
+        preview = decode_preview(key[0], QSize(key[-2], key[-1]), scaled)
+        if not preview.isNull() and key == self.current: self.previewed.emit(key, preview)
+
+    def _store(self, key, image):
+        self.cache.put(key, image)
+        with self.lock:
+            self.pending.discard(key)
+            self.required.discard(key)
+
+# --- HIỂN THỊ THEO Ô CHO ẢNH SIÊU LỚN ---
+TILE_SIZE = 512
+TILE_CACHE_BUDGET = 256 * 1024 * 1024
+TILED_MIN_PIXELS = 8192 * 8192  # Vượt giới hạn cấp phát mặc định 256 MB của QImageReader
+TILE_PYRAMID_BUDGET = 64 * 1024 * 1024  # Các mức thu nhỏ (cả mức) giữ lại cho mỗi ảnh lớn, dùng chung cho mọi ô
+
+_allocation_lock = threading.Lock()
+
+def read_beyond_limit(reader, size):
+    """Giải mã ảnh vượt giới hạn cấp phát của QImageReader; giới hạn (dùng chung cả tiến trình) được khôi phục ngay sau đó"""
+    needed_mb = size.width() * size.height() * 4 // (1024 * 1024) + 1
+    with _allocation_lock:
+        limit = QImageReader.allocationLimit()
+        if 0 < limit < needed_mb: QImageReader.setAllocationLimit(needed_mb)
+        try: return reader.read()
+        finally: QImageReader.setAllocationLimit(limit)
+
+class RasterTileSource:
+    """Đọc một vùng ảnh ở mức thu nhỏ 2^level (an toàn khi gọi từ nhiều luồng).
+    Mức nào vừa TILE_PYRAMID_BUDGET được giải mã một lần thành cả mức (JPEG thu nhỏ ngay khi giải mã) và mọi ô
+    của mức đó được cắt từ ảnh này. Mức chi tiết hơn được giải mã theo lô: một lần đọc cho mọi ô đang cần (wanted);
+    JPEG chỉ đọc vùng bao của các ô đó, các định dạng khác phải giải mã cả ảnh tạm thời và tiện giữ lại các mức thô."""
+    def __init__(self, path, size):
+        self.path = path
+        self.key = file_key(path)
+        self.size = size
+        self.max_level = max(0, math.ceil(math.log2(max(size.width(), size.height(), 1) / TILE_SIZE)))
+        reader = image_reader(path)
+        self.native = (reader.supportsOption(QImageIOHandler.ImageOption.ClipRect)
+                       and reader.supportsOption(QImageIOHandler.ImageOption.ScaledSize))
+        self._levels = OrderedDict()  # level -> ảnh cả mức (LRU trong TILE_PYRAMID_BUDGET)
+        self._spare = {}              # (level, tx, ty) -> ô cắt sẵn từ lô giải mã gần nhất
+        self.decodes = 0              # Số lần đọc file, để đo hiệu năng
+        self._lock = threading.Lock()
+
+    def _level_size(self, level):
+        scale = 2 ** level
+        return QSize(max(1, math.ceil(self.size.width() / scale)), max(1, math.ceil(self.size.height() / scale)))
+
+    def read(self, level, rect, wanted=()):
+        scale = 2 ** level
+        out_size = QSize(max(1, math.ceil(rect.width() / scale)), max(1, math.ceil(rect.height() / scale)))
+        span = TILE_SIZE * scale
+        tile = (level, rect.x() // span, rect.y() // span)
+        with self._lock:
+            image = self._levels.get(level)
+            if image is None and tile not in self._spare:
+                size = self._level_size(level)
+                if size.width() * size.height() * 4 <= TILE_PYRAMID_BUDGET and self.native:
+                    image = self._decode_level(level)
+                else:
+                    tiles = {key[2:] for key in wanted if key[0] == self.key and key[1] == level} | {tile[1:]}
+                    if self.native: self._decode_region(level, tiles)
+                    else: self._decode_full(level, tiles)
+                    image = self._levels.get(level)
+            if image is None: return self._spare.pop(tile, QImage())
+            self._levels.move_to_end(level)
+        src = QRect(rect.x() // scale, rect.y() // scale, out_size.width(), out_size.height())
+        return image.copy(src.intersected(image.rect()))
+
+    def _keep(self, level, image):
+        # Giữ ảnh cả mức, bỏ các mức dùng lâu nhất khi vượt ngân sách (không bỏ mức vừa thêm)
+        self._levels[level] = image
+        used = sum(kept.sizeInBytes() for kept in self._levels.values())
+        while used > TILE_PYRAMID_BUDGET and len(self._levels) > 1:
+            _, dropped = self._levels.popitem(last=False)
+            used -= dropped.sizeInBytes()
+
+    def _cut(self, level, image, origin, tiles):
+        # Cắt các ô (tx, ty) của mức level từ ảnh có góc trên trái ở ô origin
+        self._spare = {}
+        for tx, ty in tiles:
+            part = QRect((tx - origin[0]) * TILE_SIZE, (ty - origin[1]) * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+            part = part.intersected(image.rect())
+            if not part.isEmpty(): self._spare[(level, tx, ty)] = display_ready(image.copy(part))
+
+    def _decode_level(self, level):
+        # JPEG: một lần đọc thu nhỏ thẳng về kích thước của mức
+        reader = image_reader(self.path)
+        reader.setScaledSize(self._level_size(level))
+        self.decodes += 1
+        image = reader.read()
+        if image.isNull(): return None
+        image = display_ready(image)
+        self._keep(level, image)
+        return image
+
+    def _decode_region(self, level, tiles):
+        # JPEG: một lần đọc vùng bao của các ô đang cần, thu nhỏ về mức level rồi cắt thành ô
+        x0, y0 = min(t[0] for t in tiles), min(t[1] for t in tiles)
+        x1, y1 = max(t[0] for t in tiles), max(t[1] for t in tiles)
+        scale = 2 ** level
+        span = TILE_SIZE * scale
+        region = QRect(x0 * span, y0 * span, (x1 - x0 + 1) * span, (y1 - y0 + 1) * span)
+        region = region.intersected(QRect(QPoint(0, 0), self.size))
+        if region.isEmpty(): return
+        reader = image_reader(self.path)
+        reader.setClipRect(region)
+        reader.setScaledSize(QSize(max(1, math.ceil(region.width() / scale)), max(1, math.ceil(region.height() / scale))))
+        self.decodes += 1
+        image = reader.read()
+        if not image.isNull(): self._cut(level, image, (x0, y0), tiles)
+
+    def _decode_full(self, level, tiles):
+        # Định dạng không giải mã được theo vùng: giải mã cả ảnh một lần, thu nhỏ dần tới max_level,
+        # giữ các mức thô vừa ngân sách và cắt sẵn các ô đang cần nếu mức level quá lớn để giữ
+        image = read_beyond_limit(image_reader(self.path), self.size)
+        self.decodes += 1
+        chain = []
+        while not image.isNull():
+            chain.append(image)
+            if len(chain) > self.max_level: break
+            image = image.scaled(max(1, image.width() // 2), max(1, image.height() // 2),
+                                 Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        used = 0
+        for lvl in range(len(chain) - 1, -1, -1):
+            used += chain[lvl].sizeInBytes()
+            if used > TILE_PYRAMID_BUDGET: break
+            if lvl not in self._levels: self._keep(lvl, display_ready(chain[lvl]))
+        if level not in self._levels and level < len(chain): self._cut(level, chain[level], (0, 0), tiles)
+
+SVG_MIN_LEVEL = -4  # SVG được raster hóa tới tối đa 16 lần kích thước gốc
+
+class SvgTileSource:
+    """Raster hóa một vùng SVG ở tỉ lệ 2^-level. Việc phân tích file nên chạy ở luồng nền;
+    QSvgRenderer được dùng tuần tự qua khóa vì không an toàn khi vẽ đồng thời."""
+    def __init__(self, path):
+        self.path = path
+        self.key = (file_key(path) or (path, 0)) + ('svg',)
+        self.renderer = QSvgRenderer(path)
+        self.renderer.moveToThread(QCoreApplication.instance().thread())
+        view_box = self.renderer.viewBoxF()
+        size = self.renderer.defaultSize()
+        if size.isEmpty(): size = view_box.size().toSize()
+        self.size = size
+        self.valid = self.renderer.isValid() and not size.isEmpty()
+        self._lock = threading.Lock()
+
+    def read(self, level, rect, wanted=()):
+        scale = 2.0 ** -level
+        out_size = QSize(max(1, math.ceil(rect.width() * scale)), max(1, math.ceil(rect.height() * scale)))
+        image = QImage(out_size, QImage.Format.Format_ARGB32_Premultiplied)
+        image.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setClipRect(QRect(QPoint(0, 0), out_size))
+        painter.scale(scale, scale)
+        painter.translate(-rect.x(), -rect.y())
+        with self._lock:
+            self.renderer.render(painter, QRectF(0, 0, float(self.size.width()), float(self.size.height())))
+        painter.end()
+        return image
+
+class TileLoader(QObject):
+    """Giải mã các ô ảnh ở luồng nền, lưu vào bộ đệm LRU có giới hạn"""
+    tileReady = pyqtSignal(object)
+    _decoded = pyqtSignal(object, QImage)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache = ImageCache(TILE_CACHE_BUDGET)
+        self.pool = QThreadPool(self)
+        self.pending = set()
+        self.wanted = set()
+        self._decoded.connect(self._store)
+
+    def request(self, source, key, level, rect):
+        if key in self.pending or key in self.cache: return
+        self.pending.add(key)
+        self.pool.start(lambda: self._decode(source, key, level, rect))
+
+    def cancel(self):
+        self.pool.clear()
+        self.pending.clear()
+        self.wanted = set()
+
+    def _decode(self, source, key, level, rect):
+        # Ô đã ra khỏi khung nhìn trước khi tới lượt thì bỏ qua
+        if key not in self.wanted:
+            self._decoded.emit(key, QImage())
+            return
+        with tracer.span("decode-tile", source.path, level=level):
+            image = source.read(level, rect, self.wanted.copy())
+        self._decoded.emit(key, image)
+
+    def _store(self, key, image):
+        self.pending.discard(key)
+        if image.isNull(): return
+        self.cache.put(key, image)
+        self.tileReady.emit(key)
+
+class TiledImageItem(QGraphicsObject):
+    """Item vẽ ảnh theo ô và theo mức thu phóng hiện tại, chỉ giải mã phần đang nhìn thấy.
+    Trong lúc kéo/thu phóng chỉ vẽ lại các ô đã có; ô mới được yêu cầu khi người dùng dừng lại."""
+    def __init__(self, source, loader, min_level=0, parent=None):
+        super().__init__(parent)
+        self.source = source
+        self.loader = loader
+        self.min_level = min_level
+        self._level = None
+        self._rect = QRectF(0, 0, float(source.size.width()), float(source.size.height()))
+        longest = max(source.size.width(), source.size.height())
+        self.max_level = max(0, math.ceil(math.log2(longest / TILE_SIZE)))
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+        loader.tileReady.connect(self._tile_ready)
+        # Ô thô nhất luôn có sẵn để làm nền khi các ô chi tiết chưa giải mã xong
+        self.loader.wanted.add(self._key(self.max_level, 0, 0))
+        self._request(self.max_level, 0, 0)
+
+    def boundingRect(self):
+        return self._rect
+
+    def _key(self, level, tx, ty):
+        return (self.source.key, level, tx, ty)
+
+    def _tile_rect(self, level, tx, ty):
+        span = TILE_SIZE * (2 ** level)
+        return QRectF(tx * span, ty * span, span, span).intersected(self._rect)
+
+    def _tiles(self, level, rect):
+        span = TILE_SIZE * (2 ** level)
+        rect = rect.intersected(self._rect)
+        if rect.isEmpty(): return []
+        x0, y0 = int(rect.left() // span), int(rect.top() // span)
+        x1, y1 = int(math.ceil(rect.right() / span)), int(math.ceil(rect.bottom() / span))
+        return [(tx, ty) for ty in range(y0, y1) for tx in range(x0, x1)]
+
+    def _request(self, level, tx, ty):
+        self.loader.request(self.source, self._key(level, tx, ty), level, self._tile_rect(level, tx, ty).toAlignedRect())
+
+    def level_for(self, lod):
+        if lod <= 0: return self.max_level
+        return max(self.min_level, min(self.max_level, int(math.floor(math.log2(1.0 / lod)))))
+
+    def paint(self, painter, option, widget=None):
+        view = widget.parentWidget() if widget is not None else None
+        interacting = getattr(view, 'interacting', False)
+        if not interacting or self._level is None:
+            self._level = self.level_for(QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform()))
+        level = self._level
+        if not interacting:
+            visible = option.exposedRect
+            if widget is not None:
+                inverse, ok = painter.worldTransform().inverted()
+                if ok: visible = inverse.mapRect(QRectF(widget.rect()))
+            tiles = self._tiles(level, visible)
+            self.loader.wanted = {self._key(level, tx, ty) for tx, ty in tiles}
+            self.loader.wanted.add(self._key(self.max_level, 0, 0))
+            for tx, ty in tiles:
+                if self._key(level, tx, ty) not in self.loader.cache: self._request(level, tx, ty)
+
+        exposed = option.exposedRect
+        # Vẽ lớp thô trước làm nền, sau đó phủ các ô đúng mức chi tiết
+        for lvl in range(self.max_level, level - 1, -1):
+            for tx, ty in self._tiles(lvl, exposed):
+                image = self.loader.cache.get(self._key(lvl, tx, ty))
+                if image is not None:
+                    painter.drawImage(self._tile_rect(lvl, tx, ty), image)
+
+    def _tile_ready(self, key):
+        if key[0] == self.source.key:
+            self.update(self._tile_rect(*key[1:]))
+
+# --- ẢNH ĐỘNG (GIF / APNG / WEBP) ---
+ANIM_BUFFER_BUDGET = 128 * 1024 * 1024
+ANIMATED_EXTS = {'.gif', '.webp', '.png', '.apng'}
+
+def is_animated(path):
+    """File có nhiều khung hình và Qt có plugin giải mã ảnh động cho định dạng này"""
+    if os.path.splitext(path)[1].lower() not in ANIMATED_EXTS: return False
+    reader = image_reader(path)
+    return reader.supportsAnimation() and reader.imageCount() != 1
+
+class FrameDecoder:
+    """Luồng giải mã trước các khung hình ảnh động.
+    Nếu mọi khung hình vừa ngân sách bộ nhớ thì giữ lại hết để các vòng lặp sau dùng lại,
+    ngược lại giải mã liên tục vào bộ đệm vòng có giới hạn."""
+    def __init__(self, path, budget):
+        self.path = path
+        reader = image_reader(path)
+        self.size = reader.size()
+        frame_bytes = max(1, self.size.width() * self.size.height() * 4)
+        count = reader.imageCount()
+        loops = reader.loopCount()  # -1: lặp vô hạn
+        self.passes = loops + 1 if loops >= 0 else None
+        self.keep_all = count > 0 and count * frame_bytes <= budget
+        self.capacity = max(3, budget // frame_bytes)
+        self.frames = []      # keep_all: toàn bộ (ảnh, thời gian hiển thị ms)
+        self.ring = deque()   # chế độ vòng: các khung hình sắp hiển thị
+        self.done = False
+        self.error = False
+        self._stop = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        passes = 0
+        while not self._stop:
+            reader = image_reader(self.path)
+            decoded = 0
+            while not self._stop:
+                image = reader.read()
+                if image.isNull(): break
+                delay = reader.nextImageDelay()
+                frame = (display_ready(image), delay if delay > 0 else 100)
+                decoded += 1
+                with self._cond:
+                    if self.keep_all:
+                        self.frames.append(frame)
+                    else:
+                        while len(self.ring) >= self.capacity and not self._stop:
+                            self._cond.wait()
+                        self.ring.append(frame)
+            passes += 1
+            if decoded == 0: self.error = True
+            if decoded == 0 or self.keep_all or (self.passes is not None and passes >= self.passes): break
+        with self._cond:
+            self.done = True
+
+    def take(self):
+        with self._cond:
+            if not self.ring: return None
+            frame = self.ring.popleft()
+            self._cond.notify_all()
+            return frame
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+class AnimatedImageItem(QGraphicsObject):
+    """Item ảnh động vẽ trực tiếp trong scene (chịu được thu phóng/xoay/lật như ảnh tĩnh)"""
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.decoder = FrameDecoder(path, ANIM_BUFFER_BUDGET)
+        self._rect = QRectF(0, 0, float(self.decoder.size.width()), float(self.decoder.size.height()))
+        self.current = None
+        self.index = 0
+        self.loops_done = 0
+        self.finished = False
+        self._due = 0.0
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self._advance)
+
+    def boundingRect(self):
+        return self._rect
+
+    def start(self):
+        self._due = time.perf_counter()
+        self._advance()
+
+    def stop(self):
+        self.timer.stop()
+        self.decoder.stop()
+
+    def _next_frame(self):
+        d = self.decoder
+        if not d.keep_all:
+            frame = d.take()
+            if frame is None and d.done: self.finished = True
+            return frame
+        if self.index < len(d.frames):
+            self.index += 1
+            return d.frames[self.index - 1]
+        if not d.done or not d.frames:
+            self.finished = d.done
+            return None
+        # Hết một vòng: dùng lại các khung hình đã giải mã
+        self.loops_done += 1
+        if d.passes is not None and self.loops_done >= d.passes:
+            self.finished = True
+            return None
+        self.index = 1
+        return d.frames[0]
+
+    def _advance(self):
+        frame = self._next_frame()
+        now = time.perf_counter()
+        if frame is None:
+            if not self.finished: self.timer.start(5)  # Khung hình chưa giải mã kịp
+            return
+        image, delay = frame
+        self.current = image
+        self.update()
+        # Hẹn giờ theo mốc tuyệt đối để sai số không cộng dồn; nếu đã trễ quá thì bắt nhịp lại
+        self._due = max(self._due + delay / 1000.0, now)
+        self.timer.start(max(0, int((self._due - now) * 1000)))
+
+    def paint(self, painter, option, widget=None):
+        if self.current is not None:
+            painter.drawImage(self._rect, self.current)
+
+# --- CHỈ MỤC THƯ MỤC (PLAYLIST) ---
+NATURAL_KEY_CACHE = 1 << 18  # Số khóa tên được nhớ: mỗi đường dẫn chỉ tách bằng regex một lần
+
+@lru_cache(maxsize=NATURAL_KEY_CACHE)
+def natural_key(path):
+    """Khóa sắp xếp tự nhiên theo tên file: 'img2' đứng trước 'img10'. Ảnh trong file nén xếp theo cả
+    đường dẫn bên trong (các chương/thư mục con giữ nguyên thứ tự)"""
+    inner = split_archive_path(path) if ARCHIVE_SEP in path else None
+    name = inner[1] if inner else os.path.basename(path)
+    parts = re.split(r'(\d+)', name.lower())
+    return ([int(p) if p.isdigit() else p for p in parts], name)
+
+class FolderIndex(QObject):
+    """Danh sách file hỗ trợ trong một thư mục, quét một lần và cập nhật theo QFileSystemWatcher"""
+    changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.folder = None
+        self.archive = False  # folder là một file nén
+        self.version = 0      # Tăng khi tập file thay đổi (mở thư mục khác, thêm/xóa file), không tăng khi chỉ đổi thứ tự
+        self.files = []   # Đường dẫn đã lọc và sắp xếp (mặc định: tự nhiên theo tên)
+        self._keys = []   # Khóa sắp xếp song song với self.files (dùng cho bisect)
+        self._names = set()
+        self._paths = None  # Bộ đệm của paths(), bỏ khi tập file thay đổi
+        self.sort_key = natural_key  # Hàm khóa sắp xếp theo đường dẫn
+        self.accept = None           # Hàm lọc theo đường dẫn (None: nhận tất cả)
+        self._pos = None  # path -> vị trí, dựng lại khi danh sách thay đổi
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self._schedule_sync)
+        self._sync_timer = QTimer(self)
+        self._sync_timer.setSingleShot(True)
+        self._sync_timer.setInterval(150)
+        self._sync_timer.timeout.connect(self.sync)
+
+    def open(self, folder):
+        """Mở một thư mục, hoặc một file nén (playlist là các ảnh bên trong, không theo dõi thay đổi)"""
+        folder = os.path.normpath(folder)
+        if folder == self.folder: return
+        if self.folder and not self.archive: self.watcher.removePath(self.folder)
+        self.folder = folder
+        self.version += 1
+        self._paths = None
+        self.archive = is_archive(folder)
+        if self.archive:
+            self._names = set(archives.members(folder))
+        else:
+            self._names = self._scan()
+            self.watcher.addPath(folder)
+        self.resort(force=True)
+
+    def _path(self, name):
+        return archive_member_path(self.folder, name) if self.archive else os.path.join(self.folder, name)
+
+    def contains(self, path):
+        # Có trong thư mục (kể cả khi đang bị lọc khỏi playlist)
+        inner = split_archive_path(path)
+        folder, name = inner if inner else (os.path.dirname(path), os.path.basename(path))
+        return folder == self.folder and name in self._names
+
+    def paths(self):
+        """Mọi file hỗ trợ trong thư mục, kể cả các file đang bị lọc bỏ (danh sách dùng chung, không được sửa)"""
+        if self._paths is None: self._paths = [self._path(n) for n in self._names] if self.folder else []
+        return self._paths
+
+    def set_order(self, sort_key=None, accept=None):
+        self.sort_key = sort_key or natural_key
+        self.accept = accept
+        self.resort()
+
+    def resort(self, force=False):
+        # Sắp xếp/lọc lại toàn bộ khi đổi chế độ hoặc khi có thêm thông tin file để sắp xếp
+        paths = self.paths()
+        if self.accept is not None: paths = [p for p in paths if self.accept(p)]
+        keys = list(map(self.sort_key, paths))
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = list(map(keys.__getitem__, order))
+        files = list(map(paths.__getitem__, order))
+        if files == self.files and not force: return
+        self.files[:] = files
+        self._pos = None
+        self.changed.emit()
+
+    def _scan(self):
+        started = time.perf_counter()
+        with os.scandir(self.folder) as it:
+            names = {e.name for e in it
+                     if os.path.splitext(e.name)[1].lower() in SUPPORTED_EXTS and e.is_file()}
+        tracer.record("scan", started, folder=self.folder, entries=len(names))
+        return names
+
+    def _schedule_sync(self, _path):
+        self._sync_timer.start()
+
+    def sync(self):
+        # Chỉ áp dụng phần chênh lệch (thêm/xóa) thay vì sắp xếp lại toàn bộ
+        if not self.folder or self.archive: return
+        try: names = self._scan()
+        except OSError as e:
+            tracer.exception("folder_sync", e)
+            names = set()
+        removed, added = self._names - names, names - self._names
+        if not removed and not added: return
+        gone = [self.index_of(self._path(name)) for name in removed]
+        for idx in sorted((i for i in gone if i is not None), reverse=True):
+            del self.files[idx]; del self._keys[idx]
+        for name in added:
+            path = self._path(name)
+            if self.accept is not None and not self.accept(path): continue
+            key = self.sort_key(path)
+            idx = bisect.bisect_left(self._keys, key)
+            self._keys.insert(idx, key)
+            self.files.insert(idx, path)
+        self._names = names
+        self.version += 1
+        self._paths = None
+        self._pos = None
+        self.changed.emit()
+
+    def update(self, paths):
+        """Đặt lại vị trí (và lọc lại) các file vừa có thêm thông tin sắp xếp. Phần còn lại giữ nguyên thứ tự
+        nên Timsort chỉ phải trộn các file mới vào: O(n) thay vì sắp xếp lại toàn bộ với khóa tính lại từ đầu"""
+        changed = {p for p in paths if self.contains(p)}
+        if not changed: return
+        # Các bước trên cả danh sách đều chạy trong C (map/compress/sort), không lặp bằng Python
+        keep = list(map(not_, map(changed.__contains__, self.files)))
+        files = list(compress(self.files, keep))
+        keys = list(compress(self._keys, keep))
+        added = [p for p in changed if self.accept is None or self.accept(p)]
+        files += added
+        keys += map(self.sort_key, added)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = list(map(keys.__getitem__, order))
+        self.files[:] = map(files.__getitem__, order)
+        self._pos = None
+        self.changed.emit()
+
+    def index_of(self, path):
+        if self._pos is None:
+            self._pos = {p: i for i, p in enumerate(self.files)}
+        return self._pos.get(path)
+
+    def neighbor(self, path, step):
+        """File cách path step vị trí; bỏ qua các file nén (chỉ vào trong khi được mở trực tiếp)"""
+        if not self.files: return None
+        idx = self.index_of(path)
+        if idx is None:
+            # File hiện tại đã bị xóa/đổi tên/lọc bỏ: dùng vị trí chèn theo thứ tự hiện tại
+            idx = bisect.bisect_left(self._keys, self.sort_key(path))
+            if step > 0: step -= 1
+        direction = 1 if step >= 0 else -1
+        for _ in range(len(self.files)):
+            candidate = self.files[(idx + step) % len(self.files)]
+            if not is_archive(candidate): return candidate
+            step += direction
+        return None
+
+# --- CHỈ MỤC THÔNG TIN FILE (SẮP XẾP / LỌC PLAYLIST) ---
+METADATA_BATCH = 256          # Số file mỗi lần gửi kết quả từ luồng nền về
+METADATA_PROBE_TIMEOUT_MS = 5000
+METADATA_RESORT_DELAY_MS = 300
+METADATA_RESORT_DUTY = 8  # Khoảng chờ giữa các lần sắp xếp lại >= 8 lần thời gian sắp xếp: giao diện bị chặn tối đa ~1/8
+
+FileMeta = namedtuple("FileMeta", "mtime size width height format orientation taken duration")
+
+def metadata_db_path():
+    base = os.environ.get("XDG_CACHE_HOME") or QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.GenericCacheLocation)
+    return os.path.join(base, "wpmv", "metadata.sqlite")
+
+def file_version(path):
+    """(mtime, dung lượng) để biết file đã thay đổi chưa; ảnh trong file nén dùng mtime của file nén"""
+    if split_archive_path(path) is None:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    return archives.mtime(path), archives.size(path)
+
+def probe_image_header(path, version):
+    """Kích thước, định dạng, hướng xoay và ngày chụp của ảnh (kể cả ảnh trong file nén),
+    chỉ đọc phần đầu file (không giải mã điểm ảnh)"""
+    reader = image_reader(path)
+    size = reader.size()
+    orientation, taken = read_exif_info(path)
+    return FileMeta(*version, max(0, size.width()), max(0, size.height()),
+                    bytes(reader.format()).decode('ascii', 'replace'), orientation, taken, 0)
+
+def display_dimensions(meta):
+    # Orientation 5-8: ảnh được xoay 90°, chiều ngang/dọc đổi chỗ khi hiển thị
+    return (meta.height, meta.width) if meta.orientation >= 5 else (meta.width, meta.height)
+
+SORT_MODES = ["Tên", "Ngày chụp", "Ngày sửa", "Độ phân giải", "Thời lượng", "Dung lượng"]
+FILTER_MODES = ["Tất cả", "Ảnh", "Video", "Audio", "Ảnh ngang", "Ảnh dọc"]
+
+class MetadataIndex(QObject):
+    """Thông tin từng file trong thư mục (kích thước ảnh, EXIF, thời lượng media) để sắp xếp và lọc playlist.
+    Ảnh chỉ đọc phần đầu file ở luồng nền; media được mở lần lượt bằng trình phát phụ không âm thanh.
+    Kết quả lưu trong SQLite theo (đường dẫn, mtime, dung lượng) nên lần mở thư mục sau gần như tức thì."""
+    updated = pyqtSignal()
+    _probed = pyqtSignal(int, object)        # (thế hệ, [(đường dẫn, FileMeta)])
+    _media_needed = pyqtSignal(int, object)  # (thế hệ, [(đường dẫn, (mtime, dung lượng))])
+    _checked = pyqtSignal(int, object)       # (thế hệ, các file đã xong, trừ media còn chờ đọc)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.db = None
+        self.folder = None
+        self.rows = {}       # path -> FileMeta
+        self.queued = set()  # Các file đang chờ đọc thông tin
+        self.changed = set() # Các file có thông tin mới từ lần updated trước (None: cả thư mục)
+        self.generation = 0  # Tăng khi đổi thư mục; kết quả của thư mục cũ bị bỏ qua
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)  # Chủ yếu chờ đĩa: một luồng để không tranh với giải mã ảnh
+        self.media_queue = deque()
+        self.probe = None
+        self.probe_item = None
+        self.probe_timer = QTimer(self)
+        self.probe_timer.setSingleShot(True)
+        self.probe_timer.setInterval(METADATA_PROBE_TIMEOUT_MS)
+        self.probe_timer.timeout.connect(self._probe_done)
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(METADATA_RESORT_DELAY_MS)
+        self.update_timer.timeout.connect(self.updated)
+        self._probed.connect(self._store)
+        self._media_needed.connect(self._queue_media)
+        self._checked.connect(self._unqueue)
+
+    def _connect(self):
+        if self.db is None:
+            import sqlite3
+            path = metadata_db_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (path TEXT PRIMARY KEY, folder TEXT NOT NULL, "
+                            "mtime INTEGER, size INTEGER, width INTEGER, height INTEGER, format TEXT, "
+                            "orientation INTEGER, taken TEXT, duration INTEGER)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS meta_folder ON meta (folder)")
+        return self.db
+
+    def get(self, path):
+        return self.rows.get(path)
+
+    def open(self, folder, paths):
+        """Nạp thông tin đã lưu của thư mục rồi đọc nền các file mới hoặc đã thay đổi"""
+        folder = os.path.normpath(folder)
+        fresh = folder != self.folder
+        if fresh:
+            started = time.perf_counter()
+            self.generation += 1
+            self.folder = folder
+            self.queued = set()
+            self.media_queue.clear()
+            try:
+                cursor = self._connect().execute(
+                    "SELECT path, mtime, size, width, height, format, orientation, taken, duration "
+                    "FROM meta WHERE folder = ?", (folder,))
+                self.rows = {row[0]: FileMeta(*row[1:]) for row in cursor}
+            except Exception as e:
+                tracer.exception("metadata_open", e)
+                self.rows = {}
+            tracer.record("metadata-load", started, folder=folder, entries=len(self.rows))
+            self._forget(set(self.rows) - set(paths))
+            self.changed = None
+            self.updated.emit()
+        # Luôn so lại (mtime, dung lượng) với dòng đã có: file bị ghi đè khi thư mục đang mở cũng được đọc lại
+        known = {p: (m.mtime, m.size) for p, m in self.rows.items()}
+        todo = [p for p in paths if fresh or p not in self.queued]
+        if not todo: return
+        self.queued.update(todo)
+        generation = self.generation
+        self.pool.start(lambda: self._check(generation, todo, known))
+
+    def _forget(self, paths):
+        # Bỏ các dòng của file đã bị xóa khỏi thư mục
+        if not paths: return
+        for path in paths: del self.rows[path]
+        try:
+            with self._connect() as db: db.executemany("DELETE FROM meta WHERE path = ?", [(p,) for p in paths])
+        except Exception as e: tracer.exception("metadata_forget", e)
+
+    def _check(self, generation, paths, known):
+        # Luồng nền: stat từng file, chỉ đọc lại phần đầu những file chưa có hoặc đã thay đổi
+        rows, media = [], []
+        for path in paths:
+            if generation != self.generation: return
+            try: version = file_version(path)
+            except OSError: continue
+            except ARCHIVE_ERRORS as e:
+                tracer.exception("metadata_check", e)
+                continue
+            if known.get(path) == version: continue
+            kind = file_kind(path)
+            if kind == 'image':
+                rows.append((path, probe_image_header(path, version)))
+            elif kind is not None:
+                media.append((path, version))
+            if len(rows) >= METADATA_BATCH:
+                self._probed.emit(generation, rows)
+                rows = []
+        self._probed.emit(generation, rows)
+        if media: self._media_needed.emit(generation, media)
+        self._checked.emit(generation, set(paths).difference(path for path, _ in media))
+
+    def _unqueue(self, generation, paths):
+        # Cả các file không đổi: lần open sau của cùng thư mục phải kiểm tra lại chúng
+        if generation == self.generation: self.queued.difference_update(paths)
+
+    def _store(self, generation, rows):
+        if generation != self.generation: return
+        for path, _ in rows:
+            self.queued.discard(path)
+        if not rows: return
+        self.rows.update(rows)
+        if self.changed is not None: self.changed.update(path for path, _ in rows)
+        try:
+            with self._connect() as db:
+                db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               [(path, self.folder) + tuple(meta) for path, meta in rows])
+        except Exception as e: tracer.exception("metadata_store", e)
+        self.update_timer.start()
+
+    def _queue_media(self, generation, items):
+        if generation != self.generation: return
+        self.media_queue.extend((generation, path, version) for path, version in items)
+        if self.probe_item is None: self._probe_next()
+
+    def _probe_next(self):
+        if not self.media_queue: return
+        if self.probe is None:
+            load_multimedia()
+            self.probe = QMediaPlayer(self)  # Không gắn đầu ra âm thanh/hình: chỉ đọc thông tin
+            self.probe.mediaStatusChanged.connect(self._probe_status)
+        self.probe_item = self.media_queue.popleft()
+        self.probe.setSource(QUrl.fromLocalFile(self.probe_item[1]))
+        self.probe_timer.start()
+
+    def _probe_status(self, status):
+        if status in (QMediaPlayer.MediaStatus.LoadedMedia, QMediaPlayer.MediaStatus.InvalidMedia):
+            self._probe_done()
+
+    def _probe_done(self):
+        self.probe_timer.stop()
+        if self.probe_item is None: return
+        generation, path, version = self.probe_item
+        self.probe_item = None
+        width = height = 0
+        metadata = self.probe.metaData()
+        resolution = metadata.value(QMediaMetaData.Key.Resolution) if metadata is not None else None
+        if resolution is not None and resolution.isValid(): width, height = resolution.width(), resolution.height()
+        meta = FileMeta(*version, width, height,
+                        os.path.splitext(path)[1].lower().lstrip('.'), 1, None, max(0, self.probe.duration()))
+        self.probe.setSource(QUrl())
+        self._store(generation, [(path, meta)])
+        QTimer.singleShot(0, self._probe_next)
+
+    def take_changed(self):
+        """Các file có thông tin mới kể từ lần gọi trước; None nếu cả thư mục vừa được nạp lại"""
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def sort_key(self, mode):
+        """Hàm khóa sắp xếp theo chế độ; file chưa có thông tin xếp sau cùng theo tên"""
+        if mode == "Tên": return natural_key
+        def key(path):
+            meta = self.rows.get(path)
+            if meta is None: return (1, 0, natural_key(path))
+            if mode == "Ngày chụp":
+                value = meta.taken or time.strftime("%Y:%m:%d %H:%M:%S", time.localtime(meta.mtime / 1e9))
+            elif mode == "Ngày sửa": value = meta.mtime
+            elif mode == "Độ phân giải": value = meta.width * meta.height
+            elif mode == "Thời lượng": value = meta.duration
+            else: value = meta.size
+            return (0, value, natural_key(path))
+        return key
+
+    def accept(self, mode):
+        """Hàm lọc theo chế độ (None: nhận tất cả)"""
+        if mode == "Tất cả": return None
+        kinds = {"Ảnh": 'image', "Video": 'video', "Audio": 'audio'}
+        if mode in kinds: return lambda path: file_kind(path) == kinds[mode]
+        def accept(path):
+            meta = self.rows.get(path)
+            if meta is None or file_kind(path) != 'image': return False
+            width, height = display_dimensions(meta)
+            return width >= height if mode == "Ảnh ngang" else height > width
+        return accept
+
+    @staticmethod
+    def needs_metadata(sort_mode, filter_mode):
+        return sort_mode != "Tên" or filter_mode in ("Ảnh ngang", "Ảnh dọc")
+
+# --- ẢNH THU NHỎ (DẢI ẢNH / LƯỚI) ---
+THUMB_SIZE = 256  # Thư mục "large" theo chuẩn thumbnail của freedesktop
+THUMB_MEMORY_BUDGET = 64 * 1024 * 1024
+THUMB_FAIL_DIR = os.path.join("fail", "wpmv")
+
+def thumbnail_path(path, kind="large"):
+    """Đường dẫn thumbnail theo chuẩn freedesktop: <cache>/thumbnails/<kind>/<md5(URI)>.png"""
+    base = os.environ.get("XDG_CACHE_HOME") or QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.GenericCacheLocation)
+    uri = bytes(QUrl.fromLocalFile(os.path.abspath(path)).toEncoded())
+    return os.path.join(base, "thumbnails", kind, hashlib.md5(uri).hexdigest() + ".png")
+
+def load_cached_thumbnail(path):
+    """Đọc thumbnail trên đĩa nếu còn khớp mtime/kích thước file gốc. Trả về (ảnh, đã_từng_lỗi)"""
+    st = os.stat(path)
+    for kind in ("large", THUMB_FAIL_DIR):
+        thumb = QImage(thumbnail_path(path, kind))
+        if (not thumb.isNull() and thumb.text("Thumb::MTime") == str(int(st.st_mtime))
+                and thumb.text("Thumb::Size") in ("", str(st.st_size))):
+            return (QImage(), True) if kind == THUMB_FAIL_DIR else (thumb, False)
+    return QImage(), False
+
+def save_thumbnail(path, image):
+    """Ghi thumbnail (hoặc đánh dấu lỗi nếu ảnh rỗng) kèm Thumb::URI/MTime/Size"""
+    try:
+        st = os.stat(path)
+        failed = image.isNull()
+        if failed:
+            image = QImage(1, 1, QImage.Format.Format_ARGB32)
+            image.fill(Qt.GlobalColor.transparent)
+        else:
+            image = image.copy()
+        image.setText("Thumb::URI", QUrl.fromLocalFile(os.path.abspath(path)).toString())
+        image.setText("Thumb::MTime", str(int(st.st_mtime)))
+        image.setText("Thumb::Size", str(st.st_size))
+        target = thumbnail_path(path, THUMB_FAIL_DIR if failed else "large")
+        os.makedirs(os.path.dirname(target), mode=0o700, exist_ok=True)
+        # Ghi ra file tạm rồi đổi tên để tiến trình khác không đọc phải file dở dang
+        tmp = f"{target}.wpmv-{os.getpid()}-{threading.get_ident()}.png"
+        if image.save(tmp, "PNG"):
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, target)
+    except OSError as e: tracer.exception("save_thumbnail", e)
+
+def scale_thumbnail(image):
+    if image.isNull() or max(image.width(), image.height()) <= THUMB_SIZE: return image
+    return image.scaled(THUMB_SIZE, THUMB_SIZE, Qt.AspectRatioMode.KeepAspectRatio,
+                        Qt.TransformationMode.SmoothTransformation)
+
+class VideoFrameGrabber(QObject):
+    """Lấy khung hình của video tại các thời điểm cho trước bằng một QMediaPlayer phụ không có âm thanh"""
+    grabbed = pyqtSignal(object, int, QImage)  # (khóa yêu cầu, vị trí ms, ảnh; rỗng nếu lỗi)
+    finished = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        load_multimedia()
+        self.player = QMediaPlayer(self)
+        self.sink = QVideoSink(self)
+        self.player.setVideoSink(self.sink)
+        self.player.mediaStatusChanged.connect(self._status_changed)
+        self.player.errorOccurred.connect(lambda *args: self._finish())
+        self.sink.videoFrameChanged.connect(self._frame_changed)
+        self.queue = deque()
+        self.current = None
+        self.positions = deque()
+        self.target_ms = -1
+        self.timeout = QTimer(self)
+        self.timeout.setSingleShot(True)
+        self.timeout.setInterval(5000)
+        self.timeout.timeout.connect(self._skip)
+
+    def request(self, key, path, positions=lambda duration: [duration // 10]):
+        """positions nhận thời lượng (ms) và trả về danh sách vị trí cần lấy, theo thứ tự tăng dần"""
+        if (self.current and self.current[0] == key) or any(job[0] == key for job in self.queue): return
+        self.queue.append((key, path, positions))
+        self._next()
+
+    def request_first(self, key, path, positions):
+        """Chèn yêu cầu lên đầu hàng đợi (yêu cầu người dùng đang chờ)"""
+        self.queue.appendleft((key, path, positions))
+        self._next()
+
+    def cancel(self, key):
+        self.queue = deque(job for job in self.queue if job[0] != key)
+        if self.current and self.current[0] == key: self._finish()
+
+    def clear(self):
+        self.queue.clear()
+        self._finish()
+
+    def _next(self):
+        if self.current is not None or not self.queue: return
+        self.current = self.queue.popleft()
+        self.positions.clear()
+        self.target_ms = -1
+        self.timeout.start()
+        self.player.setSource(QUrl.fromLocalFile(self.current[1]))
+
+    def _status_changed(self, status):
+        if self.current is None: return
+        if status == QMediaPlayer.MediaStatus.LoadedMedia and self.target_ms < 0:
+            self.positions.extend(self.current[2](max(0, self.player.duration())))
+            self._seek_next()
+        elif status == QMediaPlayer.MediaStatus.InvalidMedia:
+            self._finish()
+
+    def _seek_next(self):
+        if not self.positions:
+            self._finish()
+            return
+        self.target_ms = self.positions.popleft()
+        self.timeout.start()
+        self.player.setPosition(self.target_ms)
+        self.player.play()
+
+    def _frame_changed(self, frame):
+        if self.current is None or self.target_ms < 0 or not frame.isValid(): return
+        # Bỏ qua các khung hình trước khi lệnh tua có hiệu lực
+        if frame.startTime() >= 0 and frame.startTime() // 1000 < self.target_ms - 2000: return
+        image = frame.toImage()
+        if image.isNull(): return
+        self.player.pause()
+        self.grabbed.emit(self.current[0], self.target_ms, image)
+        self._seek_next()
+
+    def _skip(self):
+        if self.current is None: return
+        if self.target_ms < 0:
+            self._finish()
+            return
+        self.grabbed.emit(self.current[0], self.target_ms, QImage())
+        self._seek_next()
+
+    def _finish(self):
+        if self.current is None: return
+        key, self.current = self.current[0], None
+        self.timeout.stop()
+        self.positions.clear()
+        self.target_ms = -1
+        self.player.stop()
+        self.player.setSource(QUrl())
+        self.finished.emit(key)
+        QTimer.singleShot(0, self._next)
+
+class ThumbnailLoader(QObject):
+    """Tạo thumbnail bằng thread pool (ảnh, SVG, khung hình video) với bộ đệm trong RAM và trên đĩa.
+    Bộ đệm RAM và danh sách lỗi theo file_key: file bị ghi đè sẽ được tạo lại thumbnail"""
+    ready = pyqtSignal(str)
+    _made = pyqtSignal(str, object, QImage)  # (đường dẫn, file_key, thumbnail; rỗng nếu lỗi)
+    _video_needed = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.memory = ImageCache(THUMB_MEMORY_BUDGET)
+        self.failed = set()
+        self.pending = set()
+        self.wanted = OrderedDict()  # Các yêu cầu gần nhất; yêu cầu đã trôi khỏi màn hình bị bỏ qua
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() - 1))
+        self.video_grabber = None
+        self.video_done = set()
+        self._made.connect(self._store)
+        self._video_needed.connect(self._grab_video)
+
+    def get(self, path):
+        key = file_key(path)
+        return self.memory.get(key) if key is not None else None
+
+    def request(self, path):
+        self.wanted[path] = True
+        self.wanted.move_to_end(path)
+        while len(self.wanted) > 256: self.wanted.popitem(last=False)
+        if path in self.pending: return
+        key = file_key(path)
+        if key is None or key in self.failed: return
+        self.pending.add(path)
+        self.pool.start(lambda: self._load(path, key))
+
+    def _load(self, path, key):
+        if path not in self.wanted:
+            self._made.emit(path, key, QImage())
+            return
+        if split_archive_path(path) is not None:
+            # Ảnh trong file nén: không có thumbnail chuẩn trên đĩa, giải mã thẳng từ bộ nhớ
+            image = scale_thumbnail(decode_image(path, QSize(THUMB_SIZE, THUMB_SIZE)))
+            if image.isNull(): self.failed.add(key)
+            self._made.emit(path, key, image)
+            return
+        try:
+            image, failed = load_cached_thumbnail(path)
+        except OSError:
+            image, failed = QImage(), True
+        ext = os.path.splitext(path)[1].lower()
+        if image.isNull() and not failed:
+            if ext in VIDEO_EXTS:
+                self._video_needed.emit(key)
+                return
+            if ext in AUDIO_EXTS:
+                failed = True
+            else:
+                source = archive_cover(path) if is_archive(path) else path  # File nén: ảnh bìa
+                image = scale_thumbnail(decode_image(source, QSize(THUMB_SIZE, THUMB_SIZE))) if source else QImage()
+                save_thumbnail(path, image)
+                failed = image.isNull()
+        if failed: self.failed.add(key)
+        self._made.emit(path, key, image)
+
+    def _grab_video(self, key):
+        if self.video_grabber is None:
+            self.video_grabber = VideoFrameGrabber(self)
+            self.video_grabber.grabbed.connect(self._video_grabbed)
+            self.video_grabber.finished.connect(self._video_finished)
+        self.video_grabber.request(key, key[0])
+
+    def _video_grabbed(self, key, ms, image):
+        self.video_done.add(key)
+        self.pool.start(lambda: self._save_video(key, image))
+
+    def _video_finished(self, key):
+        # Video không cho ra khung hình nào (lỗi định dạng, hết thời gian chờ)
+        if key not in self.video_done: self._video_grabbed(key, 0, QImage())
+        self.video_done.discard(key)
+
+    def _save_video(self, key, image):
+        image = scale_thumbnail(image)
+        save_thumbnail(key[0], image)
+        if image.isNull(): self.failed.add(key)
+        self._made.emit(key[0], key, image)
+
+    def _store(self, path, key, image):
+        self.pending.discard(path)
+        if image.isNull(): return
+        self.memory.put(key, image)
+        self.ready.emit(path)
+
+def index_runs(rows):
+    """Gom các chỉ số tăng dần thành các đoạn liên tiếp [(đầu, cuối), ...]"""
+    spans = []
+    for row in rows:
+        if spans and spans[-1][1] == row - 1: spans[-1][1] = row
+        else: spans.append([row, row])
+    return spans
+
+class ThumbnailModel(QAbstractListModel):
+    """Mô hình cho dải ảnh/lưới thumbnail; thumbnail chỉ được yêu cầu cho các ô đang được vẽ.
+    Giữ bản sao danh sách đang hiển thị và chỉ báo phần chênh lệch (thêm/xóa/đổi thứ tự) khi thư mục thay đổi,
+    để view giữ được vị trí cuộn và vùng chọn trong lúc chỉ mục thông tin file sắp xếp lại"""
+    def __init__(self, folder_index, loader, style, parent=None):
+        super().__init__(parent)
+        self.folder_index = folder_index
+        self.loader = loader
+        self.rows = []        # Danh sách view đang thấy, đồng bộ với folder_index.files qua refresh
+        self.folder = None
+        self.icon_image = style.standardIcon(QStyle.StandardPixmap.SP_FileIcon)
+        self.icon_media = style.standardIcon(QStyle.StandardPixmap.SP_MediaPlay)
+        folder_index.changed.connect(self.refresh)
+        loader.ready.connect(self.thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows): return None
+        path = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole: return os.path.basename(path)
+        if role == Qt.ItemDataRole.ToolTipRole: return path
+        if role == Qt.ItemDataRole.UserRole: return path
+        if role == Qt.ItemDataRole.DecorationRole:
+            image = self.loader.get(path)
+            if image is not None: return QPixmap.fromImage(image)
+            self.loader.request(path)
+            ext = os.path.splitext(path)[1].lower()
+            return self.icon_media if ext in VIDEO_EXTS or ext in AUDIO_EXTS else self.icon_image
+        return None
+
+    def refresh(self):
+        files = self.folder_index.files
+        if self.folder_index.folder != self.folder or not self.rows or not files:
+            # Thư mục khác (hoặc danh sách trống): dựng lại cả mô hình
+            self.beginResetModel()
+            self.folder = self.folder_index.folder
+            self.rows = list(files)
+            self.endResetModel()
+            return
+        if files == self.rows: return
+        # Các bước trên cả danh sách chạy trong C (set/map/compress), chỉ lặp Python trên phần chênh lệch
+        now, before = set(files), set(self.rows)
+        gone = compress(range(len(self.rows)), map(not_, map(now.__contains__, self.rows)))
+        for start, end in reversed(index_runs(gone)):
+            self.beginRemoveRows(QModelIndex(), start, end)
+            del self.rows[start:end + 1]
+            self.endRemoveRows()
+        kept = list(compress(files, map(before.__contains__, files)))
+        if kept != self.rows:
+            self.layoutAboutToBeChanged.emit()
+            pos = dict(zip(kept, range(len(kept))))
+            old, rows = self.persistentIndexList(), self.rows
+            self.rows = kept
+            self.changePersistentIndexList(old, [self.index(pos[rows[i.row()]]) for i in old])
+            self.layoutChanged.emit()
+        added = compress(range(len(files)), map(not_, map(before.__contains__, files)))
+        for start, end in index_runs(added):
+            self.beginInsertRows(QModelIndex(), start, end)
+            self.rows[start:start] = files[start:end + 1]
+            self.endInsertRows()
+
+    def thumbnail_ready(self, path):
+        row = self.folder_index.index_of(path)
+        if row is not None and row < len(self.rows) and self.rows[row] == path:
+            idx = self.index(row)
+            self.dataChanged.emit(idx, idx, [Qt.ItemDataRole.DecorationRole])
+
+# --- CHỤP KHUNG HÌNH VIDEO (ẢNH CHỤP / CHỤP LIÊN TỤC / ẢNH TỔNG HỢP) ---
+FRAME_WRITE_BACKLOG = 8  # Số khung hình tối đa đang chờ ghi; vượt quá thì bỏ khung hình
+CONTACT_SHEET_COLUMNS = 4
+CONTACT_SHEET_ROWS = 4
+CONTACT_SHEET_CELL_WIDTH = 480
+
+def format_ms(ms):
+    seconds = max(0, int(ms)) // 1000
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+def compose_contact_sheet(frames, columns, cell_width):
+    """Ghép các khung hình (ms, QImage) thành một lưới kèm mốc thời gian"""
+    frames = [(ms, image) for ms, image in frames if not image.isNull()]
+    if not frames: return QImage()
+    first = frames[0][1]
+    cell_height = max(1, round(cell_width * first.height() / max(1, first.width())))
+    rows = math.ceil(len(frames) / columns)
+    gap = 4
+    sheet = QImage(columns * (cell_width + gap) + gap, rows * (cell_height + gap) + gap, QImage.Format.Format_RGB32)
+    sheet.fill(QColor(20, 20, 20))
+    painter = QPainter(sheet)
+    painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+    font = painter.font()
+    font.setPixelSize(max(12, cell_height // 12))
+    painter.setFont(font)
+    for i, (ms, image) in enumerate(frames):
+        cell = QRect(gap + (i % columns) * (cell_width + gap), gap + (i // columns) * (cell_height + gap),
+                     cell_width, cell_height)
+        scaled = image.scaled(cell.size(), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        painter.drawImage(cell.x() + (cell.width() - scaled.width()) // 2,
+                          cell.y() + (cell.height() - scaled.height()) // 2, scaled)
+        label = cell.adjusted(6, 4, -6, -4)
+        painter.setPen(QColor(0, 0, 0))
+        painter.drawText(label.translated(1, 1), Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignBottom, format_ms(ms))
+        painter.setPen(QColor(255, 255, 255))
+        painter.drawText(label, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignBottom, format_ms(ms))
+    painter.end()
+    return sheet
+
+class FrameWriter(QObject):
+    """Chuyển khung hình video sang ảnh và ghi ra đĩa trên luồng nền để không chặn việc phát"""
+    written = pyqtSignal(str, bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.pending = 0
+        self.written.connect(self._done)
+
+    def write(self, frame, path):
+        """Trả về False (bỏ khung hình) khi hàng đợi ghi đã đầy"""
+        if self.pending >= FRAME_WRITE_BACKLOG: return False
+        self.write_image(frame.toImage, path)
+        return True
+
+    def write_image(self, make_image, path):
+        self.pending += 1
+        self.pool.start(lambda: self._write(make_image, path))
+
+    def _write(self, make_image, path):
+        try:
+            started = time.perf_counter()
+            image = make_image()
+            ok = not image.isNull() and image.save(path, "JPG", 95)
+            tracer.record("save-frame", started, path)
+        except Exception as e:
+            tracer.exception("save-frame", e)
+            ok = False
+        self.written.emit(path, ok)
+
+    def _done(self, path, ok):
+        self.pending -= 1
+
+# --- BƯỚC TỪNG KHUNG HÌNH (KHI TẠM DỪNG) ---
+FRAME_RING_BUDGET = 256 * 1024 * 1024  # Bộ nhớ tối đa cho các khung hình đã giải mã được giữ lại
+FRAME_BACKOFF_MS = 1000                # Khoảng lùi ban đầu trước khung cần tìm (ước lượng khoảng cách keyframe)
+FRAME_BACKOFF_MAX_MS = 16000
+FRAME_STEP_TIMEOUT_MS = 4000
+
+class FrameStepper(QObject):
+    """Bước tới/lùi đúng một khung hình khi video tạm dừng.
+    Các khung đã giải mã (lấy từ QVideoSink) được giữ trong bộ đệm vòng theo mốc thời gian, nên bước lùi
+    lặp lại được phục vụ ngay từ bộ nhớ. Khi thiếu khung trước đó: tua lùi về trước keyframe (khoảng lùi
+    được nhân đôi mỗi khi khung đầu tiên nhận được vẫn còn quá muộn) rồi giải mã tiến tới khung đang xem."""
+    shown = pyqtSignal(int, int)  # (mốc bắt đầu µs, độ dài khung µs) của khung đang hiển thị
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.player = None
+        self.audio = None
+        self.sink = None
+        self.times = []     # Mốc bắt đầu (µs) các khung trong bộ đệm, tăng dần
+        self.images = {}    # µs -> QImage
+        self.used = 0
+        self.current = -1   # Mốc của khung đang hiển thị
+        self.frame_us = 0   # Độ dài một khung
+        self.job = None     # Việc giải mã đang chạy: {"back": bool, "from": µs, "seek": µs}
+        self.muted = False
+        self.backoff_ms = FRAME_BACKOFF_MS
+        self.pushing = False  # Đang tự đưa khung từ bộ đệm vào sink
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(FRAME_STEP_TIMEOUT_MS)
+        self.timer.timeout.connect(self._finish)
+
+    @property
+    def busy(self):
+        return self.job is not None
+
+    def attach(self, player, audio, sink):
+        self._finish()
+        self.player, self.audio, self.sink = player, audio, sink
+        self.current = -1
+        self.frame_us = 0
+        self.backoff_ms = FRAME_BACKOFF_MS
+        self.clear()
+
+    def clear(self):
+        self.times = []
+        self.images = {}
+        self.used = 0
+
+    def _store(self, us, frame):
+        if us in self.images: return
+        image = frame.toImage()
+        if image.isNull(): return
+        bisect.insort(self.times, us)
+        self.images[us] = image
+        self.used += image.sizeInBytes()
+        while self.used > FRAME_RING_BUDGET and len(self.times) > 1:
+            # Bỏ khung xa khung đang xem nhất
+            far = self.times.pop(0 if self.current - self.times[0] > self.times[-1] - self.current else -1)
+            self.used -= self.images.pop(far).sizeInBytes()
+
+    def frame_arrived(self, frame):
+        """Gọi cho mọi khung QVideoSink nhận được"""
+        if self.pushing or not frame.isValid() or frame.startTime() < 0: return
+        us = frame.startTime()
+        if frame.endTime() > us: self.frame_us = frame.endTime() - us
+        if self.job is None:
+            playing = self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState
+            # Đang phát bình thường: các khung cũ trong bộ đệm không còn liền mạch với vị trí mới
+            if playing: self.clear()
+            else: self._store(us, frame)
+            self.current = us
+            self.shown.emit(us, self.frame_us)
+            return
+        job = self.job
+        if not job["back"]:
+            self._store(us, frame)
+            if us > job["from"]:
+                self.current = us
+                self.shown.emit(us, self.frame_us)
+                self._finish()
+        elif us < job["from"]:
+            job["seen"] = True
+            self._store(us, frame)
+        elif job["seen"]:
+            self._finish()  # Đã giải mã lại tới khung đang xem
+        else:
+            # Chưa nhận được khung nào trước khung đang xem: khung cũ gửi lại trước khi tua có hiệu lực,
+            # hoặc trình phát nhảy tới keyframe sau vị trí tua. Lặp lại vài lần thì lùi xa hơn.
+            job["late"] += 1
+            if job["late"] > 3 and self.backoff_ms < FRAME_BACKOFF_MAX_MS:
+                self.backoff_ms *= 2
+                self._seek_back()
+
+    def step(self, direction):
+        if self.player is None or self.job is not None: return
+        if self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            self.player.pause()
+            return
+        if self.current < 0: return
+        idx = bisect.bisect_left(self.times, self.current)
+        if direction > 0:
+            if idx + 1 < len(self.times) and self.times[idx] == self.current: return self._show(self.times[idx + 1])
+            self._start({"back": False, "from": self.current})
+            self.player.play()  # Giải mã tiến tới khung kế tiếp rồi dừng
+        else:
+            if idx > 0 and self.times[idx - 1] < self.current: return self._show(self.times[idx - 1])
+            if self.current <= 0: return
+            self._start({"back": True, "from": self.current, "seen": False, "late": 0})
+            self._seek_back()
+
+    def _start(self, job):
+        self.job = job
+        self.muted = self.audio.isMuted()
+        self.audio.setMuted(True)
+        self.timer.start()
+
+    def _seek_back(self):
+        self.clear()
+        self.job["late"] = 0
+        self.player.setPosition(max(0, self.job["from"] // 1000 - self.backoff_ms))
+        self.player.play()
+
+    def _finish(self):
+        job, self.job = self.job, None
+        self.timer.stop()
+        if job is None: return
+        self.player.pause()
+        self.audio.setMuted(self.muted)
+        if job["back"]:
+            idx = bisect.bisect_left(self.times, job["from"])
+            if idx > 0: self._show(self.times[idx - 1])
+
+    def _show(self, us):
+        image = self.images[us]
+        frame = QVideoFrame(image)
+        frame.setStartTime(us)
+        if self.frame_us: frame.setEndTime(us + self.frame_us)
+        self.pushing = True
+        self.sink.setVideoFrame(frame)
+        self.pushing = False
+        self.current = us
+        self.shown.emit(us, self.frame_us)
+
+    def cancel(self):
+        # Người dùng tự tua: bỏ việc đang chạy và các khung không còn liền mạch
+        if self.job is not None: self.job["back"] = False
+        self._finish()
+        self.clear()
+
+    def sync_position(self):
+        # Trước khi phát tiếp: đưa trình phát về đúng khung đang xem (có thể đã lùi bằng bộ đệm)
+        if self.player is not None and self.current >= 0 and self.times and self.current != self.times[-1]:
+            self.player.setPosition(self.current // 1000)
+            self.clear()
+
+# --- XEM TRƯỚC KHI DI CHUỘT TRÊN THANH TUA ---
+SEEK_PREVIEW_WIDTH = 240
+SEEK_PREVIEW_BUCKETS = 240          # Số mốc tối đa trên toàn bộ video
+SEEK_PREVIEW_MIN_BUCKET_MS = 2000   # Khoảng cách tối thiểu giữa hai mốc
+SEEK_PREVIEW_CHUNK = 8              # Số mốc lấy trong mỗi lần mở video bằng trình phát phụ
+SEEK_PREVIEW_MEMORY_BUDGET = 32 * 1024 * 1024
+
+def seek_preview_dir(key):
+    """Thư mục lưu ảnh xem trước của một video; khóa gồm đường dẫn và mtime nên file sửa đổi sẽ dùng thư mục mới"""
+    base = os.environ.get("XDG_CACHE_HOME") or QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.GenericCacheLocation)
+    return os.path.join(base, "wpmv", "seek", hashlib.md5(f"{key[0]}|{key[1]}".encode("utf-8")).hexdigest())
+
+class SeekPreviewCache(QObject):
+    """Ảnh xem trước theo từng mốc thời gian của video, lấy trước bằng trình phát phụ (không âm thanh)
+    và lưu trong RAM lẫn trên đĩa"""
+    ready = pyqtSignal(int)  # Mốc (ms) vừa có ảnh
+    _loaded = pyqtSignal(object, int, QImage)
+    _disk_done = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.memory = ImageCache(SEEK_PREVIEW_MEMORY_BUDGET)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.grabber = None
+        self.key = None
+        self.path = ""
+        self.bucket_ms = SEEK_PREVIEW_MIN_BUCKET_MS
+        self.duration = 0
+        self.done = set()  # Các mốc đã có ảnh hoặc đã thử lấy nhưng lỗi
+        self.requested = set()
+        self._loaded.connect(self._store)
+        self._disk_done.connect(self._sample_missing)
+
+    def open(self, path, duration):
+        key = file_key(path)
+        if key is None or duration <= 0 or key == self.key: return
+        self.close()
+        self.key, self.path, self.duration = key, path, duration
+        self.bucket_ms = max(SEEK_PREVIEW_MIN_BUCKET_MS, duration // SEEK_PREVIEW_BUCKETS // 1000 * 1000)
+        self.pool.start(lambda: self._load_disk(key))
+
+    def close(self):
+        self.key = None
+        self.done = set()
+        self.requested = set()
+        if self.grabber is not None: self.grabber.clear()
+
+    def bucket(self, ms):
+        return max(0, min(int(ms), self.duration - 1)) // self.bucket_ms * self.bucket_ms
+
+    def get(self, ms):
+        if self.key is None: return None
+        return self.memory.get((self.key, self.bucket(ms)))
+
+    def request(self, ms):
+        """Lấy ngay mốc đang được di chuột tới nếu chưa có"""
+        if self.key is None: return
+        bucket = self.bucket(ms)
+        if bucket in self.done or bucket in self.requested: return
+        self.requested.add(bucket)
+        self._ensure_grabber()
+        self.grabber.request_first((self.key, bucket), self.path, lambda duration: [bucket])
+
+    def _ensure_grabber(self):
+        if self.grabber is not None: return
+        self.grabber = VideoFrameGrabber(self)
+        self.grabber.grabbed.connect(self._grabbed)
+
+    def _load_disk(self, key):
+        folder = seek_preview_dir(key)
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            names = []
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            if ext != ".jpg" or not stem.isdigit(): continue
+            image = QImage(os.path.join(folder, name))
+            if not image.isNull(): self._loaded.emit(key, int(stem), image)
+        self._disk_done.emit(key)
+
+    def _sample_missing(self, key):
+        if key != self.key: return
+        missing = [ms for ms in range(0, self.duration, self.bucket_ms) if ms not in self.done]
+        if not missing: return
+        self._ensure_grabber()
+        # Chia thành nhiều yêu cầu nhỏ để yêu cầu khi di chuột không phải chờ cả lượt quét
+        for i in range(0, len(missing), SEEK_PREVIEW_CHUNK):
+            chunk = missing[i:i + SEEK_PREVIEW_CHUNK]
+            self.grabber.request((key, chunk[0], len(chunk)), self.path, lambda duration, chunk=chunk: chunk)
+
+    def _grabbed(self, job, ms, image):
+        key = job[0]
+        if key != self.key: return
+        if image.isNull():
+            self.done.add(ms)
+            return
+        image = image.scaledToWidth(SEEK_PREVIEW_WIDTH, Qt.TransformationMode.SmoothTransformation)
+        self._store(key, ms, image)
+        self.pool.start(lambda: self._save(key, ms, image))
+
+    def _save(self, key, ms, image):
+        folder = seek_preview_dir(key)
+        try:
+            os.makedirs(folder, mode=0o700, exist_ok=True)
+            target = os.path.join(folder, f"{ms}.jpg")
+            tmp = f"{target}.wpmv-{os.getpid()}.jpg"
+            if image.save(tmp, "JPG", 85): os.replace(tmp, target)
+        except OSError as e: tracer.exception("seek_preview_save", e)
+
+    def _store(self, key, ms, image):
+        if key != self.key: return
+        self.done.add(ms)
+        self.memory.put((key, ms), image)
+        self.ready.emit(ms)
+
+# --- DẠNG SÓNG ÂM THANH TRÊN THANH TUA ---
+WAVEFORM_SAMPLE_RATE = 8000     # Giải mã ở tần số thấp: đủ cho hình dạng sóng, nhẹ hơn nhiều lần
+WAVEFORM_START_FRAMES = 64      # Số mẫu mỗi cột đỉnh ban đầu (gộp đôi khi vượt giới hạn số cột)
+WAVEFORM_MAX_BUCKETS = 32768    # Bộ nhớ cố định: tối đa 2 x 32768 byte bất kể độ dài file
+WAVEFORM_REDRAW_MS = 100
+WAVEFORM_HEIGHT = 48
+WAVEFORM_MAGIC = b'WPK1'
+
+def waveform_cache_path(key):
+    """File đỉnh sóng đã tính của một file audio; khóa gồm đường dẫn và mtime như ảnh xem trước của video"""
+    base = os.environ.get("XDG_CACHE_HOME") or QStandardPaths.writableLocation(
+        QStandardPaths.StandardLocation.GenericCacheLocation)
+    return os.path.join(base, "wpmv", "waveform", hashlib.md5(f"{key[0]}|{key[1]}".encode("utf-8")).hexdigest() + ".peaks")
+
+def halve_peaks(values, pick):
+    """Gộp từng cặp cột đỉnh liền nhau bằng pick (min hoặc max); cột lẻ cuối cùng giữ nguyên"""
+    count = len(values) // 2 * 2
+    return array('b', map(pick, values[0:count:2], values[1:count:2])) + values[count:]
+
+class WaveformPeaks(QObject):
+    """Đỉnh min/max của tín hiệu âm thanh theo từng cột thời gian, tính dần bằng QAudioDecoder.
+    Việc tìm min/max trên từng mẫu chạy ở một luồng nền (theo đúng thứ tự các buffer), không chặn giao diện.
+    Khi số cột vượt giới hạn thì gộp từng cặp cột (độ phân giải giảm một nửa) nên bộ nhớ không tăng theo độ dài file.
+    Chỉ kết quả giải mã trọn vẹn mới được lưu dạng nhị phân để lần mở sau hiện ngay."""
+    updated = pyqtSignal()
+    _reduced = pyqtSignal(int, int, object, object)  # (thế hệ, số mẫu mỗi cột, mins, maxs)
+    _complete = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.decoder = None
+        self.key = None
+        self.started = 0.0
+        self.generation = 0  # Tăng khi đóng; kết quả tính dở của file trước bị bỏ qua
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)  # Một luồng: các buffer được xử lý đúng thứ tự
+        self._reduced.connect(self._store)
+        self._complete.connect(self._completed)
+        self.redraw = QTimer(self)
+        self.redraw.setSingleShot(True)
+        self.redraw.setInterval(WAVEFORM_REDRAW_MS)
+        self.redraw.timeout.connect(self.updated)
+        self._reset()
+
+    def _reset(self):
+        self.mins = array('b')
+        self.maxs = array('b')
+        self.rate = 0
+        self.frames = WAVEFORM_START_FRAMES
+        self.carry = (self.generation, None)  # Các mẫu chưa đủ một cột, chỉ luồng nền dùng
+        self._envelope = (None, [])
+
+    @property
+    def bucket_ms(self):
+        return self.frames * 1000.0 / self.rate if self.rate else 0.0
+
+    def open(self, path):
+        key = file_key(path)
+        if key is not None and key == self.key: return
+        self.close()
+        self.key = key
+        if key is None: return
+        if self._load():
+            self.updated.emit()
+            return
+        load_multimedia()
+        self.decoder = QAudioDecoder(self)
+        fmt = QAudioFormat()
+        fmt.setSampleRate(WAVEFORM_SAMPLE_RATE)
+        fmt.setChannelCount(1)
+        fmt.setSampleFormat(QAudioFormat.SampleFormat.Int16)
+        self.decoder.setAudioFormat(fmt)
+        self.decoder.bufferReady.connect(self._buffer_ready)
+        self.decoder.finished.connect(self._finished)
+        self.decoder.error.connect(self._failed)
+        self.started = time.perf_counter()
+        self.decoder.setSource(QUrl.fromLocalFile(path))
+        self.decoder.start()
+
+    def close(self):
+        self._discard_decoder()
+        self.generation += 1
+        self.pool.clear()
+        self.redraw.stop()
+        self.key = None
+        self._reset()
+        self.updated.emit()
+
+    def _discard_decoder(self):
+        # stop() phát finished (backend FFmpeg): chặn tín hiệu trước để kết quả dở dang không bị lưu như đã xong
+        if self.decoder is None: return
+        self.decoder.blockSignals(True)
+        self.decoder.stop()
+        self.decoder.deleteLater()
+        self.decoder = None
+
+    def _buffer_ready(self):
+        buffer = self.decoder.read()
+        if not buffer.isValid() or buffer.byteCount() <= 0: return
+        fmt = buffer.format()
+        sample_format = fmt.sampleFormat()
+        if sample_format == QAudioFormat.SampleFormat.Int16: typecode, scale = 'h', 1 / 256.0
+        elif sample_format == QAudioFormat.SampleFormat.Float: typecode, scale = 'f', 127.0
+        else: return
+        if not self.rate: self.rate = fmt.sampleRate()
+        data = buffer.constData().asstring(buffer.byteCount())
+        generation, frames, channels = self.generation, self.frames, max(1, fmt.channelCount())
+        self.pool.start(lambda: self._reduce(generation, data, typecode, scale, frames, channels))
+
+    def _reduce(self, generation, data, typecode, scale, frames, channels):
+        # Luồng nền: min/max của từng nhóm mẫu; phần dư được nối vào buffer kế tiếp
+        if generation != self.generation: return
+        samples = array(typecode)
+        samples.frombytes(data)
+        carried_generation, carry = self.carry
+        if carried_generation == generation and carry is not None and carry.typecode == typecode: samples = carry + samples
+        # Các kênh xen kẽ nhau: min/max trên cả đoạn là đỉnh chung của mọi kênh
+        step = frames * channels
+        full = len(samples) - len(samples) % step
+        chunks = [samples[i:i + step] for i in range(0, full, step)]
+        mins = array('b', (max(-127, int(v * scale)) for v in map(min, chunks)))
+        maxs = array('b', (min(127, int(v * scale)) for v in map(max, chunks)))
+        self.carry = (generation, samples[full:])
+        self._reduced.emit(generation, frames, mins, maxs)
+
+    def _store(self, generation, frames, mins, maxs):
+        if generation != self.generation: return
+        # Buffer được chia nhóm trước lần gộp cột gần nhất: gộp cho cùng độ phân giải
+        while frames < self.frames:
+            mins, maxs, frames = halve_peaks(mins, min), halve_peaks(maxs, max), frames * 2
+        self.mins += mins
+        self.maxs += maxs
+        while len(self.mins) > WAVEFORM_MAX_BUCKETS: self._halve()
+        if not self.redraw.isActive(): self.redraw.start()
+
+    def _halve(self):
+        self.mins = halve_peaks(self.mins, min)
+        self.maxs = halve_peaks(self.maxs, max)
+        self.frames *= 2
+
+    def _finished(self):
+        # Giải mã hết file: chờ luồng nền xử lý xong các buffer còn lại rồi mới lưu
+        generation = self.generation
+        self.pool.start(lambda: self._complete.emit(generation))
+
+    def _completed(self, generation):
+        if generation != self.generation: return
+        tracer.record("waveform", self.started, self.key[0] if self.key else None, buckets=len(self.mins))
+        self._save()
+        self.redraw.stop()
+        self.updated.emit()
+
+    def _failed(self, *args):
+        tracer.exception("waveform", Exception(self.decoder.errorString()))
+        self._discard_decoder()  # Giữ phần đã có để hiển thị nhưng không lưu
+
+    def _load(self):
+        try:
+            with open(waveform_cache_path(self.key), 'rb') as f: data = f.read()
+            magic, frames, rate, count = struct.unpack_from('<4sIII', data)
+            if magic != WAVEFORM_MAGIC or len(data) != 16 + 2 * count: return False
+        except (OSError, struct.error):
+            return False
+        self.frames, self.rate = frames, rate
+        self.mins = array('b', data[16:16 + count])
+        self.maxs = array('b', data[16 + count:])
+        return True
+
+    def _save(self):
+        if self.key is None or not self.rate: return
+        path = waveform_cache_path(self.key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", 'wb') as f:
+                f.write(struct.pack('<4sIII', WAVEFORM_MAGIC, self.frames, self.rate, len(self.mins)))
+                f.write(self.mins.tobytes())
+                f.write(self.maxs.tobytes())
+            os.replace(path + ".tmp", path)
+        except OSError as e: tracer.exception("waveform_save", e)
+
+    def envelope(self, duration_ms, width):
+        """Đỉnh (min, max) cho từng cột điểm ảnh khi vẽ cả thời lượng trên width điểm ảnh;
+        chỉ gồm phần đã giải mã xong"""
+        key = (duration_ms, width, len(self.mins), self.frames)
+        if self._envelope[0] == key: return self._envelope[1]
+        columns = []
+        if self.mins and duration_ms > 0 and width > 0 and self.rate:
+            per_column = duration_ms / width / self.bucket_ms  # Số cột đỉnh trên mỗi điểm ảnh
+            for x in range(width):
+                a = int(x * per_column)
+                if a >= len(self.mins): break
+                b = max(a + 1, int((x + 1) * per_column))
+                columns.append((min(self.mins[a:b]), max(self.maxs[a:b])))
+        self._envelope = (key, columns)
+        return columns
+
+# --- PHÁT CHUỖI ẢNH ĐÁNH SỐ (shot_0001.png, shot_0002.png, ...) ---
+SEQUENCE_MIN_FRAMES = 8
+SEQUENCE_FPS = ["12", "24", "25", "30", "60"]
+SEQUENCE_AHEAD = 64                                  # Số khung hình tối đa giải mã trước
+SEQUENCE_MEMORY_BUDGET = 512 * 1024 * 1024           # Giới hạn bộ đệm vòng (theo kích thước khung đã giải mã)
+SEQUENCE_RE = re.compile(r'(.*?)(\d+)(\.[^.]+)')
+
+def sequence_key(path):
+    """(thư mục, tiền tố, phần mở rộng) của chuỗi đánh số mà path có thể thuộc về, None nếu tên không đánh số"""
+    m = SEQUENCE_RE.fullmatch(os.path.basename(path))
+    if not m or os.path.splitext(path)[1].lower() not in RASTER_EXTS: return None
+    return os.path.dirname(path), m.group(1), m.group(3)
+
+def has_sequence_neighbors(path, contains):
+    """Kiểm tra nhanh khi mở ảnh: đủ SEQUENCE_MIN_FRAMES số liên tiếp quanh số của path có trong thư mục.
+    Chỉ tra tên trong chỉ mục (O(SEQUENCE_MIN_FRAMES)), không quét cả thư mục như find_sequence"""
+    key = sequence_key(path)
+    if key is None: return False
+    folder, prefix, ext = key
+    digits = SEQUENCE_RE.fullmatch(os.path.basename(path)).group(2)
+    number, width, found = int(digits), len(digits), 1
+    for step in (1, -1):
+        k = number + step
+        while found < SEQUENCE_MIN_FRAMES and k >= 0 and contains(os.path.join(folder, f"{prefix}{k:0{width}d}{ext}")):
+            found += 1
+            k += step
+    return found >= SEQUENCE_MIN_FRAMES
+
+def find_sequence(path, paths):
+    """Các file cùng chuỗi đánh số với path (cùng tiền tố và phần mở rộng), theo thứ tự số; [] nếu không phải chuỗi"""
+    key = sequence_key(path)
+    if key is None: return []
+    _, prefix, ext = key
+    frames = []
+    for p in paths:
+        name = os.path.basename(p)
+        if not (name.startswith(prefix) and name.endswith(ext)): continue
+        number = name[len(prefix):len(name) - len(ext)]
+        if number.isdigit(): frames.append((int(number), p))
+    if len(frames) < SEQUENCE_MIN_FRAMES: return []
+    return [p for _, p in sorted(frames)]
+
+class SequencePlayer(QObject):
+    """Phát chuỗi ảnh như video ở tốc độ khung hình cố định. Các khung hình sắp tới được giải mã trước
+    bằng thread pool vào bộ đệm vòng có giới hạn; khung hình không giải mã kịp bị bỏ qua và được đếm"""
+    frameShown = pyqtSignal(int, QImage)
+    stateChanged = pyqtSignal(bool)             # Đang phát hay không
+    _decoded = pyqtSignal(int, int, object)     # (thế hệ, chỉ số khung, QImage hoặc None nếu bị bỏ qua)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() - 1))
+        self.frames = []
+        self.target = None
+        self.fps = 24.0
+        self.rate = 1.0
+        self.index = -1         # Khung hình đang hiển thị
+        self.window = 0         # Khung đầu tiên của cửa sổ giải mã trước [window, window + ahead)
+        self.ahead = SEQUENCE_AHEAD
+        self.buffer = {}        # chỉ số -> QImage
+        self.pending = set()
+        self.generation = 0
+        self.playing = False
+        self.clock = (0, 0.0)   # (chỉ số khung, mốc thời gian) dùng để tính khung hình đến hạn
+        self.started = 0.0
+        self.shown = 0
+        self.dropped = 0
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self._tick)
+        self._decoded.connect(self._store)
+
+    def open(self, frames, fps, target):
+        self.stop()
+        self.frames = frames
+        self.target = target
+        self.fps = fps
+        frame_bytes = max(1, target.width() * target.height() * 4)
+        self.ahead = max(4, min(SEQUENCE_AHEAD, SEQUENCE_MEMORY_BUDGET // frame_bytes))
+        self.shown = self.dropped = 0
+
+    def stop(self):
+        self.pause()
+        self.generation += 1
+        self.buffer.clear()
+        self.pending.clear()
+        self.index = -1
+
+    def play(self):
+        if not self.frames or self.playing: return
+        if self.index >= len(self.frames) - 1: self.seek(0)
+        self.playing = True
+        self.started = time.perf_counter()
+        self.clock = (max(0, self.index), self.started)
+        self.timer.start(max(1, int(1000 / (self.fps * self.rate))))
+        self.stateChanged.emit(True)
+
+    def pause(self):
+        if not self.playing: return
+        self.playing = False
+        self.timer.stop()
+        tracer.record("sequence", self.started, self.frames[0] if self.frames else None,
+                      fps=self.fps * self.rate, shown=self.shown, dropped=self.dropped, buffer=self.ahead)
+        self.stateChanged.emit(False)
+
+    def set_rate(self, fps, rate):
+        self.fps, self.rate = fps, rate
+        self.clock = (max(0, self.index), time.perf_counter())
+        if self.playing: self.timer.start(max(1, int(1000 / (self.fps * self.rate))))
+
+    def seek(self, index):
+        if not self.frames: return
+        index = max(0, min(index, len(self.frames) - 1))
+        self.clock = (index, time.perf_counter())
+        if index in self.buffer: self._show(index)
+        else:
+            self.index = index - 1 if index > 0 else -1
+            self._fill(index)
+
+    def _show(self, index):
+        self.index = index
+        self.shown += 1
+        image = self.buffer.get(index)
+        if image is not None and not image.isNull(): self.frameShown.emit(index, image)
+        self._fill(index + 1 if self.playing else index)
+
+    def _fill(self, start):
+        # Bỏ các khung ngoài cửa sổ rồi gửi giải mã những khung còn thiếu, gần nhất chạy trước
+        self.window = start
+        end = min(len(self.frames), start + self.ahead)
+        for i in [i for i in self.buffer if not start - 1 <= i < end]: del self.buffer[i]
+        generation = self.generation
+        for i in range(start, end):
+            if i in self.buffer or i in self.pending: continue
+            self.pending.add(i)
+            self.pool.start(lambda i=i: self._decode(generation, i), end - i)
+
+    def _decode(self, generation, index):
+        # Khung đã trôi khỏi cửa sổ (bị trễ hoặc người dùng đã tua) thì không giải mã nữa
+        if generation != self.generation or not self.window <= index < self.window + self.ahead:
+            self._decoded.emit(generation, index, None)
+            return
+        self._decoded.emit(generation, index, decode_image(self.frames[index], self.target))
+
+    def _store(self, generation, index, image):
+        if generation != self.generation: return
+        self.pending.discard(index)
+        if image is None or not self.window - 1 <= index < self.window + self.ahead: return
+        self.buffer[index] = image
+        if not self.playing and index == self.index + 1 and self.clock[0] == index: self._show(index)
+
+    def _tick(self):
+        start_index, start_time = self.clock
+        last = len(self.frames) - 1
+        due = min(last, start_index + int((time.perf_counter() - start_time) * self.fps * self.rate))
+        if due <= self.index: return
+        ready = [i for i in self.buffer if self.index < i <= due]
+        if ready:
+            # Hiện khung mới nhất đã đến hạn; các khung bị vượt qua tính là rơi
+            shown = max(ready)
+            self.dropped += shown - self.index - 1
+            self._show(shown)
+        elif self.index < start_index:
+            self.clock = (start_index, time.perf_counter())  # Chờ khung đầu tiên sau khi phát/tua: chưa tính giờ
+        else:
+            self._fill(due)
+        if self.index >= last: self.pause()
+
+    def stats(self):
+        return {"frame": self.index + 1, "frames": len(self.frames), "shown": self.shown,
+                "dropped": self.dropped, "buffered": len(self.buffer), "ahead": self.ahead}
+
+# --- IN ẢNH ---
+PRINT_BAND_HEIGHT = 512  # Chiều cao mỗi dải khi in (điểm ảnh của máy in)
+PRINT_DECODE_BUDGET = 128 * 1024 * 1024  # Ảnh ở độ phân giải in vừa ngân sách này thì giải mã một lần
+
+def view_orientation(view):
+    """Phần xoay/lật trong phép biến đổi của view (bỏ tỉ lệ thu phóng và tịnh tiến)"""
+    t = view.transform()
+    s = math.sqrt(abs(t.determinant())) or 1.0
+    return QTransform(t.m11() / s, t.m12() / s, t.m21() / s, t.m22() / s, 0, 0)
+
+def print_image_file(painter, page, path, orientation=QTransform()):
+    """Vẽ một file ảnh vừa khung page (tọa độ thiết bị của máy in) theo hướng xoay/lật cho trước.
+    SVG được vẽ dạng vector. Ảnh raster được giải mã một lần, thu nhỏ về độ phân giải in (JPEG thu nhỏ ngay khi
+    giải mã), rồi vẽ theo từng dải ngang. Chỉ khi ảnh ở độ phân giải in vượt PRINT_DECODE_BUDGET thì JPEG mới
+    được giải mã theo từng dải: mỗi dải phải giải mã lại từ đầu file tới dải đó, nên dải được làm cao nhất có thể.
+    Trả về False nếu không đọc được ảnh."""
+    is_svg = os.path.splitext(path)[1].lower() == '.svg'
+    if is_svg:
+        load_svg_support()
+        renderer = QSvgRenderer(path)
+        size = renderer.defaultSize()
+    else:
+        reader = image_reader(path)
+        size = reader.size()
+    if not size.isValid() or size.isEmpty(): return False
+    src = QRectF(0, 0, float(size.width()), float(size.height()))
+    bounds = orientation.mapRect(src)
+    k = min(page.width() / bounds.width(), page.height() / bounds.height())
+    to_page = (orientation * QTransform.fromTranslate(-bounds.x(), -bounds.y())
+               * QTransform.fromScale(k, k) * QTransform.fromTranslate(page.x(), page.y()))
+    if is_svg:
+        painter.save()
+        painter.setTransform(to_page)
+        renderer.render(painter, src)
+        painter.restore()
+        return True
+
+    native = (reader.supportsOption(QImageIOHandler.ImageOption.ClipRect)
+              and reader.supportsOption(QImageIOHandler.ImageOption.ScaledSize))
+    from_page, _ = to_page.inverted()
+    out = to_page.mapRect(src).toAlignedRect().intersected(page.toAlignedRect())
+    scaled = QSize(max(1, math.ceil(size.width() * min(k, 1.0))), max(1, math.ceil(size.height() * min(k, 1.0))))
+    whole = None
+    band_height = PRINT_BAND_HEIGHT
+    if not native or scaled.width() * scaled.height() * 4 <= PRINT_DECODE_BUDGET:
+        if k < 1: reader.setScaledSize(scaled)
+        whole = reader.read()
+        if whole.isNull(): return False
+        sx, sy = whole.width() / size.width(), whole.height() / size.height()
+    else:
+        band_height = max(PRINT_BAND_HEIGHT, PRINT_DECODE_BUDGET // max(1, out.width() * 4))
+
+    painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+    drawn = False
+    for y in range(out.top(), out.bottom() + 1, band_height):
+        band = QRect(out.left(), y, out.width(), min(band_height, out.bottom() + 1 - y))
+        region = from_page.mapRect(QRectF(band)).toAlignedRect().adjusted(-1, -1, 1, 1).intersected(src.toRect())
+        if region.isEmpty(): continue
+        if whole is None:
+            band_reader = image_reader(path)
+            band_reader.setClipRect(region)
+            if k < 1:
+                band_reader.setScaledSize(QSize(max(1, math.ceil(region.width() * k)),
+                                                max(1, math.ceil(region.height() * k))))
+            image = band_reader.read()
+            target = QRectF(region)
+        else:
+            part = QRect(int(region.x() * sx), int(region.y() * sy),
+                         math.ceil(region.width() * sx) + 1, math.ceil(region.height() * sy) + 1).intersected(whole.rect())
+            image = whole.copy(part)
+            target = QRectF(part.x() / sx, part.y() / sy, part.width() / sx, part.height() / sy)
+        if image.isNull(): continue
+        painter.save()
+        painter.setClipRect(band)
+        painter.setTransform(to_page)
+        painter.drawImage(target, image)
+        painter.restore()
+        drawn = True
+    return drawn
+
+# --- CHẾ ĐỘ MỘT CỬA SỔ (bật bằng tham số --single-instance) ---
+SINGLE_INSTANCE_FLAG = "--single-instance"
+INSTANCE_TIMEOUT_MS = 500
+
+def instance_server_name():
+    # Tên socket riêng cho từng người dùng để các tài khoản không chia sẻ cửa sổ với nhau
+    return "wpmv-" + hashlib.md5(os.path.expanduser("~").encode("utf-8")).hexdigest()[:12]
+
+def send_to_running_instance(path):
+    """Gửi đường dẫn cho cửa sổ đang chạy. Trả về True nếu đã bàn giao (tiến trình này có thể thoát)"""
+    from PyQt6.QtNetwork import QLocalSocket
+    socket = QLocalSocket()
+    socket.connectToServer(instance_server_name())
+    if not socket.waitForConnected(INSTANCE_TIMEOUT_MS): return False
+    socket.write((os.path.abspath(path) if path else "").encode("utf-8") + b"\n")
+    ok = socket.waitForBytesWritten(INSTANCE_TIMEOUT_MS)
+    socket.disconnectFromServer()
+    return ok
+
+def probe_instance_server(name):
+    """Thử kết nối tới cửa sổ đang chạy: None nếu có cửa sổ đang nghe, ngược lại là lỗi kết nối (LocalSocketError)"""
+    from PyQt6.QtNetwork import QLocalSocket
+    socket = QLocalSocket()
+    socket.connectToServer(name)
+    if socket.waitForConnected(INSTANCE_TIMEOUT_MS):
+        socket.disconnectFromServer()
+        return None
+    return socket.error()
+
 class ClickableSlider(QSlider):
     """Thanh trượt tùy chỉnh cho phép nhảy tới vị trí click chuột ngay lập tức"""
+    hovered = pyqtSignal(int, QPoint)  # (giá trị dưới con trỏ, vị trí con trỏ trên màn hình)
+    left = pyqtSignal()
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.setMouseTracking(True)
+        self.waveform = None  # WaveformPeaks vẽ phía sau thanh trượt (chế độ audio)
+
+    def set_waveform(self, waveform):
+        self.waveform = waveform
+        self.setMinimumHeight(WAVEFORM_HEIGHT if waveform is not None else 0)
+        self.update()
+
+    def paintEvent(self, event):
+        if self.waveform is not None:
+            columns = self.waveform.envelope(self.maximum() - self.minimum(), self.width())
+            if columns:
+                painter = QPainter(self)
+                middle, half = self.height() / 2.0, self.height() / 2.0 - 1
+                played = int(self.width() * (self.value() - self.minimum()) / max(1, self.maximum() - self.minimum()))
+                for x, (lo, hi) in enumerate(columns):
+                    painter.setPen(QColor(0, 120, 215) if x <= played else QColor(110, 110, 110))
+                    painter.drawLine(QPointF(x, middle - hi * half / 127), QPointF(x, middle - lo * half / 127))
+                painter.end()
+        super().paintEvent(event)
+
+    def value_at(self, x):
+        return int(self.minimum() + ((self.maximum() - self.minimum()) * x) / max(1, self.width()))
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
-            new_value = self.minimum() + ((self.maximum() - self.minimum()) * event.position().x()) / self.width()
-            self.setValue(int(new_value))
+            self.setValue(self.value_at(event.position().x()))
             self.sliderMoved.emit(self.value())
             event.accept()
         super().mousePressEvent(event)
 
+    def mouseMoveEvent(self, event):
+        x = max(0, min(int(event.position().x()), self.width()))
+        self.hovered.emit(self.value_at(x), self.mapToGlobal(QPoint(x, 0)))
+        super().mouseMoveEvent(event)
+
+    def leaveEvent(self, event):
+        self.left.emit()
+        super().leaveEvent(event)
+
+class SeekPreviewPopup(QFrame):
+    """Cửa sổ nhỏ hiện ảnh xem trước và mốc thời gian phía trên thanh tua"""
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.WindowType.ToolTip)
+        self.setStyleSheet("background-color: #111; color: #eee; border: 1px solid #555;")
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(2, 2, 2, 2)
+        layout.setSpacing(2)
+        self.image_label = QLabel()
+        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.image_label.setStyleSheet("border: none;")
+        self.time_label = QLabel()
+        self.time_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.time_label.setStyleSheet("border: none;")
+        layout.addWidget(self.image_label)
+        layout.addWidget(self.time_label)
+
+    def show_at(self, anchor, ms, image):
+        if image is not None and not image.isNull():
+            self.image_label.setPixmap(QPixmap.fromImage(image))
+            self.image_label.show()
+        else:
+            self.image_label.hide()
+        self.time_label.setText(format_ms(ms))
+        self.adjustSize()
+        self.move(anchor.x() - self.width() // 2, anchor.y() - self.height() - 6)
+        self.show()
+
+class MipPixmapItem(QGraphicsPixmapItem):
+    """QGraphicsPixmapItem vẽ từ bản thu nhỏ (mip 1/2, 1/4, ...) gần nhất với mức thu phóng hiện tại"""
+    def __init__(self, pixmap, parent=None):
+        super().__init__(pixmap, parent)
+        self._mips = {}
+
+    def setPixmap(self, pixmap):
+        self._mips = {}
+        super().setPixmap(pixmap)
+
+    def _mip(self, level):
+        if level <= 0: return self.pixmap()
+        if level not in self._mips:
+            src = self._mip(level - 1)
+            self._mips[level] = src.scaled(max(1, src.width() // 2), max(1, src.height() // 2),
+                                           Qt.AspectRatioMode.IgnoreAspectRatio,
+                                           Qt.TransformationMode.SmoothTransformation)
+        return self._mips[level]
+
+    def _nearest_mip(self, level):
+        for lvl in range(level, 0, -1):
+            if lvl in self._mips: return self._mips[lvl]
+        return self.pixmap()
+
+    def paint(self, painter, option, widget=None):
+        view = widget.parentWidget() if widget is not None else None
+        interacting = getattr(view, 'interacting', False)
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level = int(math.floor(math.log2(1.0 / lod))) if 0 < lod < 0.5 else 0
+        # Khi đang kéo/thu phóng chỉ dùng mip đã có sẵn, không tạo mới để tránh giật khung hình
+        mip = self._nearest_mip(level) if interacting else self._mip(level)
+        smooth = self.transformationMode() == Qt.TransformationMode.SmoothTransformation and not interacting
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, smooth)
+        painter.drawPixmap(QRectF(self.offset(), QSizeF(self.pixmap().size())), mip, QRectF(mip.rect()))
+
 class CustomGraphicsView(QGraphicsView):
     """Lớp tùy chỉnh QGraphicsView để xử lý sự kiện chuột chuyên cho xem ảnh và video"""
     clicked = pyqtSignal()
+    zoomed = pyqtSignal()
+    interactionFinished = pyqtSignal()
 
     def __init__(self, scene, parent=None):
         super().__init__(scene, parent)
@@ -60,25 +2692,68 @@ class CustomGraphicsView(QGraphicsView):
 
         self._mouse_press_pos = QPoint()
 
+        # Trong lúc kéo/thu phóng: vẽ nhanh (không làm mượt), gộp các lần cuộn thành một phép biến đổi
+        # mỗi khung hình; khi người dùng dừng lại thì vẽ lại một lần ở chất lượng cao
+        self.interacting = False
+        self._dragging = False
+        self._pending_zoom = 1.0
+        self._zoom_timer = QTimer(self)
+        self._zoom_timer.setSingleShot(True)
+        self._zoom_timer.timeout.connect(self._apply_zoom)
+        self._settle_timer = QTimer(self)
+        self._settle_timer.setSingleShot(True)
+        self._settle_timer.setInterval(150)
+        self._settle_timer.timeout.connect(self.end_interaction)
+
+    def begin_interaction(self):
+        if not self.interacting:
+            self.interacting = True
+            self.setRenderHint(QPainter.RenderHint.Antialiasing, False)
+            self.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+        self._settle_timer.start()
+
+    def end_interaction(self):
+        if self._dragging or self._zoom_timer.isActive():
+            self._settle_timer.start()
+            return
+        self.interacting = False
+        self.setRenderHint(QPainter.RenderHint.Antialiasing)
+        self.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        self.viewport().update()
+        self.interactionFinished.emit()
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self._mouse_press_pos = event.position().toPoint()
+            self._dragging = True
+            self.begin_interaction()
         super().mousePressEvent(event)
 
+    def mouseMoveEvent(self, event):
+        if self._dragging: self.begin_interaction()
+        super().mouseMoveEvent(event)
+
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
+            self._dragging = False
             if (event.position().toPoint() - self._mouse_press_pos).manhattanLength() < 5:
                 self.clicked.emit()
         super().mouseReleaseEvent(event)
 
     def wheelEvent(self, event: QWheelEvent):
         zoom_in_factor = 1.25
-        zoom_out_factor = 1 / zoom_in_factor
-        if event.angleDelta().y() > 0:
-            zoom_factor = zoom_in_factor
-        else:
-            zoom_factor = zoom_out_factor
+        # Bánh xe thường: 120 đơn vị mỗi nấc; touchpad gửi nhiều giá trị nhỏ
+        self._pending_zoom *= zoom_in_factor ** (event.angleDelta().y() / 120.0)
+        self.begin_interaction()
+        if not self._zoom_timer.isActive():
+            rate = self.screen().refreshRate() if self.screen() else 60.0
+            self._zoom_timer.start(max(1, int(1000 / (rate or 60.0))))
+
+    def _apply_zoom(self):
+        zoom_factor, self._pending_zoom = self._pending_zoom, 1.0
+        if zoom_factor == 1.0: return
         self.scale(zoom_factor, zoom_factor)
+        self.zoomed.emit()
 
 class ClickableLabel(QLabel):
     """Nhãn có thể click để thực hiện hành động"""
@@ -89,6 +2764,57 @@ class ClickableLabel(QLabel):
             self.clicked.emit()
         super().mousePressEvent(event)
 
+# --- PHÁT LIÊN TỤC (GAPLESS) ---
+GAPLESS_ARM_MS = 8000  # Chuẩn bị file kế tiếp khi file hiện tại còn lại ít hơn khoảng này (cộng thời gian chuyển mờ)
+CROSSFADE_STEP_MS = 30
+
+class MediaSlot:
+    """Một bộ phát riêng (QMediaPlayer + đầu ra âm thanh + video item). Hai bộ luân phiên nhau:
+    một bộ đang phát, bộ còn lại mở sẵn file kế tiếp"""
+    def __init__(self, scene, parent):
+        self.player = QMediaPlayer(parent)
+        self.audio = QAudioOutput(parent)
+        self.item = QGraphicsVideoItem()
+        scene.addItem(self.item)
+        self.player.setAudioOutput(self.audio)
+        self.player.setVideoOutput(self.item)
+        self.path = None
+
+    def unload(self):
+        self.player.stop()
+        self.player.setSource(QUrl())
+        self.path = None
+
+class TraceOverlay(QLabel):
+    """Lớp phủ thống kê p50/p95 theo từng giai đoạn đã đo (bật/tắt bằng F3)"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 180); color: #9f9; font-family: monospace; font-size: 11px; padding: 6px;")
+        self.timer = QTimer(self)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def toggle(self):
+        if self.isVisible():
+            self.timer.stop()
+            self.hide()
+            return
+        tracer.collect = True
+        self.refresh()
+        self.show()
+        self.raise_()
+        self.timer.start()
+
+    def refresh(self):
+        lines = [f"{'giai đoạn':<20}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}"]
+        lines += [f"{name:<20}{count:>5}{p50:>10.1f}{p95:>10.1f}" for name, count, p50, p95 in tracer.summary()]
+        if tracer.exceptions: lines.append(f"lỗi bị bỏ qua: {tracer.exceptions}")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        self.move(8, 8)
+
 class UniversalViewer(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -105,7 +2831,25 @@ class UniversalViewer(QMainWindow):
         self.set_dark_theme()
         self.duration = 0
         self.current_file_path = ""
-        self.playlist = []
+        self.folder_index = FolderIndex(self)
+        self.folder_index.changed.connect(self.update_nav_buttons)
+        self.playlist = self.folder_index.files
+        self.metadata = MetadataIndex(self)
+        self.metadata.updated.connect(self.metadata_updated)
+        self.metadata_version = None
+        self.folder_index.changed.connect(lambda: self.index_metadata(force=False))
+        self.image_cache = ImageCache(IMAGE_CACHE_BUDGET)
+        self.image_loader = ImageLoader(self.image_cache, self)
+        self.image_loader.previewed.connect(self.image_previewed)
+        self.image_loader.decoded.connect(self.image_decoded)
+        self.image_loader.svg_loaded.connect(self.svg_loaded)
+        self.image_size = QSize()
+        self.loading_key = None
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(150)  # Chờ người dùng ngừng lướt (giữ PageDown) rồi mới giải mã trước
+        self.prefetch_timer.timeout.connect(self.prefetch_neighbors)
+        self.tile_loader = TileLoader(self)
 
         # --- GIAO DIỆN CHÍNH ---
         self.central_widget = QWidget()
@@ -118,9 +2862,10 @@ class UniversalViewer(QMainWindow):
         self.image_scene = QGraphicsScene()
         self.image_view = CustomGraphicsView(self.image_scene)
         self.image_item = None
-        self.movie = None
 
         self.image_view.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.image_view.zoomed.connect(self.upgrade_image_resolution)
+        self.full_res_key = None
         self.stack.addWidget(self.image_view)
 
         # Mode 2: Xem Video/Nhạc
@@ -133,8 +2878,7 @@ class UniversalViewer(QMainWindow):
         self.video_view.setStyleSheet("background-color: black;")
         self.video_view.clicked.connect(self.play_video)
 
-        self.video_item = QGraphicsVideoItem()
-        self.video_scene.addItem(self.video_item)
+        self.video_item = None  # Tạo cùng trình phát khi mở file media đầu tiên
 
         self.music_label = QLabel("AUDIO MODE 🎵")
         self.music_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -159,8 +2903,26 @@ class UniversalViewer(QMainWindow):
         self.placeholder.clicked.connect(self.open_file)
         self.stack.addWidget(self.placeholder)
 
+        # Mode 4: Lưới ảnh thu nhỏ của cả thư mục
+        self.thumb_loader = ThumbnailLoader(self)
+        self.thumb_model = ThumbnailModel(self.folder_index, self.thumb_loader, self.style(), self)
+        self.thumb_grid = self.create_thumb_view(QListView.ViewMode.IconMode, 160)
+        self.thumb_grid.setGridSize(QSize(184, 200))
+        self.thumb_grid.setWordWrap(True)
+        self.stack.addWidget(self.thumb_grid)
+        self.page_before_grid = 2
+
         self.stack.setCurrentIndex(2)
         self.main_layout.addWidget(self.stack)
+        self.trace_overlay = TraceOverlay(self.central_widget)
+
+        # Dải ảnh thu nhỏ (filmstrip) phía dưới vùng xem
+        self.filmstrip = self.create_thumb_view(QListView.ViewMode.ListMode, 96)
+        self.filmstrip.setFlow(QListView.Flow.LeftToRight)
+        self.filmstrip.setWrapping(False)
+        self.filmstrip.setFixedHeight(130)
+        self.filmstrip.hide()
+        self.main_layout.addWidget(self.filmstrip)
 
         # --- THANH ĐIỀU KHIỂN ---
         self.controls_layout = QVBoxLayout()
@@ -174,6 +2936,12 @@ class UniversalViewer(QMainWindow):
 
         self.slider_seek = ClickableSlider(Qt.Orientation.Horizontal)
         self.slider_seek.sliderMoved.connect(self.set_position)
+        self.slider_seek.hovered.connect(self.show_seek_preview)
+        self.slider_seek.left.connect(self.hide_seek_preview)
+        self.seek_preview = SeekPreviewPopup(self)
+        self.seek_preview_ms = -1
+        self.seek_previews = SeekPreviewCache(self)
+        self.seek_previews.ready.connect(self.seek_preview_ready)
         self.media_v_layout.addWidget(self.slider_seek)
 
         self.media_h_layout = QHBoxLayout()
@@ -204,6 +2972,17 @@ class UniversalViewer(QMainWindow):
         self.btn_screenshot.setFixedWidth(35)
         self.btn_screenshot.clicked.connect(self.take_screenshot)
 
+        self.btn_burst = QPushButton("Burst")
+        self.btn_burst.setCheckable(True)
+        self.btn_burst.setToolTip("Chụp liên tục mỗi N khung hình hoặc mỗi N giây")
+        self.btn_burst.clicked.connect(self.toggle_burst)
+
+        self.btn_contact_sheet = QPushButton()
+        self.btn_contact_sheet.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogContentsView))
+        self.btn_contact_sheet.setToolTip("Xuất ảnh tổng hợp các khung hình của video")
+        self.btn_contact_sheet.setFixedWidth(35)
+        self.btn_contact_sheet.clicked.connect(self.export_contact_sheet)
+
         self.btn_mute = QPushButton()
         self.btn_mute.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaVolume))
         self.btn_mute.clicked.connect(self.toggle_mute)
@@ -221,20 +3000,68 @@ class UniversalViewer(QMainWindow):
         self.combo_speed.setFixedWidth(60)
         self.combo_speed.currentIndexChanged.connect(self.set_speed)
 
+        self.btn_continuous = QPushButton()
+        self.btn_continuous.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_BrowserReload))
+        self.btn_continuous.setToolTip("Phát liên tục các file audio/video trong thư mục, không ngắt quãng")
+        self.btn_continuous.setCheckable(True)
+        self.btn_continuous.setFixedWidth(35)
+        self.btn_continuous.toggled.connect(lambda checked: checked or self.cancel_next_media())
+
+        self.combo_crossfade = QComboBox()
+        self.combo_crossfade.addItems(["0s", "1s", "2s", "3s"])
+        self.combo_crossfade.setToolTip("Thời gian chuyển mờ giữa hai file khi phát liên tục")
+        self.combo_crossfade.setFixedWidth(50)
+
+        self.btn_frame_prev = QPushButton("-1f")
+        self.btn_frame_prev.setToolTip("Lùi một khung hình ([)")
+        self.btn_frame_prev.setFixedWidth(40)
+        self.btn_frame_prev.clicked.connect(lambda: self.step_frame(-1))
+        self.btn_frame_next = QPushButton("+1f")
+        self.btn_frame_next.setToolTip("Tới một khung hình (])")
+        self.btn_frame_next.setFixedWidth(40)
+        self.btn_frame_next.clicked.connect(lambda: self.step_frame(1))
+
+        self.label_frame = QLabel()
+        self.label_frame.setToolTip("Số khung hình và mốc thời gian của khung đang hiển thị")
+        self.label_frame.setStyleSheet("color: #aaa; font-family: monospace;")
+
         self.media_h_layout.addWidget(self.btn_seek_m1m)
         self.media_h_layout.addWidget(self.btn_seek_m30s)
         self.media_h_layout.addWidget(self.btn_seek_m10s)
+        self.media_h_layout.addWidget(self.btn_frame_prev)
         self.media_h_layout.addSpacing(5)
         self.media_h_layout.addWidget(self.btn_play)
         self.media_h_layout.addSpacing(5)
+        self.media_h_layout.addWidget(self.btn_frame_next)
         self.media_h_layout.addWidget(self.btn_seek_p10s)
         self.media_h_layout.addWidget(self.btn_seek_p30s)
         self.media_h_layout.addWidget(self.btn_seek_p1m)
         self.media_h_layout.addStretch()
+        self.media_h_layout.addWidget(self.label_frame)
         self.media_h_layout.addWidget(self.btn_screenshot)
+        self.media_h_layout.addWidget(self.btn_burst)
+        self.media_h_layout.addWidget(self.btn_contact_sheet)
         self.media_h_layout.addWidget(self.btn_mute)
         self.media_h_layout.addWidget(self.slider_vol)
         self.media_h_layout.addWidget(self.combo_speed)
+        self.media_h_layout.addWidget(self.btn_continuous)
+        self.media_h_layout.addWidget(self.combo_crossfade)
+
+        self.combo_fps = QComboBox()
+        self.combo_fps.addItems([f"{fps} fps" for fps in SEQUENCE_FPS])
+        self.combo_fps.setCurrentIndex(1)
+        self.combo_fps.setFixedWidth(70)
+        self.combo_fps.currentIndexChanged.connect(self.set_speed)
+        self.combo_fps.hide()
+        self.media_h_layout.addWidget(self.combo_fps)
+        self.btn_sequence_stop = QPushButton("Thoát Chuỗi Ảnh")
+        self.btn_sequence_stop.setToolTip("Dừng phát và quay lại xem ảnh đang hiển thị (Esc)")
+        self.btn_sequence_stop.clicked.connect(self.exit_sequence)
+        self.btn_sequence_stop.hide()
+        self.media_h_layout.addWidget(self.btn_sequence_stop)
+        # Các nút chỉ dùng cho audio/video, ẩn khi phát chuỗi ảnh
+        self.sequence_hidden = [self.label_frame, self.btn_screenshot, self.btn_burst, self.btn_contact_sheet, self.btn_mute,
+                                self.slider_vol, self.btn_continuous, self.combo_crossfade]
 
         # IMAGE CONTROLS
         self.image_controls = QWidget()
@@ -257,6 +3084,9 @@ class UniversalViewer(QMainWindow):
         self.btn_print = QPushButton("In Ảnh (Ctrl+P)")
         self.btn_print.clicked.connect(self.open_print_dialog)
         self.btn_print.setStyleSheet("background-color: #28a745; color: white; padding: 5px 15px;")
+        self.btn_print_batch = QPushButton("In Nhiều Ảnh")
+        self.btn_print_batch.setToolTip("Chọn nhiều ảnh trong thư mục để in (Ctrl+Shift+P)")
+        self.btn_print_batch.clicked.connect(self.open_batch_print_dialog)
 
         self.img_layout.addWidget(self.btn_zoom_in)
         self.img_layout.addWidget(self.btn_zoom_out)
@@ -265,6 +3095,13 @@ class UniversalViewer(QMainWindow):
         self.img_layout.addWidget(self.btn_flip_h)
         self.img_layout.addWidget(self.btn_flip_v)
         self.img_layout.addWidget(self.btn_print)
+        self.img_layout.addWidget(self.btn_print_batch)
+
+        self.btn_sequence = QPushButton("Phát Chuỗi Ảnh")
+        self.btn_sequence.setToolTip("Phát các ảnh đánh số liên tiếp trong thư mục như một video")
+        self.btn_sequence.clicked.connect(self.start_sequence)
+        self.btn_sequence.hide()
+        self.img_layout.addWidget(self.btn_sequence)
 
         self.controls_layout.addWidget(self.media_controls)
         self.controls_layout.addWidget(self.image_controls)
@@ -290,40 +3127,387 @@ class UniversalViewer(QMainWindow):
         self.btn_next.setEnabled(False)
         self.btn_next.hide()
 
+        self.btn_filmstrip = QPushButton()
+        self.btn_filmstrip.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogListView))
+        self.btn_filmstrip.setToolTip("Dải ảnh thu nhỏ (T)")
+        self.btn_filmstrip.setFixedWidth(40)
+        self.btn_filmstrip.clicked.connect(self.toggle_filmstrip)
+
+        self.btn_grid = QPushButton()
+        self.btn_grid.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogContentsView))
+        self.btn_grid.setToolTip("Lưới ảnh thu nhỏ (G)")
+        self.btn_grid.setFixedWidth(40)
+        self.btn_grid.clicked.connect(self.toggle_grid)
+
+        self.combo_sort = QComboBox()
+        self.combo_sort.addItems(SORT_MODES)
+        self.combo_sort.setToolTip("Sắp xếp playlist")
+        self.combo_sort.currentIndexChanged.connect(self.apply_playlist_order)
+
+        self.combo_filter = QComboBox()
+        self.combo_filter.addItems(FILTER_MODES)
+        self.combo_filter.setToolTip("Lọc playlist")
+        self.combo_filter.currentIndexChanged.connect(self.apply_playlist_order)
+
         self.bottom_bar.addWidget(self.btn_open, 1)
+        self.bottom_bar.addWidget(self.combo_sort)
+        self.bottom_bar.addWidget(self.combo_filter)
+        self.bottom_bar.addWidget(self.btn_filmstrip)
+        self.bottom_bar.addWidget(self.btn_grid)
         self.bottom_bar.addWidget(self.btn_prev)
         self.bottom_bar.addWidget(self.btn_next)
 
         self.media_controls.hide()
         self.image_controls.hide()
 
-        # Media Player (PyQt6 Setup)
-        self.media_player = QMediaPlayer()
-        self.audio_output = QAudioOutput()
-        self.audio_output.setVolume(0.7) # Mặc định 70%
-        self.media_player.setAudioOutput(self.audio_output)
-        self.media_player.setVideoOutput(self.video_item)
+        # Media Player: chỉ khởi tạo khi mở file media đầu tiên (xem ensure_media)
+        self.media_player = None
+        self.audio_output = None
+        self.media_slots = []
+        self.active_slot = None
+        self.gapless_armed = False  # Đã mở sẵn file kế tiếp cho lần phát hiện tại
+        self.fade_from = None
+        self.fade_started = 0.0
+        self.fade_timer = QTimer(self)
+        self.fade_timer.setInterval(CROSSFADE_STEP_MS)
+        self.fade_timer.timeout.connect(self.fade_step)
+        self.first_paint = []  # Các span (tên, mốc bắt đầu, file) kết thúc ở lần vẽ nội dung đầu tiên
+        self.media_pending = {}  # Các span media (đệm, khung hình đầu) đang chờ, theo tên -> mốc bắt đầu
+        self.frame_stepper = FrameStepper(self)
+        self.frame_stepper.shown.connect(self.frame_shown)
+        self.waveform = WaveformPeaks(self)
+        self.waveform.updated.connect(self.slider_seek.update)
+        self.sequence = SequencePlayer(self)
+        self.sequence.frameShown.connect(self.sequence_frame)
+        self.sequence.stateChanged.connect(self.sequence_state_changed)
+        self.sequence_frames = []   # Chuỗi ảnh đánh số đang phát
+        self.sequence_cache = {}    # sequence_key -> danh sách khung, tính khi bấm phát; xóa khi thư mục thay đổi
+        self.folder_index.changed.connect(self.sequence_cache.clear)
+        self.sequence_active = False
+        self.sequence_status = QTimer(self)
+        self.sequence_status.setInterval(1000)
+        self.sequence_status.timeout.connect(self.show_sequence_stats)
+        self.frame_writer = FrameWriter(self)
+        self.frame_writer.written.connect(self.frame_written)
+        self.burst = None
+        self.sheet_grabber = None
+        self.sheet_job = None
+        self.sheet_frames = []
+
+    def ensure_media(self):
+        """Nạp QtMultimedia và tạo trình phát, trả về False nếu hệ thống thiếu thư viện"""
+        if self.media_player is not None: return True
+        try:
+            load_multimedia()
+        except ImportError as e:
+            self.display_error(f"Không nạp được QtMultimedia: {e}")
+            return False
+        self.media_slots = [MediaSlot(self.video_scene, self)]
+        self.activate_slot(self.media_slots[0])
+        self.audio_output.setVolume(self.slider_vol.value() / 100.0)
+        self.set_speed()
+        return True
+
+    def slot_signals(self, slot):
+        return [(slot.player.playbackStateChanged, self.media_state_changed),
+                (slot.player.positionChanged, self.position_changed),
+                (slot.player.durationChanged, self.duration_changed),
+                (slot.player.errorOccurred, self.handle_errors),
+                (slot.player.mediaStatusChanged, self.media_status_changed),
+                (slot.item.videoSink().videoFrameChanged, self.video_frame_changed)]
+
+    def activate_slot(self, slot):
+        """Chuyển toàn bộ giao diện media sang bộ phát slot (bộ cũ thôi nhận tín hiệu)"""
+        if self.media_player is not None:
+            for signal, handler in self.slot_signals(self.active_slot): signal.disconnect(handler)
+        self.active_slot = slot
+        self.media_player, self.audio_output, self.video_item = slot.player, slot.audio, slot.item
+        for signal, handler in self.slot_signals(slot): signal.connect(handler)
+        for other in self.media_slots: other.item.setVisible(other is slot)
+        slot.item.setOpacity(1.0)
+        self.frame_stepper.attach(slot.player, slot.audio, slot.item.videoSink())
+
+    def standby_slot(self):
+        if len(self.media_slots) < 2: self.media_slots.append(MediaSlot(self.video_scene, self))
+        return self.media_slots[1] if self.media_slots[0] is self.active_slot else self.media_slots[0]
+
+    def next_media_path(self):
+        idx = self.folder_index.index_of(self.current_file_path)
+        if idx is None: return None
+        for i in range(idx + 1, len(self.playlist)):
+            if file_kind(self.playlist[i]) in ('video', 'audio'): return self.playlist[i]
+        return None
+
+    def arm_next_media(self):
+        """Mở sẵn và đệm file media kế tiếp trên bộ phát dự phòng"""
+        self.gapless_armed = True
+        path = self.next_media_path()
+        if path is None: return
+        slot = self.standby_slot()
+        slot.path = path
+        slot.audio.setVolume(0.0)  # Âm lượng thật được đặt khi chuyển (hoặc tăng dần khi chuyển mờ)
+        slot.audio.setMuted(self.audio_output.isMuted())  # Bộ phát dự phòng có thể được tạo sau khi đã tắt tiếng
+        slot.item.setSize(QSizeF(1280.0, 720.0))
+        slot.player.setSource(QUrl.fromLocalFile(path))
+        slot.player.setPlaybackRate(self.media_player.playbackRate())
+        slot.player.pause()  # Nạp sẵn khung hình đầu
+
+    def crossfade_ms(self):
+        return int(float(self.combo_crossfade.currentText().rstrip("s")) * 1000)
+
+    def start_next_media(self):
+        """Bắt đầu phát file kế tiếp đã mở sẵn; có chuyển mờ thì hai file phát chồng nhau trong thời gian chuyển"""
+        slot = self.standby_slot()
+        if slot.path is None or self.fade_timer.isActive(): return False
+        self.fade_from = self.active_slot
+        self.fade_started = time.perf_counter()
+        slot.player.play()
+        self.fade_from.item.setZValue(0)
+        slot.item.setZValue(1)
+        if self.crossfade_ms() > 0:
+            slot.item.setOpacity(0.0)
+            slot.item.show()
+            self.fade_timer.start()
+        else:
+            self.finish_switch()
+        return True
+
+    def fade_step(self):
+        t = min(1.0, (time.perf_counter() - self.fade_started) * 1000 / max(1, self.crossfade_ms()))
+        volume = self.slider_vol.value() / 100.0
+        slot = self.standby_slot()
+        self.fade_from.audio.setVolume(volume * (1.0 - t))
+        slot.audio.setVolume(volume * t)
+        slot.item.setOpacity(t)
+        if t >= 1.0: self.finish_switch()
+
+    def finish_switch(self):
+        self.fade_timer.stop()
+        old, slot = self.fade_from, self.standby_slot()
+        self.stop_burst()
+        self.hide_seek_preview()
+        self.seek_previews.close()
+        self.activate_slot(slot)
+        self.audio_output.setVolume(self.slider_vol.value() / 100.0)
+        old.unload()
+        self.gapless_armed = False
+        self.update_playlist(slot.path)
+        self.apply_media_layout(slot.path)
+        self.media_state_changed(self.media_player.playbackState())
+        self.duration_changed(self.media_player.duration())
+        self.sync_thumb_selection()
+        QTimer.singleShot(100, self.center_content)
+
+    def cancel_next_media(self):
+        self.fade_timer.stop()
+        self.gapless_armed = False
+        if self.media_player is None: return
+        # Hủy giữa lúc chuyển mờ: trả lại âm lượng đang bị giảm dần của file đang phát
+        self.audio_output.setVolume(self.slider_vol.value() / 100.0)
+        for slot in self.media_slots:
+            if slot is not self.active_slot and slot.path is not None: slot.unload()
+            slot.item.setOpacity(1.0)
+
+    def start_instance_server(self):
+        """Nhận đường dẫn từ các lần mở file sau (chế độ một cửa sổ)"""
+        from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+        self.instance_server = QLocalServer(self)
+        self.instance_server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        name = instance_server_name()
+        # Có tùy chọn quyền truy cập thì listen() ghi đè file socket đang có: không được chiếm socket của cửa sổ khác
+        error = probe_instance_server(name)
+        if error is None: return
+        if not self.instance_server.listen(name) and error in (QLocalSocket.LocalSocketError.ServerNotFoundError,
+                                                               QLocalSocket.LocalSocketError.ConnectionRefusedError):
+            # Socket cũ còn sót lại sau khi tiến trình trước bị dừng đột ngột
+            QLocalServer.removeServer(name)
+            self.instance_server.listen(name)
+        self.instance_server.newConnection.connect(self.instance_connected)
 
-        self.media_player.playbackStateChanged.connect(self.media_state_changed)
-        self.media_player.positionChanged.connect(self.position_changed)
-        self.media_player.durationChanged.connect(self.duration_changed)
-        self.media_player.errorOccurred.connect(self.handle_errors)
+    def instance_connected(self):
+        while self.instance_server.hasPendingConnections():
+            socket = self.instance_server.nextPendingConnection()
+            socket.readyRead.connect(lambda socket=socket: self.instance_message(socket))
+            socket.disconnected.connect(socket.deleteLater)
 
-        if len(sys.argv) > 1:
-            file_to_open = sys.argv[1]
-            QTimer.singleShot(200, lambda: self.load_content(file_to_open))
+    def instance_message(self, socket):
+        while socket.canReadLine():
+            path = bytes(socket.readLine()).decode("utf-8", "replace").strip()
+            if self.isMinimized(): self.showNormal()
+            self.raise_()
+            self.activateWindow()
+            if path: self.load_content(path)
+
+    def open_at_startup(self, path):
+        """Mở file từ dòng lệnh trước khi cửa sổ hiện để việc giải mã chạy song song với khởi tạo giao diện"""
+        self.load_content(path)
+        self.watch_first_paint("time-to-first-pixel", STARTUP_STARTED, path)
+
+    def watch_first_paint(self, name, started, path):
+        self.first_paint.append((name, started, path))
+        self.image_view.viewport().installEventFilter(self)
+
+    def report_first_paint(self):
+        if not self.first_paint: return
+        pending, self.first_paint = self.first_paint, []
+        self.image_view.viewport().removeEventFilter(self)
+
+        def record():
+            for name, started, path in pending: tracer.record(name, started, path)
+        # Đợi lượt vẽ hiện tại hoàn tất rồi mới ghi nhận
+        QTimer.singleShot(0, record)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and self.image_item is not None and self.stack.currentIndex() == 0:
+            self.report_first_paint()
+        return super().eventFilter(obj, event)
+
+    def create_thumb_view(self, mode, icon_size):
+        view = QListView()
+        view.setModel(self.thumb_model)
+        view.setViewMode(mode)
+        view.setIconSize(QSize(icon_size, icon_size))
+        # Kích thước ô đồng nhất: QListView chỉ bố trí và vẽ các ô đang nhìn thấy
+        view.setUniformItemSizes(True)
+        view.setLayoutMode(QListView.LayoutMode.Batched)
+        view.setResizeMode(QListView.ResizeMode.Adjust)
+        view.setMovement(QListView.Movement.Static)
+        view.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        view.setHorizontalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        view.setStyleSheet("background-color: #1e1e1e; color: #ccc;")
+        view.clicked.connect(lambda index: self.load_content(index.data(Qt.ItemDataRole.UserRole)))
+        return view
+
+    def toggle_filmstrip(self):
+        self.filmstrip.setVisible(not self.filmstrip.isVisible())
+        self.sync_thumb_selection()
+
+    def toggle_grid(self):
+        if self.stack.currentIndex() == 3:
+            self.stack.setCurrentIndex(self.page_before_grid)
+            return
+        if not self.playlist: return
+        self.page_before_grid = self.stack.currentIndex()
+        self.stack.setCurrentIndex(3)
+        self.sync_thumb_selection()
+
+    def sync_thumb_selection(self):
+        row = self.folder_index.index_of(self.current_file_path)
+        if row is None: return
+        index = self.thumb_model.index(row)
+        for view in (self.filmstrip, self.thumb_grid):
+            if view.isVisible():
+                view.setCurrentIndex(index)
+                view.scrollTo(index, QListView.ScrollHint.PositionAtCenter)
+
+    def capture_path(self, suffix):
+        folder = os.path.dirname(self.current_file_path)
+        base_name = os.path.splitext(os.path.basename(self.current_file_path))[0]
+        return os.path.join(folder, f"{base_name}_{suffix}")
 
     def take_screenshot(self):
         if self.stack.currentIndex() != 1 or self.video_view.isHidden():
             return
+        if self.video_item is None: return
+        # Lấy khung hình gốc từ QVideoSink: đúng độ phân giải video, không phụ thuộc kích thước cửa sổ
+        frame = self.video_item.videoSink().videoFrame()
+        if not frame.isValid(): return
+        self.frame_writer.write(frame, self.capture_path(f"{int(time.time())}.jpg"))
+
+    def toggle_burst(self):
+        if self.burst is not None:
+            self.stop_burst()
+            return
+        self.btn_burst.setChecked(False)
+        if self.stack.currentIndex() != 1 or self.video_view.isHidden(): return
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Chụp liên tục")
+        layout = QFormLayout(dialog)
+        combo_mode = QComboBox()
+        combo_mode.addItems(["Mỗi N khung hình", "Mỗi N giây"])
+        spin_every = QDoubleSpinBox()
+        spin_every.setRange(1, 3600)
+        spin_every.setDecimals(0)
+        spin_every.setValue(10)
+        combo_mode.currentIndexChanged.connect(lambda index: spin_every.setDecimals(1 if index else 0))
+        layout.addRow("Chế độ:", combo_mode)
+        layout.addRow("N:", spin_every)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addRow(buttons)
+        if dialog.exec() != QDialog.DialogCode.Accepted: return
+        folder = self.capture_path("burst")
         try:
-            pixmap = self.video_view.grab()
-            if pixmap.isNull(): return
-            folder = os.path.dirname(self.current_file_path)
-            base_name = os.path.splitext(os.path.basename(self.current_file_path))[0]
-            save_path = os.path.join(folder, f"{base_name}_{int(time.time())}.jpg")
-            pixmap.save(save_path, "JPG")
-        except Exception: pass
+            os.makedirs(folder, exist_ok=True)
+        except OSError as e:
+            self.display_error(f"Không tạo được thư mục: {e}")
+            return
+        self.burst = {"by_frames": combo_mode.currentIndex() == 0, "every": spin_every.value(),
+                      "count": 0, "last_us": None, "next_us": 0, "folder": folder, "saved": 0, "dropped": 0}
+        self.btn_burst.setChecked(True)
+        self.media_player.play()
+
+    def stop_burst(self):
+        if self.burst is None: return
+        burst, self.burst = self.burst, None
+        self.btn_burst.setChecked(False)
+        message = f"Đã chụp {burst['saved']} khung hình vào {burst['folder']}"
+        if burst["dropped"]: message += f" (bỏ {burst['dropped']} khung hình do ghi không kịp)"
+        self.statusBar().showMessage(message, 5000)
+
+    def video_frame_changed(self, frame):
+        self.frame_stepper.frame_arrived(frame)
+        if frame.isValid():
+            if self.first_paint: self.report_first_paint()
+            if "first-frame" in self.media_pending:
+                tracer.record("first-frame", self.media_pending.pop("first-frame"), self.current_file_path)
+        burst = self.burst
+        if burst is None or not frame.isValid(): return
+        start_us = frame.startTime() if frame.startTime() >= 0 else self.media_player.position() * 1000
+        if start_us == burst["last_us"]: return  # Khung hình được gửi lại khi tạm dừng / vẽ lại
+        if burst["last_us"] is not None and start_us < burst["last_us"]: burst["next_us"] = start_us  # Đã tua lùi
+        burst["last_us"] = start_us
+        if burst["by_frames"]:
+            burst["count"] += 1
+            if (burst["count"] - 1) % int(burst["every"]): return
+        else:
+            if start_us < burst["next_us"]: return
+            burst["next_us"] = start_us + int(burst["every"] * 1000000)
+        path = os.path.join(burst["folder"], f"{start_us // 1000:09d}.jpg")
+        if self.frame_writer.write(frame, path): burst["saved"] += 1
+        else: burst["dropped"] += 1
+
+    def export_contact_sheet(self):
+        if self.stack.currentIndex() != 1 or self.video_view.isHidden() or self.sheet_job is not None:
+            return
+        if self.sheet_grabber is None:
+            self.sheet_grabber = VideoFrameGrabber(self)
+            self.sheet_grabber.grabbed.connect(lambda key, ms, image: self.sheet_frames.append((ms, image)))
+            self.sheet_grabber.finished.connect(self.contact_sheet_grabbed)
+        count = CONTACT_SHEET_COLUMNS * CONTACT_SHEET_ROWS
+        self.sheet_job = self.capture_path("contact_sheet.jpg")
+        self.sheet_frames = []
+        self.btn_contact_sheet.setEnabled(False)
+        self.statusBar().showMessage("Đang tạo ảnh tổng hợp...")
+        self.sheet_grabber.request(self.sheet_job, self.current_file_path,
+                                   lambda duration: [int(duration * (i + 0.5) / count) for i in range(count)])
+
+    def contact_sheet_grabbed(self, save_path):
+        frames, self.sheet_frames = self.sheet_frames, []
+        self.sheet_job = None
+        self.btn_contact_sheet.setEnabled(True)
+        if not any(not image.isNull() for ms, image in frames):
+            self.statusBar().showMessage("Không lấy được khung hình nào từ video", 5000)
+            return
+        self.frame_writer.write_image(
+            lambda: compose_contact_sheet(frames, CONTACT_SHEET_COLUMNS, CONTACT_SHEET_CELL_WIDTH), save_path)
+
+    def frame_written(self, path, ok):
+        if self.burst is not None and os.path.dirname(path) == self.burst["folder"]:
+            if ok: self.statusBar().showMessage(f"Chụp liên tục: {self.burst['saved']} khung hình")
+            return
+        self.statusBar().showMessage(f"Đã lưu {os.path.basename(path)}" if ok else f"Không lưu được {os.path.basename(path)}", 3000)
 
     def display_error(self, message):
         filename = os.path.basename(self.current_file_path) if self.current_file_path else "Không rõ"
@@ -340,8 +3524,18 @@ class UniversalViewer(QMainWindow):
         if event.key() == Qt.Key.Key_O:
             self.open_file()
             return
+        if event.key() == Qt.Key.Key_T:
+            self.toggle_filmstrip()
+            return
+        if event.key() == Qt.Key.Key_G:
+            self.toggle_grid()
+            return
+        if event.key() == Qt.Key.Key_F3:
+            self.trace_overlay.toggle()
+            return
         if event.key() == Qt.Key.Key_P and (event.modifiers() & Qt.KeyboardModifier.ControlModifier):
-            self.open_print_dialog()
+            if event.modifiers() & Qt.KeyboardModifier.ShiftModifier: self.open_batch_print_dialog()
+            else: self.open_print_dialog()
             return
         if event.key() in [Qt.Key.Key_PageDown, Qt.Key.Key_Period]:
             if self.playlist and len(self.playlist) > 1:
@@ -351,8 +3545,14 @@ class UniversalViewer(QMainWindow):
             if self.playlist and len(self.playlist) > 1:
                 self.open_prev_file()
                 return
+        if event.key() in [Qt.Key.Key_BracketLeft, Qt.Key.Key_BracketRight]:
+            self.step_frame(-1 if event.key() == Qt.Key.Key_BracketLeft else 1)
+            return
+        if event.key() == Qt.Key.Key_Escape and self.sequence_active:
+            self.exit_sequence()
+            return
         if event.key() == Qt.Key.Key_Space:
-            if self.stack.currentIndex() == 1:
+            if self.stack.currentIndex() == 1 or self.sequence_active:
                 self.play_video()
                 return
         if self.stack.currentIndex() in [0, 1]:
@@ -377,8 +3577,9 @@ class UniversalViewer(QMainWindow):
         file_dialog = QFileDialog(self)
         file_dialog.setDirectory(downloads_path)
         file_dialog.setNameFilters([
-            "Media Files (*.png *.jpg *.jpeg *.bmp *.gif *.webp *.svg *.mp4 *.avi *.mkv *.webm *.mov *.mp3 *.wav *.flac *.m4a)",
-            "Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.webp *.svg)",
+            "Media Files (*.png *.apng *.jpg *.jpeg *.bmp *.gif *.webp *.tif *.tiff *.svg *.mp4 *.avi *.mkv *.webm *.mov *.mp3 *.wav *.flac *.m4a *.zip *.cbz *.tar *.cbt)",
+            "Image Files (*.png *.apng *.jpg *.jpeg *.bmp *.gif *.webp *.tif *.tiff *.svg)",
+            "Archives (*.zip *.cbz *.tar *.cbt)",
             "Video Files (*.mp4 *.avi *.mkv *.webm *.mov)",
             "All Files (*)"
         ])
@@ -388,60 +3589,196 @@ class UniversalViewer(QMainWindow):
 
     def update_playlist(self, current_file):
         try:
-            folder = os.path.dirname(current_file)
-            self.current_file_path = os.path.normpath(current_file)
-            supported_exts = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.svg',
-                              '.mp4', '.avi', '.mkv', '.webm', '.mov', '.mp3', '.wav', '.flac', '.m4a'}
-            files = [os.path.normpath(os.path.join(folder, f)) for f in os.listdir(folder)
-                     if os.path.splitext(f)[1].lower() in supported_exts]
-            self.playlist = sorted(files)
-
-            filename = os.path.basename(self.current_file_path)
+            self.current_file_path = normalize_path(current_file)
+            self.folder_index.open(container_of(self.current_file_path))
+            if not self.folder_index.contains(self.current_file_path):
+                self.folder_index.sync()
+
+            inner = split_archive_path(self.current_file_path)
+            filename = f"{os.path.basename(inner[0])} › {inner[1]}" if inner else os.path.basename(self.current_file_path)
             self.setWindowTitle(f"{self.base_title} - {filename}")
+            self.update_nav_buttons()
+        except Exception as e: tracer.exception("update_playlist", e)
 
-            has_multiple = len(self.playlist) > 1
-            self.btn_prev.setEnabled(has_multiple)
-            self.btn_next.setEnabled(has_multiple)
-            self.btn_prev.setVisible(bool(self.current_file_path))
-            self.btn_next.setVisible(bool(self.current_file_path))
-        except: pass
+    def apply_playlist_order(self):
+        sort_mode, filter_mode = self.combo_sort.currentText(), self.combo_filter.currentText()
+        self.folder_index.set_order(self.metadata.sort_key(sort_mode), self.metadata.accept(filter_mode))
+        self.index_metadata()
+        self.sync_thumb_selection()
+
+    def index_metadata(self, force=True):
+        # Chỉ đọc thông tin file khi chế độ sắp xếp/lọc hiện tại cần đến, và khi tập file thay đổi
+        # (không phải mỗi lần playlist chỉ đổi thứ tự trong lúc đang đọc thông tin)
+        if not force and self.metadata_version == self.folder_index.version: return
+        if self.folder_index.folder and MetadataIndex.needs_metadata(self.combo_sort.currentText(), self.combo_filter.currentText()):
+            self.metadata_version = self.folder_index.version
+            self.metadata.open(self.folder_index.folder, self.folder_index.paths())
+
+    def metadata_updated(self):
+        changed = self.metadata.take_changed()
+        if not MetadataIndex.needs_metadata(self.combo_sort.currentText(), self.combo_filter.currentText()): return
+        started = time.perf_counter()
+        if changed is None: self.folder_index.resort()
+        else: self.folder_index.update(changed)
+        # Thư mục càng lớn thì càng giãn các lần sắp xếp lại trong lúc đang đọc thông tin
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metadata.update_timer.setInterval(max(METADATA_RESORT_DELAY_MS, int(elapsed_ms * METADATA_RESORT_DUTY)))
+
+    def update_nav_buttons(self):
+        has_multiple = len(self.playlist) > 1
+        self.btn_prev.setEnabled(has_multiple)
+        self.btn_next.setEnabled(has_multiple)
+        self.btn_prev.setVisible(bool(self.current_file_path))
+        self.btn_next.setVisible(bool(self.current_file_path))
 
     def open_next_file(self):
         if not self.playlist or not self.current_file_path: return
-        try:
-            current_idx = self.playlist.index(self.current_file_path)
-            next_idx = (current_idx + 1) % len(self.playlist)
-            self.load_content(self.playlist[next_idx])
-        except: self.update_playlist(self.current_file_path)
+        next_path = self.folder_index.neighbor(self.current_file_path, 1)
+        if next_path: self.load_content(next_path)
 
     def open_prev_file(self):
         if not self.playlist or not self.current_file_path: return
-        try:
-            current_idx = self.playlist.index(self.current_file_path)
-            prev_idx = (current_idx - 1) % len(self.playlist)
-            self.load_content(self.playlist[prev_idx])
-        except: self.update_playlist(self.current_file_path)
+        prev_path = self.folder_index.neighbor(self.current_file_path, -1)
+        if prev_path: self.load_content(prev_path)
 
     def load_content(self, file_path):
-        self.current_file_path = os.path.normpath(file_path)
-        if not os.path.exists(file_path):
+        started = time.perf_counter()
+        self.first_paint = []
+        self.media_pending = {}
+        empty_archive = False
+        with tracer.span("resolve", file_path):
+            if is_archive(file_path) and os.path.isfile(file_path):
+                # Mở file nén: hiển thị trang đầu, playlist là các ảnh bên trong
+                cover = archive_cover(file_path)
+                empty_archive = cover is None
+                file_path = cover or file_path
+            self.current_file_path = normalize_path(file_path)
+            exists = path_exists(file_path)
+        if not exists:
             self.display_error("File không tồn tại.")
             return
         ext = os.path.splitext(file_path)[1].lower()
-        self.media_player.stop()
-        self.media_player.setPlaybackRate(1.0)
+        self.stop_burst()
+        self.hide_seek_preview()
+        self.seek_previews.close()
+        self.cancel_next_media()
+        self.stop_sequence()
+        self.close_waveform()
+        self.frame_stepper.cancel()
+        self.label_frame.clear()
+        if self.media_player is not None:
+            self.media_player.stop()
+            self.media_player.setPlaybackRate(1.0)
         self.combo_speed.setCurrentIndex(1)
+        self.tile_loader.cancel()
+        self.full_res_key = None
+        self.loading_key = None
+        if isinstance(self.image_item, AnimatedImageItem): self.image_item.stop()
         self.image_scene.clear()
-        if self.movie: self.movie.stop(); self.movie = None
         self.image_item = None
-        self.update_playlist(file_path)
-
-        image_exts = ['.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.svg']
-        media_exts = ['.mp4', '.avi', '.mkv', '.webm', '.mov', '.mp3', '.wav', '.flac', '.m4a']
+        with tracer.span("playlist", file_path):
+            self.update_playlist(file_path)
+        if empty_archive:
+            # Không giữ lại ảnh và playlist cũ: playlist là thư mục chứa file nén
+            self.btn_sequence.hide()
+            self.media_controls.hide()
+            self.image_controls.hide()
+            self.stack.setCurrentIndex(2)
+            self.display_error("File nén không có ảnh hoặc không đọc được.")
+            self.sync_thumb_selection()
+            return
 
-        if ext in image_exts: self.show_image_mode(file_path)
-        elif ext in media_exts: self.show_media_mode(file_path)
+        kind = file_kind(file_path)
+        # Chỉ kiểm tra nhanh các số lân cận; danh sách đầy đủ được dựng khi bấm phát
+        self.btn_sequence.setVisible(kind == 'image' and has_sequence_neighbors(self.current_file_path, self.folder_index.contains))
+        if kind == 'image': self.show_image_mode(file_path)
+        elif kind is not None: self.show_media_mode(file_path)
         else: self.display_error(f"Định dạng '{ext}' không hỗ trợ.")
+        self.sync_thumb_selection()
+        self.prefetch_timer.start()
+        if tracer.enabled:
+            tracer.record("load-content", started, file_path)
+            if kind == 'image': self.watch_first_paint("first-paint", started, file_path)
+
+    def prefetch_neighbors(self):
+        # Giải mã trước ảnh kế tiếp/trước đó để chuyển file tức thì
+        idx = self.folder_index.index_of(self.current_file_path)
+        if idx is None: return
+        n = len(self.playlist)
+        ahead = ARCHIVE_PREFETCH_AHEAD if self.folder_index.archive else PREFETCH_AHEAD
+        offsets = list(range(1, ahead + 1)) + [-i for i in range(1, PREFETCH_BEHIND + 1)]
+        targets = []
+        for off in offsets:
+            path = self.playlist[(idx + off) % n]
+            if path != self.current_file_path and path not in targets and os.path.splitext(path)[1].lower() in RASTER_EXTS:
+                targets.append(path)
+        self.image_loader.prefetch(targets, self.fit_target())
+
+    def fit_target(self):
+        # Kích thước giải mã ban đầu: vừa màn hình/khung nhìn (theo điểm ảnh vật lý)
+        screen = self.screen()
+        return screen.availableSize().expandedTo(self.image_view.viewport().size()) * screen.devicePixelRatio()
+
+    def upgrade_image_resolution(self):
+        # Khi phóng to vượt độ phân giải đã giải mã, nạp ảnh gốc ở nền rồi thay thế
+        item = self.image_item
+        if self.loading_key is not None: return  # Đang hiển thị ảnh xem trước
+        if not isinstance(item, QGraphicsPixmapItem) or item.transform().m11() <= 1.0: return
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(self.image_view.transform())
+        if lod * item.transform().m11() <= 1.01: return
+        key = decode_key(self.current_file_path)
+        image = self.image_cache.get(key)
+        if image is not None:
+            self.full_res_key = None
+            self.set_raster_image(image)
+        elif key != self.full_res_key:
+            self.full_res_key = self.image_loader.request(self.current_file_path)
+
+    def image_previewed(self, key, image):
+        if key == self.loading_key and self.image_item is None:
+            self.set_raster_image(image)
+
+    def image_decoded(self, key, image):
+        if key == self.loading_key:
+            self.loading_key = None
+            if image.isNull(): self.display_error("Lỗi tải ảnh")
+            else: self.set_raster_image(image)
+        elif key == self.full_res_key and not image.isNull():
+            self.full_res_key = None
+            self.set_raster_image(image)
+
+    def svg_loaded(self, key, source):
+        if key != self.loading_key: return
+        self.loading_key = None
+        if source is None or not source.valid:
+            self.display_error("SVG lỗi")
+            return
+        self.image_item = TiledImageItem(source, self.tile_loader, SVG_MIN_LEVEL)
+        with tracer.span("scene-insert", source.path, item="svg"):
+            self.image_scene.addItem(self.image_item)
+            self.image_scene.setSceneRect(self.image_item.boundingRect())
+        self.image_view.resetTransform()
+        QTimer.singleShot(10, self.center_content)
+
+    def set_raster_image(self, image):
+        # Ảnh (xem trước / vừa khung / gốc) luôn được co giãn về tọa độ điểm ảnh gốc trong scene
+        size = self.image_size if self.image_size.isValid() else image.size()
+        scale = QTransform()
+        if image.size() != size:
+            scale = QTransform.fromScale(size.width() / image.width(), size.height() / image.height())
+        with tracer.span("scene-insert", self.current_file_path, item="pixmap", size=f"{image.width()}x{image.height()}"):
+            pixmap = QPixmap.fromImage(image)
+            if isinstance(self.image_item, QGraphicsPixmapItem):
+                self.image_item.setPixmap(pixmap)
+                self.image_item.setTransform(scale)
+                return
+            self.image_item = MipPixmapItem(pixmap)
+            self.image_item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+            self.image_item.setTransform(scale)
+            self.image_scene.addItem(self.image_item)
+            self.image_scene.setSceneRect(self.image_item.sceneBoundingRect())
+        self.image_view.resetTransform()
+        QTimer.singleShot(10, self.center_content)
 
     def show_image_mode(self, path):
         self.stack.setCurrentIndex(0)
@@ -449,44 +3786,52 @@ class UniversalViewer(QMainWindow):
         self.image_controls.show()
         ext = os.path.splitext(path)[1].lower()
         try:
-            if ext == '.gif':
-                label = QLabel()
-                self.movie = QMovie(path)
-                if not self.movie.isValid(): raise Exception("GIF lỗi")
-                label.setMovie(self.movie)
-                self.movie.jumpToFrame(0)
-                size = self.movie.currentImage().size()
-                label.setFixedSize(size)
-                self.image_item = self.image_scene.addWidget(label)
-                self.movie.start()
-                self.image_scene.setSceneRect(QRectF(0, 0, float(size.width()), float(size.height())))
+            if is_animated(path):
+                self.image_item = AnimatedImageItem(path)
+                if self.image_item.boundingRect().isEmpty(): raise Exception("Ảnh động lỗi")
+                with tracer.span("scene-insert", path, item="animated"):
+                    self.image_scene.addItem(self.image_item)
+                    self.image_scene.setSceneRect(self.image_item.boundingRect())
+                self.image_item.start()
             elif ext == '.svg':
-                self.image_item = QGraphicsSvgItem(path)
-                self.image_scene.addItem(self.image_item)
-                self.image_scene.setSceneRect(self.image_item.boundingRect())
+                # Phân tích ở luồng nền; khi hiển thị, SVG được raster hóa theo ô cho từng mức thu phóng
+                self.loading_key = self.image_loader.load_svg(path)
+                return
+            elif is_huge_image(size := image_reader(path).size()):
+                self.image_item = TiledImageItem(RasterTileSource(path, size), self.tile_loader)
+                with tracer.span("scene-insert", path, item="tiled"):
+                    self.image_scene.addItem(self.image_item)
+                    self.image_scene.setSceneRect(self.image_item.boundingRect())
             else:
-                pixmap = QPixmap(path)
-                if pixmap.isNull(): raise Exception("Lỗi tải ảnh")
-                self.image_item = QGraphicsPixmapItem(pixmap)
-                self.image_item.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
-                self.image_scene.addItem(self.image_item)
-                self.image_scene.setSceneRect(QRectF(pixmap.rect()))
+                # Giải mã vừa khung hiển thị ở luồng nền (ảnh gốc chỉ nạp khi người dùng phóng to)
+                self.image_size = size
+                key = decode_key(path, self.fit_target())
+                image = self.image_cache.get(key)
+                if image is not None: self.set_raster_image(image)
+                else: self.loading_key = self.image_loader.load(path, self.fit_target())
+                return
 
             self.image_view.resetTransform()
             QTimer.singleShot(10, self.center_content)
-        except Exception as e: self.display_error(str(e))
+        except Exception as e:
+            tracer.exception("show_image_mode", e)
+            self.display_error(str(e))
 
     def center_content(self):
         if self.stack.currentIndex() == 0 and self.image_item:
-            self.image_view.fitInView(self.image_item, Qt.AspectRatioMode.KeepAspectRatio)
-            self.image_view.centerOn(self.image_item)
+            with tracer.span("fit-in-view", self.current_file_path):
+                self.image_view.fitInView(self.image_item, Qt.AspectRatioMode.KeepAspectRatio)
+                self.image_view.centerOn(self.image_item)
+            self.upgrade_image_resolution()
         elif self.stack.currentIndex() == 1 and self.video_item:
-            self.video_view.fitInView(self.video_item, Qt.AspectRatioMode.KeepAspectRatio)
-            self.video_view.centerOn(self.video_item)
+            with tracer.span("fit-in-view", self.current_file_path):
+                self.video_view.fitInView(self.video_item, Qt.AspectRatioMode.KeepAspectRatio)
+                self.video_view.centerOn(self.video_item)
 
     def zoom_content(self, factor):
         view = self.image_view if self.stack.currentIndex() == 0 else self.video_view
         view.scale(factor, factor)
+        if view is self.image_view: self.upgrade_image_resolution()
 
     def rotate_content(self, angle):
         view = self.image_view if self.stack.currentIndex() == 0 else self.video_view
@@ -502,97 +3847,463 @@ class UniversalViewer(QMainWindow):
 
     def open_print_dialog(self):
         if self.stack.currentIndex() != 0: return
+        load_print_support()
         printer = QPrinter(QPrinter.PrinterMode.HighResolution)
         dialog = QPrintDialog(printer, self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.render_to_printer(printer)
 
     def render_to_printer(self, printer):
+        load_print_support()
         painter = QPainter()
         if not painter.begin(printer): return
-        rect = printer.pageRect(QPrinter.Unit.Point)
-        image = QImage(self.image_scene.sceneRect().size().toSize(), QImage.Format.Format_ARGB32)
-        image.fill(Qt.GlobalColor.white)
-        img_painter = QPainter(image)
-        self.image_scene.render(img_painter)
-        img_painter.end()
-        pixmap = QPixmap.fromImage(image)
-        size = pixmap.size()
-        size.scale(int(rect.width()), int(rect.height()), Qt.AspectRatioMode.KeepAspectRatio)
-        painter.drawPixmap(int(rect.x()), int(rect.y()), int(size.width()), int(size.height()), pixmap)
+        page = QRectF(QPointF(0, 0), printer.pageRect(QPrinter.Unit.DevicePixel).size())
+        ok = print_image_file(painter, page, self.current_file_path, view_orientation(self.image_view))
         painter.end()
+        if not ok: self.statusBar().showMessage(f"Không in được {os.path.basename(self.current_file_path)}", 5000)
+
+    def open_batch_print_dialog(self):
+        images = [p for p in self.playlist if os.path.splitext(p)[1].lower() in IMAGE_EXTS]
+        if not images: return
+        dialog = QDialog(self)
+        dialog.setWindowTitle("In nhiều ảnh")
+        dialog.resize(420, 520)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel("Chọn ảnh cần in (giữ Ctrl/Shift để chọn nhiều):"))
+        file_list = QListWidget()
+        file_list.setSelectionMode(QListWidget.SelectionMode.ExtendedSelection)
+        for path in images:
+            item = QListWidgetItem(os.path.basename(path))
+            item.setData(Qt.ItemDataRole.UserRole, path)
+            file_list.addItem(item)
+            item.setSelected(path == self.current_file_path)
+        layout.addWidget(file_list)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        if dialog.exec() != QDialog.DialogCode.Accepted: return
+        paths = [file_list.item(i).data(Qt.ItemDataRole.UserRole)
+                 for i in range(file_list.count()) if file_list.item(i).isSelected()]
+        if not paths: return
+        load_print_support()
+        printer = QPrinter(QPrinter.PrinterMode.HighResolution)
+        if QPrintDialog(printer, self).exec() == QDialog.DialogCode.Accepted:
+            self.print_files(printer, paths)
+
+    def print_files(self, printer, paths):
+        # In lần lượt từng file, mỗi file một trang, không cần mở file trên giao diện
+        load_print_support()
+        painter = QPainter()
+        if not painter.begin(printer): return
+        page = QRectF(QPointF(0, 0), printer.pageRect(QPrinter.Unit.DevicePixel).size())
+        progress = QProgressDialog("Đang in...", "Hủy", 0, len(paths), self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        failed = []
+        for i, path in enumerate(paths):
+            if progress.wasCanceled(): break
+            if i: printer.newPage()
+            progress.setLabelText(f"Đang in {os.path.basename(path)} ({i + 1}/{len(paths)})")
+            if not print_image_file(painter, page, path): failed.append(os.path.basename(path))
+            progress.setValue(i + 1)
+            QApplication.processEvents()
+        painter.end()
+        if failed:
+            # Trang của các file này bị trắng: báo lại thay vì im lặng
+            self.statusBar().showMessage(f"Không in được {len(failed)} file: {', '.join(failed[:5])}"
+                                         + (", ..." if len(failed) > 5 else ""), 10000)
 
     def show_media_mode(self, path):
         self.stack.setCurrentIndex(1)
+        if not self.ensure_media(): return
+        is_audio = self.apply_media_layout(path)
+        if not is_audio: self.video_item.setSize(QSizeF(1280.0, 720.0))
+
+        with tracer.span("set-source", path):
+            self.media_player.setSource(QUrl.fromLocalFile(path))
+        if tracer.enabled:
+            started = time.perf_counter()
+            self.media_pending = {"media-buffering": started} if is_audio else {"media-buffering": started, "first-frame": started}
+        self.media_player.play()
+        self.video_view.resetTransform()
+        QTimer.singleShot(100, self.center_content)
+
+    def apply_media_layout(self, path):
+        """Hiện giao diện audio hoặc video cho path; trả về True nếu là file audio"""
         self.image_controls.hide()
         self.media_controls.show()
-        ext = os.path.splitext(path)[1].lower()
-        is_audio = ext in ['.mp3', '.wav', '.flac', '.m4a']
+        is_audio = file_kind(path) == 'audio'
         if is_audio:
             self.video_view.hide(); self.music_label.show()
             self.music_label.setText(f"🎵 ĐANG PHÁT AUDIO:\n\n{os.path.basename(path)}")
-            self.btn_screenshot.hide()
+            self.btn_screenshot.hide(); self.btn_burst.hide(); self.btn_contact_sheet.hide()
+            self.btn_frame_prev.hide(); self.btn_frame_next.hide(); self.label_frame.hide()
+            self.waveform.open(path)
+            self.slider_seek.set_waveform(self.waveform)
         else:
             self.music_label.hide(); self.video_view.show()
-            self.video_item.setSize(QSizeF(1280.0, 720.0))
-            self.btn_screenshot.show()
+            self.btn_screenshot.show(); self.btn_burst.show(); self.btn_contact_sheet.show()
+            self.btn_frame_prev.show(); self.btn_frame_next.show(); self.label_frame.show()
+            self.close_waveform()
+        return is_audio
 
-        self.media_player.setSource(QUrl.fromLocalFile(path))
-        self.media_player.play()
-        self.video_view.resetTransform()
-        QTimer.singleShot(100, self.center_content)
+    def close_waveform(self):
+        self.waveform.close()
+        self.slider_seek.set_waveform(None)
+
+    def start_sequence(self):
+        """Phát chuỗi ảnh chứa file đang mở, dùng chung các nút điều khiển media"""
+        if not isinstance(self.image_item, QGraphicsPixmapItem): return
+        key = sequence_key(self.current_file_path)
+        if key is None: return
+        if key not in self.sequence_cache:
+            self.sequence_cache[key] = find_sequence(self.current_file_path, self.folder_index.paths())
+        self.sequence_frames = self.sequence_cache[key]
+        if self.current_file_path not in self.sequence_frames: return
+        self.sequence_active = True
+        self.loading_key = None
+        self.full_res_key = None
+        self.image_controls.hide()
+        self.media_controls.show()
+        for widget in self.sequence_hidden: widget.hide()
+        self.combo_fps.show()
+        self.btn_sequence_stop.show()
+        self.duration = 0  # Không có ảnh xem trước khi rê chuột trên thanh tua
+        self.slider_seek.setRange(0, len(self.sequence_frames) - 1)
+        self.sequence.open(self.sequence_frames, float(self.combo_fps.currentText().split()[0]), self.fit_target())
+        self.set_speed()
+        self.sequence.seek(self.sequence_frames.index(self.current_file_path))
+        self.sequence.play()
+        self.sequence_status.start()
+
+    def stop_sequence(self):
+        if not self.sequence_active: return
+        self.sequence.stop()
+        self.sequence_active = False
+        self.sequence_status.stop()
+        self.show_sequence_stats()
+        self.combo_fps.hide()
+        self.btn_sequence_stop.hide()
+        for widget in self.sequence_hidden: widget.show()
+        self.media_controls.hide()
+        self.image_controls.show()
+
+    def exit_sequence(self):
+        """Dừng chuỗi ảnh và mở khung đang hiển thị như một ảnh thường"""
+        if not self.sequence_active: return
+        index = self.sequence.index
+        frame = self.sequence_frames[index] if 0 <= index < len(self.sequence_frames) else self.current_file_path
+        self.stop_sequence()
+        self.load_content(frame)
+
+    def sequence_frame(self, index, image):
+        self.set_raster_image(image)
+        if not self.slider_seek.isSliderDown(): self.slider_seek.setValue(index)
+        self.setWindowTitle(f"{self.base_title} - {os.path.basename(self.sequence_frames[index])}")
+
+    def sequence_state_changed(self, playing):
+        icon = QStyle.StandardPixmap.SP_MediaPause if playing else QStyle.StandardPixmap.SP_MediaPlay
+        self.btn_play.setIcon(self.style().standardIcon(icon))
+        if not playing: self.show_sequence_stats()
+
+    def show_sequence_stats(self):
+        st = self.sequence.stats()
+        self.statusBar().showMessage(f"Khung {st['frame']}/{st['frames']} · đã hiện {st['shown']} · "
+                                     f"rơi {st['dropped']} · đệm {st['buffered']}/{st['ahead']}")
 
     def play_video(self):
+        if self.sequence_active:
+            if self.sequence.playing: self.sequence.pause()
+            else: self.sequence.play()
+            return
+        if self.media_player is None: return
+        if self.frame_stepper.busy: self.frame_stepper.cancel()
         if self.media_player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
             self.media_player.pause()
-        else: self.media_player.play()
+        else:
+            self.frame_stepper.sync_position()
+            self.media_player.play()
+
+    def step_frame(self, direction):
+        if self.sequence_active:
+            self.sequence.pause()
+            self.sequence.seek(self.sequence.index + direction)
+        elif self.stack.currentIndex() == 1 and not self.video_view.isHidden():
+            self.frame_stepper.step(direction)
+
+    def frame_shown(self, us, frame_us):
+        # Số khung tính từ mốc thời gian thật của khung (không phải từ positionChanged)
+        number = f"#{round(us / frame_us)}  " if frame_us > 0 else ""
+        self.label_frame.setText(f"{number}{format_ms(us // 1000)}.{us // 1000 % 1000:03d}")
+        if not self.slider_seek.isSliderDown(): self.slider_seek.setValue(us // 1000)
+
+    def media_status_changed(self, status):
+        if status == QMediaPlayer.MediaStatus.EndOfMedia and self.btn_continuous.isChecked():
+            if not self.gapless_armed: self.arm_next_media()
+            self.start_next_media()
+        if status == QMediaPlayer.MediaStatus.BufferedMedia and "media-buffering" in self.media_pending:
+            tracer.record("media-buffering", self.media_pending.pop("media-buffering"), self.current_file_path)
 
     def media_state_changed(self, state):
+        if self.frame_stepper.busy: return  # Trình phát chạy tạm để giải mã khi bước khung hình
         icon = QStyle.StandardPixmap.SP_MediaPause if state == QMediaPlayer.PlaybackState.PlayingState else QStyle.StandardPixmap.SP_MediaPlay
         self.btn_play.setIcon(self.style().standardIcon(icon))
 
     def position_changed(self, position):
         if not self.slider_seek.isSliderDown(): self.slider_seek.setValue(position)
+        if not self.btn_continuous.isChecked() or self.duration <= 0: return
+        remaining = self.duration - position
+        if not self.gapless_armed and remaining < GAPLESS_ARM_MS + self.crossfade_ms(): self.arm_next_media()
+        elif self.gapless_armed and 0 < self.crossfade_ms() and remaining <= self.crossfade_ms(): self.start_next_media()
 
     def duration_changed(self, duration):
         self.slider_seek.setRange(0, int(duration))
         self.duration = duration
+        if self.stack.currentIndex() == 1 and not self.video_view.isHidden():
+            self.seek_previews.open(self.current_file_path, duration)
+
+    def show_seek_preview(self, ms, anchor):
+        if self.duration <= 0: return
+        self.seek_preview_ms = ms
+        self.seek_preview_anchor = anchor
+        image = self.seek_previews.get(ms)
+        if image is None: self.seek_previews.request(ms)
+        self.seek_preview.show_at(anchor, ms, image)
+
+    def hide_seek_preview(self):
+        self.seek_preview_ms = -1
+        self.seek_preview.hide()
+
+    def seek_preview_ready(self, bucket):
+        if self.seek_preview_ms >= 0 and self.seek_previews.bucket(self.seek_preview_ms) == bucket:
+            self.show_seek_preview(self.seek_preview_ms, self.seek_preview_anchor)
 
     def set_position(self, position):
-        self.media_player.setPosition(position)
+        if self.sequence_active: self.sequence.seek(position)
+        elif self.media_player is not None:
+            self.frame_stepper.cancel()
+            self.media_player.setPosition(position)
 
     def seek_relative(self, delta_ms):
+        if self.sequence_active:
+            current = self.sequence.clock[0] if self.sequence.index < 0 else self.sequence.index
+            self.sequence.seek(current + round(delta_ms * self.sequence.fps / 1000))
+            return
+        if self.media_player is None: return
+        self.frame_stepper.cancel()
         new_pos = max(0, min(self.media_player.position() + delta_ms, self.duration))
         self.media_player.setPosition(new_pos)
 
     def set_volume(self, volume):
-        self.audio_output.setVolume(volume / 100.0)
+        if self.audio_output is not None: self.audio_output.setVolume(volume / 100.0)
 
     def toggle_mute(self):
-        self.audio_output.setMuted(not self.audio_output.isMuted())
+        if self.audio_output is None: return
+        muted = not self.audio_output.isMuted()
+        for slot in self.media_slots: slot.audio.setMuted(muted)
         icon = QStyle.StandardPixmap.SP_MediaVolumeMuted if self.audio_output.isMuted() else QStyle.StandardPixmap.SP_MediaVolume
         self.btn_mute.setIcon(self.style().standardIcon(icon))
 
     def set_speed(self):
+        if self.media_player is None and not self.sequence_active: return
         try:
             speed_text = self.combo_speed.currentText().replace("x", "")
             speed = float(speed_text)
+            if self.sequence_active:
+                self.sequence.set_rate(float(self.combo_fps.currentText().split()[0]), speed)
+                return
             self.media_player.setPlaybackRate(speed)
-        except: pass
+        except ValueError as e: tracer.exception("set_speed", e)
 
     def handle_errors(self, error, error_string):
         if error != QMediaPlayer.Error.NoError:
             self.display_error(f"Lỗi Media: {error_string}")
 
+# --- XỬ LÝ HÀNG LOẠT KHÔNG GIAO DIỆN (python main.py --batch ...) ---
+BATCH_FLAG = "--batch"
+BATCH_DIR_NAME = "wpmv_batch"
+batch_app = None  # QGuiApplication của tiến trình con
+
+def batch_print(text):
+    # Bản đóng gói --noconsole không có stdout
+    if sys.stdout is not None: print(text, flush=True)
+
+def batch_init():
+    """Khởi tạo Qt không cửa sổ trong mỗi tiến trình con (cần cho font khi vẽ chữ và cho QMediaPlayer)"""
+    global batch_app
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    if QGuiApplication.instance() is None: batch_app = QGuiApplication([sys.argv[0]])
+
+def batch_collect(inputs):
+    """Mở rộng thư mục / mẫu glob / file thành danh sách file được hỗ trợ, giữ thứ tự tự nhiên"""
+    import glob
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            with os.scandir(item) as it:
+                found = [os.path.normpath(e.path) for e in it if e.is_file() and file_kind(e.name)]
+            files.extend(sorted(found, key=natural_key))
+        else:
+            matches = glob.glob(item, recursive=True) if glob.has_magic(item) else [item]
+            files.extend(sorted((os.path.normpath(p) for p in matches if os.path.isfile(p) and file_kind(p)),
+                                key=natural_key))
+    return list(dict.fromkeys(files))
+
+def batch_output_format(path, options):
+    if options.format: return options.format.lower().lstrip('.')
+    ext = os.path.splitext(path)[1].lower().lstrip('.')
+    # Qt không ghi được GIF/SVG/APNG: chuyển sang PNG
+    return ext if ext in ('jpg', 'jpeg', 'png', 'bmp', 'webp') else 'png'
+
+def batch_plan(files, options):
+    """Tính trước đường dẫn đầu ra cho mọi file (ở tiến trình chính) để không file nào ghi đè file khác"""
+    jobs, taken = [], set()
+    for path in files:
+        kind = file_kind(path)
+        if kind == 'image' and options.image_ops:
+            name = f"{os.path.splitext(os.path.basename(path))[0]}.{batch_output_format(path, options)}"
+        elif kind == 'video' and options.contact_sheet:
+            name = f"{os.path.splitext(os.path.basename(path))[0]}_contact_sheet.jpg"
+        else:
+            continue
+        folder = options.out or os.path.join(os.path.dirname(path), BATCH_DIR_NAME)
+        stem, ext = os.path.splitext(os.path.join(folder, name))
+        out, n = stem + ext, 2
+        while os.path.normcase(out) in taken:
+            out, n = f"{stem}_{n}{ext}", n + 1
+        taken.add(os.path.normcase(out))
+        jobs.append((path, out))
+    return jobs
+
+def batch_image(path, options):
+    swap = options.rotate in (90, 270)
+    target = None
+    if options.fit:
+        target = QSize(options.fit[1], options.fit[0]) if swap else QSize(*options.fit)
+    image = decode_image(path, target)
+    if image.isNull(): raise ValueError("không giải mã được ảnh (ảnh lỗi hoặc quá lớn, hãy dùng --fit)")
+    # Cùng thứ tự với thao tác trên giao diện: xoay rồi lật
+    transform = QTransform().rotate(options.rotate)
+    if options.flip_h: transform *= QTransform.fromScale(-1, 1)
+    if options.flip_v: transform *= QTransform.fromScale(1, -1)
+    if not transform.isIdentity(): image = image.transformed(transform, Qt.TransformationMode.SmoothTransformation)
+    return image
+
+def batch_contact_sheet(path):
+    grabber = VideoFrameGrabber()
+    frames, finished = [], []
+    loop = QEventLoop()
+    grabber.grabbed.connect(lambda key, ms, image: frames.append((ms, image)))
+    grabber.finished.connect(lambda key: (finished.append(key), loop.quit()))
+    count = CONTACT_SHEET_COLUMNS * CONTACT_SHEET_ROWS
+    grabber.request(path, path, lambda duration: [int(duration * (i + 0.5) / count) for i in range(count)])
+    if not finished: loop.exec()
+    sheet = compose_contact_sheet(frames, CONTACT_SHEET_COLUMNS, CONTACT_SHEET_CELL_WIDTH)
+    if sheet.isNull(): raise ValueError("không lấy được khung hình nào từ video")
+    return sheet
+
+def batch_process(path, out, options):
+    """Xử lý một file trong tiến trình con. Trả về (đường dẫn, file đầu ra, lỗi)"""
+    try:
+        started = time.perf_counter()
+        image = batch_contact_sheet(path) if file_kind(path) == 'video' else batch_image(path, options)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        fmt = os.path.splitext(out)[1].lstrip('.').upper()
+        if fmt in ('JPG', 'JPEG') and image.hasAlphaChannel():
+            image = image.convertToFormat(QImage.Format.Format_RGB32)
+        if not image.save(out, fmt, options.quality): raise OSError("không ghi được file")
+        tracer.record("batch", started, path)
+        return path, out, None
+    except Exception as e:
+        return path, out, str(e) or type(e).__name__
+
+def run_batch(args):
+    """Chạy xử lý hàng loạt trên nhiều tiến trình. Trả về mã thoát (0 nếu mọi file đều thành công)"""
+    # Chỉ nạp khi chạy hàng loạt để không làm chậm khởi động giao diện
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    def size_arg(text):
+        w, _, h = text.lower().partition('x')
+        if not (w.isdigit() and h.isdigit() and int(w) > 0 and int(h) > 0):
+            raise argparse.ArgumentTypeError("cần dạng RỘNGxCAO, ví dụ 1920x1080")
+        return int(w), int(h)
+
+    parser = argparse.ArgumentParser(prog="main.py --batch", description="Xử lý hàng loạt ảnh/video không cần cửa sổ")
+    parser.add_argument("inputs", nargs="+", help="thư mục, file hoặc mẫu glob (ví dụ 'anh/**/*.jpg')")
+    parser.add_argument("--rotate", type=int, choices=[0, 90, 180, 270], default=0, help="xoay theo chiều kim đồng hồ")
+    parser.add_argument("--flip-h", action="store_true", help="lật ngang")
+    parser.add_argument("--flip-v", action="store_true", help="lật dọc")
+    parser.add_argument("--fit", type=size_arg, help="thu nhỏ vừa khung RỘNGxCAO (không phóng to)")
+    parser.add_argument("--format", choices=["jpg", "png", "bmp", "webp"], help="chuyển định dạng ảnh")
+    parser.add_argument("--quality", type=int, default=90, help="chất lượng JPEG/WebP (0-100)")
+    parser.add_argument("--contact-sheet", action="store_true", help="xuất ảnh tổng hợp khung hình cho video")
+    parser.add_argument("--out", help=f"thư mục đầu ra (mặc định: {BATCH_DIR_NAME}/ cạnh từng file)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="số tiến trình song song")
+    options = parser.parse_args(args)
+    options.image_ops = bool(options.rotate or options.flip_h or options.flip_v or options.fit or options.format)
+    if not (options.image_ops or options.contact_sheet):
+        parser.error("cần ít nhất một thao tác: --rotate, --flip-h, --flip-v, --fit, --format hoặc --contact-sheet")
+
+    jobs = batch_plan(batch_collect(options.inputs), options)
+    if not jobs:
+        batch_print("Không có file nào cần xử lý.")
+        return 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, options.jobs), initializer=batch_init) as pool:
+        futures = [pool.submit(batch_process, path, out, options) for path, out in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            path, out, error = future.result()
+            if error:
+                failed += 1
+                batch_print(f"[{done}/{len(jobs)}] LỖI {path}: {error}")
+            else:
+                batch_print(f"[{done}/{len(jobs)}] {path} -> {out}")
+    batch_print(f"Xong: {len(jobs) - failed} thành công, {failed} lỗi.")
+    return 1 if failed else 0
+
 if __name__ == '__main__':
+    if getattr(sys, 'frozen', False):
+        # Cần cho ProcessPoolExecutor khi chạy từ bản đóng gói PyInstaller
+        import multiprocessing
+        multiprocessing.freeze_support()
+    if BATCH_FLAG in sys.argv:
+        sys.exit(run_batch([a for a in sys.argv[1:] if a != BATCH_FLAG]))
+
     # Hỗ trợ High DPI cho màn hình độ phân giải cao
     os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
 
-    app = QApplication(sys.argv)
+    # --trace, --trace=<file> hoặc --trace <file>.json: ghi Chrome trace-event JSON khi thoát.
+    # Tham số tách rời chỉ được coi là file trace khi có đuôi .json, nếu không đó là file cần mở
+    argv, i = sys.argv[:1], 1
+    while i < len(sys.argv):
+        arg = sys.argv[i]
+        i += 1
+        if arg != "--trace" and not arg.startswith("--trace="):
+            argv.append(arg)
+            continue
+        output = arg.partition("=")[2]
+        if not output and i < len(sys.argv) and sys.argv[i].lower().endswith(".json"):
+            output = sys.argv[i]
+            i += 1
+        tracer.output = output or "wpmv_trace.json"
+    sys.argv = argv
+
+    single_instance = SINGLE_INSTANCE_FLAG in sys.argv
+    if single_instance: sys.argv.remove(SINGLE_INSTANCE_FLAG)
+    app = QApplication(sys.argv)  # QLocalSocket cần có ứng dụng Qt trước khi dùng
+
+    # Chế độ một cửa sổ: giao file cho cửa sổ đang chạy (bộ nhớ đệm, playlist đã sẵn) rồi thoát ngay
+    if single_instance and send_to_running_instance(sys.argv[1] if len(sys.argv) > 1 else None): sys.exit(0)
     app.setStyle("Fusion")
 
     window = UniversalViewer()
+    if single_instance: window.start_instance_server()
+    if len(sys.argv) > 1: window.open_at_startup(sys.argv[1])
     window.show()
-    sys.exit(app.exec())
+    code = app.exec()
+    tracer.save()
+    sys.exit(code)
 
 # pyinstaller --noconsole --onefile --icon="icon.ico" --add-data "icon.ico;." --name "WPMV_Player" main.py
+# Liên kết file với chế độ một cửa sổ: "WPMV_Player.exe" --single-instance "%1"